@@ -1,27 +1,224 @@
 # app.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_file
 from flask_cors import CORS # To handle requests from frontend domain
 import rag_pipeline # Import your module
 import logging
+import os
+import asyncio
+import time
+import threading
+import yaml
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from core.response_cache import ResponseCache, normalize_request
+from core.image_store import ThumbnailCache
+from core.metrics import (
+    CONTENT_TYPE, FIRST_TOKEN_SECONDS, REGISTRY, REQUEST_SECONDS, end_trace, span, start_trace,
+)
+from core.streaming import ImageReferenceExtractor, sse_event
+
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # older deployments: Starlette's built-in (deprecated) adapter
+    from fastapi.middleware.wsgi import WSGIMiddleware
 
 app = Flask(__name__)
 CORS(app) # Enable Cross-Origin Resource Sharing for all routes
 
 logging.basicConfig(level=logging.INFO)
 
-@app.route('/recommend', methods=['POST'])
-def recommend():
-    """API endpoint to get clothing recommendations."""
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
+# Catalog and few-shot text load from the prebuilt snapshot; the LLM loads in the background.
+# Under gunicorn --preload (api/gunicorn_conf.py) everything read-only loads here, in the master,
+# before workers are forked; threads are started per worker by start_background_tasks().
+PRELOAD = os.environ.get('FASHION_API_PRELOAD', '').lower() in ('1', 'true', 'yes')
+rag_pipeline.start(preload=PRELOAD)
 
-    data = request.get_json()
-    logging.info(f"Received request data: {data}")
+# --- Response Cache (keyed on the normalized request) ---
+def _load_config_section(section, defaults, path=os.path.join('configs', 'model_config.yaml')):
+    config = dict(defaults)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            config.update((yaml.safe_load(f) or {}).get(section) or {})
+    return config
+
+CACHE_CONFIG = _load_config_section('response_cache', {
+    "enabled": True, "max_size": 512, "ttl_seconds": 3600, "log_every": 100, "warmup_profiles": []
+})
+response_cache = ResponseCache(
+    max_size=CACHE_CONFIG["max_size"],
+    ttl_seconds=CACHE_CONFIG["ttl_seconds"],
+    log_every=CACHE_CONFIG["log_every"],
+) if CACHE_CONFIG["enabled"] else None
+
+def _cache_key(user_input):
+    return normalize_request(user_input, rag_pipeline.get_size_suggestion)
+
+def _wants_bypass(headers):
+    """X-Cache-Bypass: 1 or Cache-Control: no-cache skips the cache for this request."""
+    if headers.get('X-Cache-Bypass', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'no-cache' in headers.get('Cache-Control', '').lower()
+
+def run_pipeline(user_input):
+    """Retrieval + generation + image extraction for one validated request."""
+    logging.info("Starting retrieval...")
+    retrieved_items = rag_pipeline.retrieve_clothes(
+        gender=user_input['gender'],
+        skin_tone=user_input['skin_tone'],
+        season_input=user_input['season']
+    )
+    logging.info(f"Retrieval finished. Found {len(retrieved_items)} items.")
+
+    logging.info("Starting generation...")
+    recommendation_text = rag_pipeline.generate_recommendation(
+        user_input,
+        retrieved_items
+    )
+    logging.info("Generation finished.")
+
+    # --- Extract Image References ---
+    image_filenames = rag_pipeline.extract_image_references(recommendation_text)
+    logging.info(f"Extracted image references: {image_filenames}")
+
+    # --- Format Response ---
+    return {
+        "recommendation_text": recommendation_text,
+        "image_references": image_filenames # Send only filenames
+    }
+
+BATCH_CONFIG = _load_config_section('batch', {"max_profiles": 20000})
+METRICS_CONFIG = _load_config_section('metrics', {"server_timing": False})
+
+# --- Instrumentation: per-request stage trace, request histogram, Server-Timing header ---
+@app.before_request
+def _start_request_trace():
+    g.trace, g.trace_token = start_trace()
+
+@app.after_request
+def _record_request(response):
+    trace = getattr(g, 'trace', None)
+    if trace is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - trace.started, endpoint=endpoint, status=response.status_code)
+    # Sent when enabled in config, or per request with "X-Server-Timing: 1"
+    if METRICS_CONFIG["server_timing"] or request.headers.get('X-Server-Timing', '').lower() in ('1', 'true', 'yes'):
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+@app.teardown_request
+def _end_request_trace(exc=None):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token)
+
+def run_pipeline_many(user_inputs, bypass=False):
+    """Bulk run_pipeline: profiles with the same normalized key share one retrieval and one generation.
+
+    Returns (responses, errors, stats) aligned with user_inputs; failed entries have a response of None.
+    """
+    keys = [_cache_key(user_input) for user_input in user_inputs]
+    unique = {}
+    for user_input, key in zip(user_inputs, keys):
+        unique.setdefault(key, user_input)
+
+    responses, errors = {}, {}
+    if not bypass:
+        version = rag_pipeline.pipeline_version()
+        with span("cache_lookup"):
+            for key in unique:
+                cached = response_cache.get(key, version)
+                if cached is not None:
+                    responses[key] = cached
+    cache_hits = len(responses)
 
+    # Retrieval depends only on (gender, skin tone, season); the size suggestion only changes the prompt
+    pending = [key for key in unique if key not in responses]
+    retrieved = {}
+    for key in pending:
+        user_input = unique[key]
+        if key[:3] not in retrieved:
+            try:
+                retrieved[key[:3]] = rag_pipeline.retrieve_clothes(
+                    gender=user_input['gender'],
+                    skin_tone=user_input['skin_tone'],
+                    season_input=user_input['season']
+                )
+            except Exception as e:
+                logging.exception(f"Retrieval failed for {key[:3]}.")
+                retrieved[key[:3]] = e
+    to_generate = [key for key in pending if not isinstance(retrieved[key[:3]], Exception)]
+    for key in pending:
+        if isinstance(retrieved[key[:3]], Exception):
+            errors[key] = "Retrieval failed."
+
+    # All prompts go to the generation scheduler at once so they are micro-batched together
+    logging.info(f"Batch: {len(user_inputs)} profiles, {len(unique)} unique, "
+                 f"{cache_hits} cached, {len(to_generate)} to generate")
+    texts = rag_pipeline.generate_recommendations(
+        [unique[key] for key in to_generate], [retrieved[key[:3]] for key in to_generate]
+    ) if to_generate else []
+    for key, text in zip(to_generate, texts):
+        if isinstance(text, Exception):
+            logging.error(f"Generation failed for {key}: {text}")
+            errors[key] = "Generation failed."
+            continue
+        responses[key] = {
+            "recommendation_text": text,
+            "image_references": rag_pipeline.extract_image_references(text)
+        }
+        if not bypass:
+            response_cache.put(key, responses[key], rag_pipeline.pipeline_version())
+
+    stats = {"profiles": len(user_inputs), "unique_profiles": len(unique),
+             "cache_hits": cache_hits, "generated": len(to_generate) - sum(k in errors for k in to_generate)}
+    return [responses.get(key) for key in keys], [errors.get(key) for key in keys], stats
+
+def _warm_up_cache():
+    if response_cache is None or not CACHE_CONFIG["warmup_profiles"]:
+        return
+
+    def warm_up_when_ready():
+        rag_pipeline.wait_until_ready()
+        response_cache.warm_up(
+            CACHE_CONFIG["warmup_profiles"], _cache_key, run_pipeline, rag_pipeline.pipeline_version
+        )
+
+    threading.Thread(target=warm_up_when_ready, name="response-cache-warmup", daemon=True).start()
+
+# --- Thumbnails (served instead of full-size originals) ---
+IMAGE_CONFIG = _load_config_section('images', {
+    "thumbnail_dir": os.path.join('data', 'thumbnails'), "thumbnail_size": [200, 200],
+    "refresh_interval": 30, "precompute": True, "precompute_workers": 4
+})
+rag_pipeline.image_resolver.refresh_interval = IMAGE_CONFIG["refresh_interval"]
+thumbnail_cache = ThumbnailCache(
+    rag_pipeline.image_resolver,
+    IMAGE_CONFIG["thumbnail_dir"],
+    size=IMAGE_CONFIG["thumbnail_size"],
+)
+
+def start_background_tasks(precompute=True):
+    """Response-cache warm-up and thumbnail precompute; called once per serving process."""
+    _warm_up_cache()
+    if precompute and IMAGE_CONFIG["precompute"]:
+        threading.Thread(
+            target=thumbnail_cache.precompute,
+            kwargs={"max_workers": IMAGE_CONFIG["precompute_workers"]},
+            name="thumbnail-precompute",
+            daemon=True,
+        ).start()
+
+if not PRELOAD:
+    start_background_tasks()
+
+def parse_user_input(data):
+    """Validate a /recommend payload; returns (user_input, error_message)."""
     # --- Input Validation ---
     required_fields = ['gender', 'skin_tone', 'height_cm', 'weight_kg', 'season']
-    if not all(field in data for field in required_fields):
-        return jsonify({"error": f"Missing required fields: {required_fields}"}), 400
+    if not isinstance(data, dict) or not all(field in data for field in required_fields):
+        return None, f"Missing required fields: {required_fields}"
 
     # --- Basic Type/Value Validation (Example) ---
     try:
@@ -34,44 +231,230 @@ def recommend():
         }
         # Add more specific checks if needed (e.g., skin_tone in valid list)
     except (ValueError, TypeError) as e:
-         return jsonify({"error": f"Invalid input data type: {e}"}), 400
+        return None, f"Invalid input data type: {e}"
+    return user_input, None
+
+
+@app.route('/recommend', methods=['POST'])
+def recommend():
+    """API endpoint to get clothing recommendations."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    data = request.get_json()
+    logging.info(f"Received request data: {data}")
+
+    user_input, error = parse_user_input(data)
+    if error:
+        return jsonify({"error": error}), 400
 
     # --- Check if pipeline components loaded ---
-    if rag_pipeline.product_df is None or rag_pipeline.model is None or rag_pipeline.tokenizer is None:
-         logging.error("Pipeline components not ready.")
+    if not rag_pipeline.is_ready():
+         logging.error(f"Pipeline components not ready: {rag_pipeline.readiness()}")
          return jsonify({"error": "Recommendation service is initializing or unavailable. Please try again later."}), 503
 
     try:
+        # --- Response Cache ---
+        bypass = response_cache is None or _wants_bypass(request.headers)
+        if response_cache is not None and bypass:
+            response_cache.record_bypass()
+        if not bypass:
+            with span("cache_lookup"):
+                key = _cache_key(user_input)
+                cached = response_cache.get(key, rag_pipeline.pipeline_version())
+            if cached is not None:
+                logging.info(f"Response cache hit for {key}")
+                return jsonify(cached), 200, {"X-Cache": "HIT"}
+
         # --- Run RAG Pipeline ---
-        logging.info("Starting retrieval...")
-        retrieved_items = rag_pipeline.retrieve_clothes(
+        response = run_pipeline(user_input)
+        if not bypass:
+            response_cache.put(key, response, rag_pipeline.pipeline_version())
+        return jsonify(response), 200, {"X-Cache": "BYPASS" if bypass else "MISS"}
+
+    except Exception as e:
+        logging.exception("An error occurred during the recommendation process.") # Log full traceback
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """Bulk endpoint for offline callers: {"profiles": [...]} -> one result per profile, in input order."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    data = request.get_json()
+    profiles = data.get('profiles') if isinstance(data, dict) else data
+    if not isinstance(profiles, list) or not profiles:
+        return jsonify({"error": "Request must contain a non-empty 'profiles' list"}), 400
+    if len(profiles) > BATCH_CONFIG["max_profiles"]:
+        return jsonify({"error": f"At most {BATCH_CONFIG['max_profiles']} profiles per request"}), 413
+
+    if not rag_pipeline.is_ready():
+        logging.error(f"Pipeline components not ready: {rag_pipeline.readiness()}")
+        return jsonify({"error": "Recommendation service is initializing or unavailable. Please try again later."}), 503
+
+    # Invalid profiles are reported per item; the rest of the batch still runs
+    results = [None] * len(profiles)
+    valid = []
+    for i, profile in enumerate(profiles):
+        user_input, error = parse_user_input(profile)
+        if error:
+            results[i] = {"index": i, "error": error}
+        else:
+            valid.append((i, user_input))
+
+    bypass = response_cache is None or _wants_bypass(request.headers)
+    if response_cache is not None and bypass:
+        response_cache.record_bypass()
+    try:
+        responses, errors, stats = run_pipeline_many([user_input for _, user_input in valid], bypass)
+    except Exception:
+        logging.exception("An error occurred during the batch recommendation process.")
+        return jsonify({"error": "An internal server error occurred."}), 500
+
+    for (i, _), response, error in zip(valid, responses, errors):
+        results[i] = {"index": i, **response} if response is not None else {"index": i, "error": error}
+    stats["invalid"] = len(profiles) - len(valid)
+    return jsonify({"results": results, "stats": stats}), 200
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process is up, even if models are still loading."""
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the catalog and LLM are loaded, 503 while loading or after a failure."""
+    components = rag_pipeline.readiness()
+    status_code = 200 if rag_pipeline.is_ready() else 503
+    return jsonify({"ready": status_code == 200, "components": components}), status_code
+
+
+@app.route('/thumbnails/<filename>', methods=['GET'])
+def thumbnail(filename):
+    """Thumbnail for an image reference such as "12345.jpg" (or a bare product id)."""
+    item_id = os.path.splitext(filename)[0]
+    try:
+        path, digest = thumbnail_cache.get(item_id)
+    except Exception:
+        logging.exception(f"Could not render thumbnail for {item_id}.")
+        return jsonify({"error": "Image could not be processed."}), 500
+    if path is None:
+        return jsonify({"error": f"No image for {item_id}."}), 404
+    # The file name is a content hash, so the ETag never goes stale for a given image
+    return send_file(path, mimetype='image/jpeg', etag=digest, conditional=True, max_age=86400)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: stage latency, token counts, candidate counts, cache results."""
+    return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Generation scheduler, prefix KV cache and response cache statistics."""
+    scheduler = rag_pipeline.generation_scheduler
+    prefix_cache = rag_pipeline.prefix_cache
+    return jsonify({
+        "generation_scheduler": scheduler.stats() if scheduler is not None else None,
+        "prefix_cache": prefix_cache.stats() if prefix_cache is not None else None,
+        "response_cache": response_cache.stats() if response_cache is not None else None,
+    }), 200
+
+
+# --- ASGI entry point: uvicorn api.app:asgi_app ---
+# Streaming runs on the event loop; every other route is served by the Flask app mounted below.
+asgi_app = FastAPI()
+
+
+def _record_stream(started, status):
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint='/recommend/stream', status=status)
+
+
+async def _stream_events(user_input, bypass, started):
+    if not bypass:
+        key = _cache_key(user_input)
+        cached = response_cache.get(key, rag_pipeline.pipeline_version())
+        if cached is not None:
+            yield sse_event("token", {"text": cached["recommendation_text"]})
+            for filename in cached["image_references"]:
+                yield sse_event("image", {"filename": filename})
+            yield sse_event("done", {**cached, "cache": "HIT"})
+            _record_stream(started, 200)
+            return
+
+    try:
+        retrieved_items = await run_in_threadpool(
+            rag_pipeline.retrieve_clothes,
             gender=user_input['gender'],
             skin_tone=user_input['skin_tone'],
             season_input=user_input['season']
         )
         logging.info(f"Retrieval finished. Found {len(retrieved_items)} items.")
 
-        logging.info("Starting generation...")
-        recommendation_text = rag_pipeline.generate_recommendation(
-            user_input,
-            retrieved_items
+        extractor = ImageReferenceExtractor()
+        stream = rag_pipeline.stream_recommendation(user_input, retrieved_items, asyncio.get_running_loop())
+        first_token = True
+        try:
+            async for chunk in stream:
+                if first_token:
+                    FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                    first_token = False
+                yield sse_event("token", {"text": chunk})
+                # Send each image reference as soon as its "Image: N.jpg" mention is complete
+                for filename in extractor.feed(chunk):
+                    yield sse_event("image", {"filename": filename})
+        finally:
+            # On client disconnect the generator is cancelled or closed here: stop generating for it.
+            # A no-op once generation has finished.
+            stream.cancel()
+    except Exception:
+        logging.exception("An error occurred during the streaming recommendation process.")
+        yield sse_event("error", {"error": "An internal server error occurred."})
+        _record_stream(started, 500)
+        return
+
+    response = {
+        "recommendation_text": extractor.text.strip(),
+        "image_references": extractor.references
+    }
+    if not bypass:
+        response_cache.put(key, response, rag_pipeline.pipeline_version())
+    yield sse_event("done", {**response, "cache": "BYPASS" if bypass else "MISS"})
+    _record_stream(started, 200)
+
+
+@asgi_app.post('/recommend/stream')
+async def recommend_stream(http_request: Request):
+    """Server-sent events: `token` per decoded chunk, `image` per reference, then `done`."""
+    started = time.perf_counter()
+    try:
+        data = await http_request.json()
+    except ValueError:
+        return JSONResponse({"error": "Request must be JSON"}, status_code=400)
+    user_input, error = parse_user_input(data)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+    if not rag_pipeline.is_ready():
+        return JSONResponse(
+            {"error": "Recommendation service is initializing or unavailable. Please try again later."},
+            status_code=503,
         )
-        logging.info("Generation finished.")
 
-        # --- Extract Image References ---
-        image_filenames = rag_pipeline.extract_image_references(recommendation_text)
-        logging.info(f"Extracted image references: {image_filenames}")
+    bypass = response_cache is None or _wants_bypass(http_request.headers)
+    if response_cache is not None and bypass:
+        response_cache.record_bypass()
+    return StreamingResponse(
+        _stream_events(user_input, bypass, started),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        # --- Format Response ---
-        response = {
-            "recommendation_text": recommendation_text,
-            "image_references": image_filenames # Send only filenames
-        }
-        return jsonify(response), 200
 
-    except Exception as e:
-        logging.exception("An error occurred during the recommendation process.") # Log full traceback
-        return jsonify({"error": "An internal server error occurred."}), 500
+asgi_app.mount('/', WSGIMiddleware(app))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+# gunicorn_conf.py
+# Multi-worker serving: gunicorn -c api/gunicorn_conf.py api.app:asgi_app
+#
+# The app is imported once in the master (preload_app), which loads the catalog snapshot
+# (memory-mapped), the few-shot prefix and, on CPU, the LLM weights before forking. Workers share
+# those pages copy-on-write; each worker only starts its own threads in post_fork.
+import os
+import yaml
+
+os.environ.setdefault("FASHION_API_PRELOAD", "1")
+# Tokenizers used before fork would otherwise warn and disable parallelism in every worker
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def _load_yaml(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+_serving = _load_yaml(os.path.join("configs", "model_config.yaml")).get("serving") or {}
+_api = _load_yaml(os.path.join("configs", "paths.yaml")).get("api") or {}
+
+bind = f"{_api.get('host', '0.0.0.0')}:{_api.get('port', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", _serving.get("workers", 2)))
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# Generation can take tens of seconds per request
+timeout = int(_serving.get("timeout", 120))
+graceful_timeout = 30
+
+
+def post_fork(server, worker):
+    import rag_pipeline
+    from api import app
+
+    rag_pipeline.after_fork(workers)
+    # Thumbnails are shared on disk; precomputing them once is enough
+    app.start_background_tasks(precompute=worker.age == 1)
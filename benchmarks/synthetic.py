@@ -0,0 +1,158 @@
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# masterCategory → subCategory → articleType，取自 styles.csv 中最常见的组合
+CATEGORY_TREE = {
+    "Apparel": {
+        "Topwear": ["Tshirts", "Shirts", "Kurtas", "Tops", "Sweatshirts", "Jackets", "Sweaters"],
+        "Bottomwear": ["Jeans", "Trousers", "Shorts", "Track Pants", "Skirts", "Leggings"],
+        "Dress": ["Dresses"],
+        "Innerwear": ["Briefs", "Bra", "Trunk"],
+        "Saree": ["Sarees"],
+    },
+    "Accessories": {
+        "Watches": ["Watches"],
+        "Bags": ["Handbags", "Backpacks", "Clutches"],
+        "Belts": ["Belts"],
+        "Eyewear": ["Sunglasses"],
+        "Jewellery": ["Earrings", "Necklace and Chains", "Ring"],
+    },
+    "Footwear": {
+        "Shoes": ["Casual Shoes", "Sports Shoes", "Formal Shoes", "Heels"],
+        "Flip Flops": ["Flip Flops"],
+        "Sandal": ["Sandals"],
+    },
+    "Personal Care": {
+        "Fragrance": ["Perfume and Body Mist", "Deodorant"],
+        "Lips": ["Lipstick"],
+    },
+}
+MASTER_WEIGHTS = [0.48, 0.25, 0.21, 0.06]
+GENDERS = (["Men", "Women", "Unisex", "Boys", "Girls"], [0.50, 0.42, 0.04, 0.02, 0.02])
+SEASONS = (["Summer", "Fall", "Winter", "Spring"], [0.48, 0.26, 0.19, 0.07])
+USAGES = (["Casual", "Sports", "Ethnic", "Formal", "Smart Casual", "Party", "Travel", "Home"],
+          [0.78, 0.09, 0.07, 0.05, 0.002, 0.0007, 0.0006, 0.0007])
+COLOURS = (["Black", "White", "Blue", "Brown", "Grey", "Red", "Green", "Pink", "Navy Blue", "Purple",
+            "Silver", "Yellow", "Beige", "Gold", "Maroon", "Orange", "Olive", "Multi", "Cream", "Khaki",
+            "Charcoal", "Peach", "Off White", "Teal", "Lavender", "Mustard", "Magenta", "Rust"],
+           None)
+BRANDS = ["Nike", "Puma", "Adidas", "Roadster", "Jealous 21", "Fabindia", "Titan", "Fastrack",
+          "Wrangler", "Lee", "Catwalk", "Gini and Jony", "United Colors of Benetton", "Reebok"]
+MISSING_RATE = 0.001  # 与原始数据相近的关键字段缺失比例
+
+KB_STYLES = ["A字连衣裙", "直筒西裤", "阔腿裤", "衬衫裙", "针织开衫", "风衣", "西装外套", "牛仔夹克",
+             "百褶半身裙", "吊带裙", "运动套装", "连帽卫衣", "高腰牛仔裤", "polo衫", "Shirts", "Dresses", "Jeans"]
+KB_MATERIALS = ["棉", "亚麻", "真丝", "羊毛", "涤纶", "牛仔布", "雪纺", "针织"]
+KB_NEEDS = ["面试穿搭", "夏季通勤", "小个子显高", "约会", "海边度假", "冬季保暖", "职场正装", "周末休闲",
+            "婚礼宾客", "运动健身", "梨形身材", "商务出差"]
+KB_SCENES = ["通勤", "休闲", "正式", "度假", "运动", "派对", "约会", "居家"]
+
+
+def _pick(rng, choices, n):
+    values, weights = choices
+    p = None if weights is None else np.asarray(weights) / np.sum(weights)
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=n, p=p)]
+
+
+def make_catalog(rows, seed=0, start_id=1):
+    """生成与 styles.csv 同列同分布的商品表"""
+    rng = np.random.default_rng(seed)
+    masters = list(CATEGORY_TREE)
+    master = np.asarray(masters, dtype=object)[rng.choice(len(masters), size=rows, p=MASTER_WEIGHTS)]
+    sub = np.empty(rows, dtype=object)
+    article = np.empty(rows, dtype=object)
+    for m in masters:
+        idx = np.flatnonzero(master == m)
+        subs = list(CATEGORY_TREE[m])
+        sub[idx] = np.asarray(subs, dtype=object)[rng.integers(len(subs), size=len(idx))]
+        for s in subs:
+            sidx = idx[sub[idx] == s]
+            types = CATEGORY_TREE[m][s]
+            article[sidx] = np.asarray(types, dtype=object)[rng.integers(len(types), size=len(sidx))]
+
+    gender = _pick(rng, GENDERS, rows)
+    colour = _pick(rng, COLOURS, rows)
+    brand = np.asarray(BRANDS, dtype=object)[rng.integers(len(BRANDS), size=rows)]
+    df = pd.DataFrame({
+        "id": np.arange(start_id, start_id + rows),
+        "gender": gender,
+        "masterCategory": master,
+        "subCategory": sub,
+        "articleType": article,
+        "baseColour": colour,
+        "season": _pick(rng, SEASONS, rows),
+        "year": rng.integers(2007, 2020, size=rows).astype(float),
+        "usage": _pick(rng, USAGES, rows),
+        "productDisplayName": brand + " " + gender + " " + colour + " " + article,  # 如 "Puma Men Black Tshirts"
+    })
+    for col in ("baseColour", "season", "usage", "productDisplayName"):
+        df.loc[rng.random(rows) < MISSING_RATE, col] = np.nan
+    return df
+
+
+def write_catalog(path, rows, seed=0, chunk_size=500_000):
+    """分块写出合成 styles.csv，已存在时直接复用"""
+    path = Path(path)
+    if path.exists():
+        return path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    for n, start in enumerate(range(0, rows, chunk_size)):
+        chunk = make_catalog(min(chunk_size, rows - start), seed=seed + n, start_id=start + 1)
+        chunk.to_csv(tmp, mode="w" if n == 0 else "a", header=n == 0, index=False)
+    tmp.replace(path)
+    return path
+
+
+def make_knowledge_base(size, seed=0):
+    """生成 rag_system 读取的结构化知识库（kb_id / 用户需求 / 推荐款式 / 适用面料 / baseColour）"""
+    rng = np.random.default_rng(seed)
+    colours = [c.lower() for c in COLOURS[0]]
+    rows = []
+    for kb_id in range(size):
+        n_colours = rng.integers(1, 4)
+        rows.append({
+            "kb_id": kb_id,
+            "用户需求": f"{KB_NEEDS[rng.integers(len(KB_NEEDS))]} {KB_STYLES[rng.integers(len(KB_STYLES))]} #{kb_id}",
+            "适用场景": "；".join(rng.choice(KB_SCENES, size=3, replace=False)),
+            "推荐款式": KB_STYLES[rng.integers(len(KB_STYLES))],
+            "适用面料": KB_MATERIALS[rng.integers(len(KB_MATERIALS))],
+            "baseColour": ",".join(rng.choice(colours, size=n_colours, replace=False)),
+        })
+    return pd.DataFrame(rows)
+
+
+def write_knowledge_base(directory, size, encoder, seed=0):
+    """写出 structured_kb.csv 与 kb_index.index，返回 EnhancedFashionRAG 所需配置"""
+    import faiss
+    from core.ann_index import build_index
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    kb = make_knowledge_base(size, seed)
+    embeddings = encoder.encode((kb["用户需求"] + " " + kb["适用场景"]).tolist())
+    index, _ = build_index(embeddings, {"type": "auto"}, ids=kb["kb_id"].to_numpy())
+    kb.to_csv(directory / "structured_kb.csv", index=False)
+    faiss.write_index(index, str(directory / "kb_index.index"))
+    return {
+        "knowledge_path": str(directory / "structured_kb.csv"),
+        "index_path": str(directory / "kb_index.index"),
+        "thresholds": {"l2": 0.6, "ip": 0.7},
+    }
+
+
+def make_few_shot(n_examples=4, seed=0):
+    """合成 few-shot 示例文本，长度与 format_hf_examples_for_prompt 的输出相近"""
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for i in range(n_examples):
+        article = KB_STYLES[rng.integers(len(KB_STYLES))]
+        colours = ", ".join(rng.choice([c.lower() for c in COLOURS[0]], size=3, replace=False))
+        blocks.append(
+            f"--- Example {i + 1} ---\n"
+            f"User: I need an outfit for {KB_NEEDS[rng.integers(len(KB_NEEDS))]}, "
+            f"season {SEASONS[0][rng.integers(len(SEASONS[0]))]}.\n"
+            f"Assistant: Try a {KB_MATERIALS[rng.integers(len(KB_MATERIALS))]} {article} in {colours}. "
+            f"Pair it with neutral shoes and a simple bag; keep accessories minimal so the colours stay balanced.\n"
+        )
+    return "".join(blocks)
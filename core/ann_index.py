@@ -0,0 +1,179 @@
+import logging
+import time
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+DEFAULT_INDEX_CONFIG = {
+    "type": "auto",     # auto | flat | ivf_flat | hnsw | ivf_pq
+    "metric": "l2",     # l2 | ip（ip 时向量先做 L2 归一化，即余弦相似度）
+    "nlist": None,      # IVF 聚类数，None 时取 4*sqrt(N)
+    "nprobe": 8,
+    "hnsw_m": 32,
+    "ef_construction": 80,
+    "ef_search": 64,
+    "pq_m": 16,         # PQ 子向量个数，需整除向量维度
+    "pq_bits": 8,
+    "eval_k": 10,
+    "eval_queries": 1000,
+}
+
+
+def choose_index_type(n_vectors):
+    """按语料规模自动选择索引类型"""
+    if n_vectors < 10_000:
+        return "flat"
+    if n_vectors < 200_000:
+        return "hnsw"
+    if n_vectors < 2_000_000:
+        return "ivf_flat"
+    return "ivf_pq"
+
+
+def prepare_vectors(embeddings, metric="l2"):
+    """转为连续 float32；内积度量下做 L2 归一化"""
+    vectors = np.ascontiguousarray(np.asarray(embeddings, dtype="float32"))
+    if metric == "ip":
+        faiss.normalize_L2(vectors)
+    return vectors
+
+
+def _metric_type(metric):
+    if metric not in ("l2", "ip"):
+        raise ValueError(f"Unsupported metric: {metric}")
+    return faiss.METRIC_INNER_PRODUCT if metric == "ip" else faiss.METRIC_L2
+
+
+def build_flat_index(dim, metric="l2"):
+    return faiss.IndexFlatIP(dim) if metric == "ip" else faiss.IndexFlatL2(dim)
+
+
+def create_index(dim, n_vectors, config=None):
+    """按配置创建（未训练的）索引，返回 (index, 实际类型)"""
+    cfg = {**DEFAULT_INDEX_CONFIG, **(config or {})}
+    index_type = cfg["type"]
+    if index_type == "auto":
+        index_type = choose_index_type(n_vectors)
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type}")
+    if index_type == "ivf_pq" and n_vectors < 2 ** cfg["pq_bits"]:
+        # PQ 码本训练至少需要 2^pq_bits 个样本，否则 faiss 训练直接报错；小语料退回 ivf_flat
+        logging.warning(f"ivf_pq needs at least {2 ** cfg['pq_bits']} vectors to train, got {n_vectors}; "
+                        "using ivf_flat instead")
+        index_type = "ivf_flat"
+    metric = cfg["metric"]
+
+    if index_type == "flat":
+        return build_flat_index(dim, metric), index_type
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, cfg["hnsw_m"], _metric_type(metric))
+        index.hnsw.efConstruction = cfg["ef_construction"]
+        index.hnsw.efSearch = cfg["ef_search"]
+        return index, index_type
+
+    # IVF 每个聚类至少约 39 个训练样本，否则 faiss 会告警且聚类质量差
+    nlist = cfg["nlist"] or int(4 * np.sqrt(n_vectors))
+    nlist = max(1, min(nlist, n_vectors // 39))
+    quantizer = build_flat_index(dim, metric)
+    if index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, _metric_type(metric))
+    else:
+        if dim % cfg["pq_m"]:
+            raise ValueError(f"pq_m={cfg['pq_m']} must divide the vector dimension {dim}")
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, cfg["pq_m"], cfg["pq_bits"], _metric_type(metric))
+    index.nprobe = min(cfg["nprobe"], nlist)
+    return index, index_type
+
+
+def build_index(embeddings, config=None, ids=None):
+    """训练并填充索引，返回 (index, 实际类型)；给定 ids 时包装为 IndexIDMap2 以使用稳定 id"""
+    cfg = {**DEFAULT_INDEX_CONFIG, **(config or {})}
+    vectors = prepare_vectors(embeddings, cfg["metric"])
+    index, index_type = create_index(vectors.shape[1], len(vectors), cfg)
+    if not index.is_trained:
+        index.train(vectors)
+    if ids is None:
+        index.add(vectors)
+        return index, index_type
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return index, index_type
+
+
+def read_index(path, mmap=False):
+    """读取索引；mmap=True 时向量数据直接映射文件，多个进程共享页缓存，不支持时回退为完整读入
+
+    映射方式打开的索引只读，不能再 add / remove。
+    """
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+        try:
+            return faiss.read_index(str(path), flags)
+        except RuntimeError as e:
+            logging.warning(f"Could not memory-map {path}, reading it into memory: {e}")
+    return faiss.read_index(str(path))
+
+
+def add_vectors(index, embeddings, ids, metric="l2"):
+    """向已有 IndexIDMap2 追加向量"""
+    index.add_with_ids(prepare_vectors(embeddings, metric), np.asarray(ids, dtype="int64"))
+
+
+def remove_ids(index, ids):
+    """删除指定 id；底层索引不支持删除（如 HNSW）时返回 False"""
+    if len(ids) == 0:
+        return True
+    try:
+        index.remove_ids(np.asarray(ids, dtype="int64"))
+    except RuntimeError:
+        return False
+    return True
+
+
+def _timed_search(index, queries, k):
+    # 逐条检索以得到单查询延迟分布
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, ids = index.search(q[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(ids[0])
+    return np.array(results), np.array(latencies)
+
+
+def _latency_summary(latencies):
+    return {
+        "mean_ms": float(latencies.mean()),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+    }
+
+
+def evaluate_index(index, embeddings, config=None, index_type=None, ids=None):
+    """以精确 flat 索引为基准，统计 recall@k 与单查询延迟；ids 为向量对应的稳定 id"""
+    cfg = {**DEFAULT_INDEX_CONFIG, **(config or {})}
+    vectors = prepare_vectors(embeddings, cfg["metric"])
+    k = min(cfg["eval_k"], len(vectors))
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(vectors), size=min(cfg["eval_queries"], len(vectors)), replace=False)
+    queries = vectors[np.sort(sample)]
+
+    exact = build_flat_index(vectors.shape[1], cfg["metric"])
+    exact.add(vectors)
+    truth, exact_latency = _timed_search(exact, queries, k)
+    if ids is not None:
+        truth = np.asarray(ids, dtype="int64")[truth]
+    found, latency = _timed_search(index, queries, k)
+
+    hits = sum(len(np.intersect1d(t, f[f >= 0])) for t, f in zip(truth, found))
+    return {
+        "index_type": index_type,
+        "metric": cfg["metric"],
+        "n_vectors": int(len(vectors)),
+        "k": int(k),
+        "n_queries": int(len(queries)),
+        f"recall@{k}": hits / (len(queries) * k) if k else 1.0,
+        "latency": _latency_summary(latency),
+        "flat_latency": _latency_summary(exact_latency),
+    }
@@ -0,0 +1,133 @@
+import numpy as np
+
+
+class AttributeIndex:
+    """商品属性倒排索引：每个 (字段, 取值) 对应一个升序行号数组"""
+
+    FIELDS = ("gender", "season", "articleType", "usage", "baseColour")
+
+    def __init__(self, postings, fingerprint=None, colour_groups=None):
+        self.postings = postings          # {field: {value(小写): np.ndarray[int32]}}
+        self.fingerprint = fingerprint    # 构建时目录指纹，用于判断是否需要重建
+        self.colour_groups = colour_groups or {}  # 预展开的颜色组（如肤色 → 颜色并集）
+        self._unions = {}  # 多值并集缓存，如 gender=[women, unisex]
+
+    @classmethod
+    def build(cls, catalog, colour_groups=None):
+        """一次性从 CompactCatalog 构建全部 posting list"""
+        postings = {}
+        for field in cls.FIELDS:
+            if field in catalog.codes:
+                postings[field] = cls._categorical_postings(
+                    catalog.codes[field], catalog.categories[field]
+                )
+
+        colours = {}
+        for code, name in enumerate(catalog.colours):
+            rows = np.flatnonzero(catalog.has_colour(code))
+            if len(rows):
+                colours[name] = rows.astype(np.int32)
+        postings["baseColour"] = colours
+
+        index = cls(postings, catalog.fingerprint())
+        for name, group in (colour_groups or {}).items():
+            index.add_colour_group(name, group)
+        return index
+
+    @staticmethod
+    def _categorical_postings(codes, categories):
+        # 稳定排序后按编码切分，每段即该取值的升序行号
+        order = np.argsort(codes, kind="stable").astype(np.int32)
+        counts = np.bincount(codes[codes >= 0], minlength=len(categories))
+        start = int(np.count_nonzero(codes < 0))  # 缺失值排在最前，跳过
+        postings = {}
+        for code, count in enumerate(counts):
+            key = categories[code].lower()
+            rows = order[start:start + count]
+            postings[key] = np.union1d(postings[key], rows) if key in postings else rows
+            start += count
+        return postings
+
+    def add_colour_group(self, name, colours):
+        """预先合并一组颜色的 posting list，查询时不再逐色展开；组名不区分大小写"""
+        self.colour_groups[self.group_key(name)] = self.lookup("baseColour", colours)
+
+    @staticmethod
+    def group_key(name):
+        """颜色组名（肤色）的规范形式，与响应缓存键（normalize_request）一致"""
+        return str(name).strip().lower()
+
+    def lookup(self, field, values):
+        """多个取值的 posting list 取并集"""
+        table = self.postings.get(field, {})
+        lists = [table[v] for v in (str(v).strip().lower() for v in values) if v in table]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        if len(lists) == 1:
+            return lists[0]
+        key = (field, frozenset(str(v).strip().lower() for v in values))
+        if key not in self._unions:
+            self._unions[key] = np.unique(np.concatenate(lists))
+        return self._unions[key]
+
+    def query(self, max_results=None, colour_group=None, colours=None, **criteria):
+        """条件间取交集，按行号升序返回至多 max_results 个行号"""
+        lists = []
+        for field, values in criteria.items():
+            if values is None:
+                continue
+            if field not in self.postings:
+                raise KeyError(f"Unknown indexed field: {field}")
+            lists.append(self.lookup(field, [values] if isinstance(values, str) else values))
+        if colour_group is not None:
+            lists.append(self.colour_groups.get(self.group_key(colour_group), np.empty(0, dtype=np.int32)))
+        if colours is not None:
+            lists.append(self.lookup("baseColour", [colours] if isinstance(colours, str) else colours))
+        if not lists:
+            raise ValueError("query() needs at least one condition")
+        return self._intersect(sorted(lists, key=len), max_results)
+
+    @staticmethod
+    def _intersect(lists, max_results, chunk=256):
+        """从最短列表分块推进，凑够 max_results 即停止，不物化完整交集"""
+        shortest, others = lists[0], lists[1:]
+        limit = len(shortest) if max_results is None else max_results
+        found = []
+        total = 0
+        for start in range(0, len(shortest), chunk):
+            block = shortest[start:start + chunk]
+            for other in others:
+                pos = np.searchsorted(other, block)
+                pos[pos == len(other)] = 0
+                block = block[other[pos] == block] if len(other) else block[:0]
+                if not len(block):
+                    break
+            found.append(block[:limit - total])
+            total += len(found[-1])
+            if total >= limit:
+                break
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int32)
+
+    def save(self, path):
+        arrays = {
+            f"{field}|{value}": rows
+            for field, table in self.postings.items()
+            for value, rows in table.items()
+        }
+        arrays.update({f"__group__|{name}": rows for name, rows in self.colour_groups.items()})
+        np.savez(path, __fingerprint__=np.array(self.fingerprint or ""), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        postings, groups, fingerprint = {}, {}, None
+        with np.load(path, allow_pickle=False) as data:
+            for key in data.files:
+                if key == "__fingerprint__":
+                    fingerprint = str(data[key]) or None
+                    continue
+                field, value = key.split("|", 1)
+                if field == "__group__":
+                    groups[cls.group_key(value)] = data[key]
+                else:
+                    postings.setdefault(field, {})[value] = data[key]
+        return cls(postings, fingerprint, groups)
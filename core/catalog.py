@@ -0,0 +1,320 @@
+import hashlib
+import json
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+ARRAYS_DIR = "catalog_arrays"  # 快照中每个数组一个 .npy 文件
+
+
+def _normalize_colours(value):
+    """兼容 DataProcessor 的列表格式与原始 CSV 的逗号字符串"""
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple, np.ndarray)):
+        return []
+    return [c.strip().lower() for c in value if isinstance(c, str) and c.strip()]
+
+
+def _colour_words(n_colours):
+    """颜色掩码每行所需的 uint64 个数（每个颜色一位）"""
+    return max(1, -(-n_colours // 64))
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    return list(value)
+
+
+class StringColumn:
+    """字符串列存为 UTF-8 字节 + 偏移量：不含 Python 对象，可直接 mmap，多个 worker 共享同一份页面"""
+
+    def __init__(self, data, offsets):
+        self.data = data        # np.uint8，全部字符串首尾相接
+        self.offsets = offsets  # np.int64，长度为行数 + 1
+
+    @classmethod
+    def from_values(cls, values):
+        encoded = [("" if v is None or v != v else str(v)).encode("utf-8") for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decode(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode("utf-8")
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            rows = np.arange(len(self))[rows]
+        elif np.ndim(rows) == 0:
+            return self._decode(int(rows))
+        rows = np.asarray(rows)
+        out = np.empty(len(rows), dtype=object)
+        for i, row in enumerate(rows):
+            out[i] = self._decode(row)
+        return out
+
+    def __iter__(self):
+        return (self._decode(row) for row in range(len(self)))
+
+    def __array__(self, dtype=None, copy=None):
+        return self[slice(None)] if dtype is None else self[slice(None)].astype(dtype)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes
+
+
+class CompactCatalog:
+    """列式紧凑商品目录：类别列存为整数编码，颜色存为位掩码
+
+    颜色词表与类别列一样从数据中构建（colours，位序即 bit 序号）；
+    colour_bits 形状为 (行数, 字)，每个 uint64 字 64 种颜色，不存在词表外颜色。
+    """
+
+    CATEGORICAL_COLUMNS = ("gender", "articleType", "usage", "season")
+
+    def __init__(self, ids, codes, categories, colour_bits, extra=None, colours=()):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.codes = codes
+        self.categories = categories
+        self.colours = list(colours)
+        colour_bits = np.ascontiguousarray(colour_bits, dtype=np.uint64)
+        self.colour_bits = colour_bits.reshape(-1, 1) if colour_bits.ndim == 1 else colour_bits
+        self.extra = extra or {}
+        # 大小写不敏感的取值 → 编码查找表
+        self._lookup = {
+            col: self._build_lookup(values) for col, values in categories.items()
+        }
+        self._colour_codes = {c: i for i, c in enumerate(self.colours)}
+
+    @staticmethod
+    def _build_lookup(values):
+        lookup = {}
+        for code, value in enumerate(values):
+            lookup.setdefault(value.lower(), []).append(code)
+        return lookup
+
+    @classmethod
+    def from_dataframe(cls, df, keep_columns=None):
+        """由 DataProcessor 清洗结果或原始 styles.csv 数据构建"""
+        codes, categories = {}, {}
+        for col in cls.CATEGORICAL_COLUMNS:
+            if col not in df.columns:
+                continue
+            col_codes, values = pd.factorize(df[col].astype("string").str.strip())
+            dtype = np.int8 if len(values) < 127 else np.int16
+            codes[col] = col_codes.astype(dtype)
+            categories[col] = [str(v) for v in values]
+
+        # 颜色词表按首次出现顺序编号；相同的原始取值只解析一次
+        colours, parsed, masks = {}, {}, []
+        values = df["baseColour"].to_numpy() if "baseColour" in df.columns else [None] * len(df)
+        for value in values:
+            key = tuple(value) if isinstance(value, (list, tuple, np.ndarray)) else value
+            mask = parsed.get(key) if isinstance(key, (str, tuple)) else None
+            if mask is None:
+                mask = 0
+                for c in _normalize_colours(value):
+                    mask |= 1 << colours.setdefault(c, len(colours))
+                if isinstance(key, (str, tuple)):
+                    parsed[key] = mask
+            masks.append(mask)
+        bits = np.empty((len(df), _colour_words(len(colours))), dtype=np.uint64)
+        for w in range(bits.shape[1]):
+            bits[:, w] = np.array([(m >> (64 * w)) & 0xFFFFFFFFFFFFFFFF for m in masks], dtype=np.uint64)
+
+        # 其余列（如 productDisplayName / image_path / material）按需原样保留
+        skip = set(cls.CATEGORICAL_COLUMNS) | {"id", "baseColour"}
+        if keep_columns is None:
+            keep_columns = [c for c in df.columns if c not in skip]
+        extra = {c: df[c].to_numpy() for c in keep_columns if c in df.columns}
+        return cls(df["id"].to_numpy(), codes, categories, bits, extra, colours=list(colours))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def colour_codes(self, colours):
+        """颜色 → 词表中的位序号，目录中不存在的颜色忽略"""
+        return [self._colour_codes[c] for c in dict.fromkeys(_normalize_colours(list(colours)))
+                if c in self._colour_codes]
+
+    def colour_mask(self, colours):
+        """颜色列表 → 查询掩码（每字一个 uint64）"""
+        mask = np.zeros(self.colour_bits.shape[1], dtype=np.uint64)
+        for code in self.colour_codes(colours):
+            mask[code // 64] |= np.uint64(1 << (code % 64))
+        return mask
+
+    def has_colour(self, code):
+        """各行是否含有该颜色（0/1 的 uint64 数组）"""
+        return (self.colour_bits[:, code // 64] >> np.uint64(code % 64)) & np.uint64(1)
+
+    def colour_hits(self, colours):
+        """每个商品命中的查询颜色数"""
+        hits = np.zeros(len(self), dtype=np.int32)
+        for code in self.colour_codes(colours):
+            hits += self.has_colour(code).astype(np.int32)
+        return hits
+
+    def codes_for(self, column, values):
+        """取值（大小写不敏感）→ 编码列表，未知取值被忽略"""
+        lookup = self._lookup.get(column, {})
+        return [code for v in values for code in lookup.get(str(v).strip().lower(), [])]
+
+    def mask(self, colours=None, **criteria):
+        """按类别列与颜色计算布尔掩码；每个条件接受单值或多值（OR），条件间为 AND"""
+        mask = np.ones(len(self), dtype=bool)
+        for column, values in criteria.items():
+            values = _as_list(values)
+            if values is None:
+                continue
+            if column not in self.codes:
+                raise KeyError(f"Unknown categorical column: {column}")
+            mask &= np.isin(self.codes[column], self.codes_for(column, values))
+        colours = _as_list(colours)
+        if colours is not None:
+            mask &= ((self.colour_bits & self.colour_mask(colours)) != 0).any(axis=1)
+        return mask
+
+    def filter(self, colours=None, **criteria):
+        """返回满足条件的行号（升序）"""
+        return np.flatnonzero(self.mask(colours=colours, **criteria))
+
+    def column(self, name, rows=None):
+        """解码类别列为字符串数组"""
+        codes = self.codes[name] if rows is None else self.codes[name][rows]
+        values = np.array(self.categories[name] + [None], dtype=object)
+        return values[codes]  # 编码 -1（缺失）落到末尾的 None
+
+    def colours_of(self, row):
+        bits = sum(int(word) << (64 * w) for w, word in enumerate(self.colour_bits[row]))
+        return [c for i, c in enumerate(self.colours) if bits >> i & 1]
+
+    def to_dataframe(self, rows=None):
+        """物化为 DataFrame（baseColour 为列表），只在输出少量结果时使用"""
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows)
+        data = {"id": self.ids[rows]}
+        for col in self.codes:
+            data[col] = self.column(col, rows)
+        data["baseColour"] = [self.colours_of(r) for r in rows]
+        for col, values in self.extra.items():
+            data[col] = values[rows]
+        return pd.DataFrame(data)
+
+    def fingerprint(self):
+        """目录内容指纹，派生索引据此判断是否过期"""
+        digest = hashlib.sha1(self.ids.tobytes())
+        digest.update(self.colour_bits.tobytes())
+        digest.update("\x00".join(self.colours).encode())
+        for col in sorted(self.codes):
+            digest.update(col.encode())
+            digest.update(self.codes[col].tobytes())
+            digest.update("\x00".join(self.categories[col]).encode())
+        return digest.hexdigest()
+
+    def save(self, directory):
+        """保存为快照目录：每个数组一个 .npy（可 mmap），字符串列存为字节 + 偏移量，词表与元数据写入 JSON"""
+        directory = Path(directory)
+        arrays_dir = directory / ARRAYS_DIR
+        arrays_dir.mkdir(parents=True, exist_ok=True)
+        arrays = {"ids": self.ids, "colour_bits": self.colour_bits}
+        arrays.update({f"codes__{col}": codes for col, codes in self.codes.items()})
+        for col, values in self.extra.items():
+            column = values if isinstance(values, StringColumn) else StringColumn.from_values(values)
+            arrays[f"extra__{col}__data"] = column.data
+            arrays[f"extra__{col}__offsets"] = column.offsets
+        for name, array in arrays.items():
+            np.save(arrays_dir / f"{name}.npy", np.ascontiguousarray(array))
+        meta = {
+            "categories": self.categories,
+            "colours": self.colours,
+            "extra_columns": list(self.extra),
+            "fingerprint": self.fingerprint(),
+        }
+        with open(directory / "catalog_meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory, mmap=False):
+        """mmap=True 时数组以只读方式映射快照文件，fork 出的 worker 共享页缓存而不各自复制"""
+        directory = Path(directory)
+        with open(directory / "catalog_meta.json", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays_dir = directory / ARRAYS_DIR
+
+        def array(name):
+            return np.load(arrays_dir / f"{name}.npy", mmap_mode="r" if mmap else None, allow_pickle=False)
+        codes = {col: array(f"codes__{col}") for col in meta["categories"]}
+        extra = {
+            col: StringColumn(array(f"extra__{col}__data"), array(f"extra__{col}__offsets"))
+            for col in meta["extra_columns"]
+        }
+        return cls(array("ids"), codes, meta["categories"], array("colour_bits"), extra, colours=meta["colours"])
+
+    def memory_usage(self):
+        """目录占用字节数（含保留列的对象内存）"""
+        total = self.ids.nbytes + self.colour_bits.nbytes
+        total += sum(c.nbytes for c in self.codes.values())
+        total += sum(sys.getsizeof(v) for values in self.categories.values() for v in values)
+        for values in self.extra.values():
+            if isinstance(values, StringColumn):
+                total += values.nbytes
+                continue
+            total += int(pd.Series(values).memory_usage(deep=True, index=False))
+        return total
+
+
+def compare_with_dataframe(df, repeats=20):
+    """对比 DataFrame 与 CompactCatalog 的内存占用和过滤耗时"""
+    catalog = CompactCatalog.from_dataframe(df)
+    gender = catalog.categories.get("gender", [""])[0]
+    season = catalog.categories.get("season", [""])[0]
+    colours = ["black", "navy blue", "white"]
+
+    def pandas_filter():
+        colour_sets = df["baseColour"].apply(lambda x: set(_normalize_colours(x)))
+        return df[(df["gender"] == gender) & (df["season"] == season)
+                  & colour_sets.apply(lambda x: len(x & set(colours)) > 0)]
+
+    def catalog_filter():
+        return catalog.filter(gender=gender, season=season, colours=colours)
+
+    def best_of(fn):
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+        return min(timings) * 1000
+
+    if len(pandas_filter()) != len(catalog_filter()):
+        raise RuntimeError("CompactCatalog filter disagrees with the DataFrame filter")
+    return {
+        "rows": len(df),
+        "dataframe_bytes": int(df.memory_usage(deep=True).sum()),
+        "catalog_bytes": catalog.memory_usage(),
+        "dataframe_filter_ms": best_of(pandas_filter),
+        "catalog_filter_ms": best_of(catalog_filter),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare CompactCatalog against the cleaned DataFrame")
+    parser.add_argument("--data-path", default="data", help="directory containing styles.csv")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    from .data_processor import DataProcessor
+    report = compare_with_dataframe(DataProcessor(args.data_path).load_and_clean(), args.repeats)
+    print(json.dumps(report, indent=2))
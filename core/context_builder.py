@@ -0,0 +1,96 @@
+import re
+import pandas as pd
+from .catalog import _normalize_colours
+
+GROUP_COLUMNS = ("gender", "season", "usage")
+
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else ""
+
+
+def estimate_tokens(text):
+    """没有分词器时的粗略估计（约 4 字符一个 token）"""
+    return len(text) // 4 + 1
+
+
+class ContextBuilder:
+    """在显式 token 预算内编码检索到的商品
+
+    共享的 gender/season/usage 写成分组标题，商品名中与标题、颜色、款式重复的词去掉，
+    重复商品只保留一条；候选先排序、按预算截断，再交给分词器，提示不会超过 max_length。
+    """
+
+    def __init__(self, tokenizer=None, max_items=10):
+        self.tokenizer = tokenizer
+        self.max_items = max_items
+
+    def count_tokens(self, texts):
+        if not texts:
+            return []
+        if self.tokenizer is None:
+            return [estimate_tokens(t) for t in texts]
+        return [len(ids) for ids in self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
+
+    def rank(self, df):
+        """有图片的优先（生成结果要引用图片），再按款式轮转保证多样性；去掉重复商品，返回行（dict）列表
+
+        检索结果只有几十行，逐行处理比 DataFrame 运算（分组、排序）开销小得多。
+        """
+        if df is None or df.empty:
+            return []
+        columns = list(df.columns)
+        records = [dict(zip(columns, values)) for values in zip(*(df[col].tolist() for col in columns))]
+        seen, turns, ranked = set(), {}, []
+        for pos, row in enumerate(records):
+            article = _text(row.get("articleType")).lower()
+            key = (article, ",".join(_normalize_colours(row.get("baseColour"))),
+                   _text(row.get("productDisplayName")).lower())
+            if key in seen:
+                continue
+            seen.add(key)
+            # 同一款式内的次序：第 1 件、第 2 件……，按次序轮转各款式
+            turn = turns[article] = turns.get(article, -1) + 1
+            has_image = "image_path" not in row or not pd.isna(row["image_path"])
+            ranked.append(((not has_image, turn, pos), row))
+        ranked.sort(key=lambda item: item[0])
+        return [row for _, row in ranked]
+
+    @staticmethod
+    def _header(row):
+        values = [_text(row.get(col)) for col in GROUP_COLUMNS]
+        return ", ".join(v for v in values if v) + ":\n"
+
+    @staticmethod
+    def _line(row):
+        article = _text(row.get("articleType"))
+        colours = _normalize_colours(row.get("baseColour"))
+        # 商品名形如 "Puma Men Black Tshirts"，分组标题、颜色和款式已写出，只保留其余的词（通常是品牌）
+        repeated = {w.lower() for col in GROUP_COLUMNS for w in _text(row.get(col)).split()}
+        repeated |= {w for c in colours for w in c.split()} | {w.lower() for w in article.split()}
+        name = " ".join(w for w in _text(row.get("productDisplayName")).split()
+                        if re.sub(r"\W", "", w.lower()) not in repeated)
+        fields = [f"- Image: {row['id']}.jpg", article, "/".join(colours), name]
+        return " | ".join(f for f in fields if f) + "\n"
+
+    def build(self, df, budget_tokens=None):
+        """返回 (context 文本, 选入的商品数)；budget_tokens 为 None 时只受 max_items 限制"""
+        rows = self.rank(df)[:self.max_items]
+        if not rows:
+            return "", 0
+        headers = [self._header(row) for row in rows]
+        lines = [self._line(row) for row in rows]
+        unique_headers = list(dict.fromkeys(headers))
+        counts = self.count_tokens(unique_headers + lines)
+        header_tokens = dict(zip(unique_headers, counts[:len(unique_headers)]))
+        line_tokens = counts[len(unique_headers):]
+
+        groups, used = {}, 0
+        for header, line, tokens in zip(headers, lines, line_tokens):
+            cost = tokens + (header_tokens[header] if header not in groups else 0)
+            if budget_tokens is not None and used + cost > budget_tokens:
+                continue  # 更短的后续商品可能还放得下
+            groups.setdefault(header, []).append(line)
+            used += cost
+        text = "".join(header + "".join(items) for header, items in groups.items())
+        return text, sum(len(items) for items in groups.values())
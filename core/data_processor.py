@@ -1,31 +1,168 @@
-import pandas as pd
+import hashlib
+import json
+import logging
 import os
-import kagglehub
-from kagglehub import KaggleDatasetAdapter
+import shutil
+from pathlib import Path
+import pandas as pd
+
+CACHE_VERSION = 1  # 清洗逻辑变化时递增，旧缓存随之失效
+CACHE_INDEX = "latest.json"
+COLUMNS_TO_DROP = ["masterCategory", "subCategory", "year", "productDisplayName"]
+KEY_COLUMNS = ["id", "gender", "articleType", "usage", "baseColour", "season"]
+TEXT_COLUMNS = ["gender", "articleType", "usage", "baseColour", "season"]
+
+
+def file_digest(path, block_size=1 << 20):
+    """源文件内容的 sha256，分块读取"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def clean_chunk(df):
+    """清洗一个分块：全部为向量化字符串操作"""
+    df = df.drop(columns=[col for col in COLUMNS_TO_DROP if col in df.columns])
+    # 处理缺失值：删除关键字段缺失的行
+    df = df.dropna(subset=KEY_COLUMNS)
+    df = df.astype({"id": "int64"})
+    # 统一文本格式为小写
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].str.lower()
+    # "Navy Blue, White" → ["navy blue", "white"]
+    df["baseColour"] = df["baseColour"].str.strip().str.split(r"\s*,\s*", regex=True)
+    return df
+
 
 class DataProcessor:
-    def __init__(self, data_path):
+    """styles.csv 分块清洗，结果按源文件哈希缓存为分片 Parquet，再次加载直接读取缓存"""
+
+    def __init__(self, data_path, chunk_size=100_000, cache_dir=None, use_cache=True):
         self.data_path = data_path
-    
+        self.chunk_size = chunk_size
+        self.cache_dir = Path(cache_dir) if cache_dir else Path(data_path) / ".cache"
+        self.use_cache = use_cache
+
     def load_and_clean(self):
         """数据加载与清洗流程"""
-        # Download latest version
-        path = kagglehub.dataset_download("paramaggarwal/fashion-product-images-small")
+        if not self.use_cache:
+            return self._concat(self._clean_chunks(self._source_path()))
+        return self._read_cache(self.build_cache())
+
+    def iter_chunks(self):
+        """逐个分片读取清洗结果，内存占用与分片大小相当"""
+        cache = self.build_cache() if self.use_cache else None
+        if cache is None:
+            yield from self._clean_chunks(self._source_path())
+            return
+        for part in sorted(cache.glob("part-*.parquet")):
+            yield self._read_part(part)
+
+    def build_cache(self):
+        """返回当前源文件对应的缓存目录，不存在时流式清洗写入；pyarrow 不可用时返回 None"""
+        cached = self._cached_by_stat()
+        if cached is not None:
+            return cached
+        source = self._source_path()
+        digest = file_digest(source)
+        cache = self.cache_dir / f"styles-v{CACHE_VERSION}-{digest[:16]}"
+        if not (cache / "_manifest.json").exists():
+            try:
+                self._write_cache(source, digest, cache)
+            except ImportError as e:
+                logging.warning(f"Parquet cache unavailable ({e}); cleaning without cache.")
+                return None
+        self._write_index(source, digest, cache)
+        return cache
 
-        df = pd.read_csv(os.path.join(self.data_path, "styles.csv"), on_bad_lines="skip")
-        
-        # 清洗逻辑
-        columns_to_drop = ["masterCategory", "subCategory", "year", "productDisplayName"]  
-        df = df.drop(columns=[col for col in columns_to_drop if col in df.columns])
+    def _source_path(self):
+        path = os.path.join(self.data_path, "styles.csv")
+        if os.path.exists(path):
+            return path
+        # 本地没有数据时才下载；kagglehub 按需导入
+        import kagglehub
+        downloaded = Path(kagglehub.dataset_download("paramaggarwal/fashion-product-images-small"))
+        return str(next(downloaded.rglob("styles.csv")))
 
-        # 处理缺失值：删除关键字段缺失的行
-        key_columns = ["id", "gender", "articleType", "usage", "baseColour", "season"]
-        df = df.dropna(subset=key_columns)
+    def _cached_by_stat(self):
+        # 源文件大小与修改时间未变时直接命中，不读取源文件，也不检查下载
+        try:
+            with open(self.cache_dir / CACHE_INDEX, encoding="utf-8") as f:
+                index = json.load(f)
+            local = os.path.join(self.data_path, "styles.csv")
+            source = local if os.path.exists(local) else index["source"]
+            cache = Path(index["cache"])
+            if (index["version"] == CACHE_VERSION and source == index["source"]
+                    and _stat_key(source) == index["stat"] and (cache / "_manifest.json").exists()):
+                return cache
+        except (OSError, ValueError, KeyError):
+            pass
+        return None
 
-        # 统一文本格式为小写
-        text_columns = ["gender", "articleType", "usage", "baseColour", "season"]
-        df[text_columns] = df[text_columns].apply(lambda x: x.str.lower())
+    def _write_index(self, source, digest, cache):
+        index = {"version": CACHE_VERSION, "source": source, "stat": _stat_key(source),
+                 "sha256": digest, "cache": str(cache)}
+        tmp = self.cache_dir / f"{CACHE_INDEX}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, self.cache_dir / CACHE_INDEX)
 
-        df['baseColour'] = df['baseColour'].apply(lambda x: x.split(",") if isinstance(x, str) else x  # 处理字符串或列表)
-        df['baseColour'] = df['baseColour'].apply(lambda x: [c.strip() for c in x] if isinstance(x, list) else [])
+    def _clean_chunks(self, source):
+        reader = pd.read_csv(
+            source,
+            on_bad_lines="skip",
+            chunksize=self.chunk_size,
+            usecols=lambda col: col not in COLUMNS_TO_DROP,
+            dtype={col: "str" for col in TEXT_COLUMNS},
+        )
+        for chunk in reader:
+            yield clean_chunk(chunk)
+
+    def _write_cache(self, source, digest, cache):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        logging.info(f"Cleaning {source} into Parquet cache {cache}...")
+        tmp = cache.with_name(f"{cache.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        rows = parts = 0
+        for parts, chunk in enumerate(self._clean_chunks(source), start=1):
+            pq.write_table(pa.Table.from_pandas(chunk, preserve_index=False), tmp / f"part-{parts - 1:05d}.parquet")
+            rows += len(chunk)
+        with open(tmp / "_manifest.json", "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "source": source, "sha256": digest,
+                       "rows": rows, "parts": parts, "chunk_size": self.chunk_size}, f)
+        try:
+            os.replace(tmp, cache)
+        except OSError:
+            # 并发构建时另一个进程已写入同一缓存
+            shutil.rmtree(tmp, ignore_errors=True)
+        logging.info(f"Parquet cache written: {rows} rows in {parts} parts")
+
+    @staticmethod
+    def _read_part(path):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        df = table.drop(["baseColour"]).to_pandas()
+        # 颜色列保持为 list（to_pandas 会转成 ndarray）
+        df.insert(table.column_names.index("baseColour"), "baseColour", table.column("baseColour").to_pylist())
         return df
+
+    def _read_cache(self, cache):
+        if cache is None:
+            return self._concat(self._clean_chunks(self._source_path()))
+        return self._concat(self._read_part(part) for part in sorted(cache.glob("part-*.parquet")))
+
+    @staticmethod
+    def _concat(chunks):
+        chunks = list(chunks)
+        if not chunks:
+            return pd.DataFrame(columns=KEY_COLUMNS)
+        return pd.concat(chunks, ignore_index=True)
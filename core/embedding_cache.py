@@ -0,0 +1,90 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import diskcache
+except ImportError:  # 磁盘层为可选依赖
+    diskcache = None
+
+
+def normalize_query(text):
+    """查询归一化：全半角统一、小写、合并空白"""
+    text = unicodedata.normalize("NFKC", str(text))
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """查询向量缓存：内存 LRU + 可选磁盘层（重启后仍可命中）
+
+    namespace 标识编码器（模型 + 后端），写入磁盘键中：更换编码器后不会读到旧向量。
+    """
+
+    def __init__(self, max_size=1024, disk_path=None, disk_size_limit=2 ** 28, namespace=""):
+        self.max_size = max_size
+        self.namespace = namespace
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            if diskcache is None:
+                raise ImportError("diskcache is required for the on-disk query cache")
+            self._disk = diskcache.Cache(disk_path, size_limit=disk_size_limit)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        if self._disk is not None:
+            value = self._disk.get(self._disk_key(key))
+            if value is not None:
+                value = np.frombuffer(value, dtype=np.float32)
+                with self._lock:
+                    self.disk_hits += 1
+                self._put_memory(key, value)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, embedding):
+        embedding = np.asarray(embedding, dtype=np.float32)
+        self._put_memory(key, embedding)
+        if self._disk is not None:
+            self._disk.set(self._disk_key(key), embedding.tobytes())
+
+    def _disk_key(self, key):
+        return f"{self.namespace}|{key}"
+
+    def _put_memory(self, key, embedding):
+        with self._lock:
+            self._memory[key] = embedding
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_size:
+                self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk is not None:
+            self._disk.clear()
+
+    def stats(self):
+        """命中统计，用于评估缓存容量"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._memory),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
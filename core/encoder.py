@@ -0,0 +1,211 @@
+import logging
+import threading
+import time
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+import yaml
+
+BACKENDS = ("torch", "int8", "onnx")
+
+DEFAULT_ENCODER_CONFIG = {
+    "model": "paraphrase-multilingual-MiniLM-L12-v2",
+    "backend": "torch",     # torch（float32）| int8（Linear 层动态量化，需先通过一致性检查）| onnx（onnxruntime）
+    "threads": None,        # 编码线程数，None 时保持 torch / onnxruntime 默认
+    "batch_size": 64,       # 批量编码（建库）时的批大小
+    "onnx_file": None,      # onnx 后端加载的导出文件，如 "onnx/model_qint8_avx512_vnni.onnx"
+    "parity_min_recall": 0.95,
+}
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+_torch_threads_lock = threading.Lock()
+# 新版 torch 对动态量化 API 与量化张量给出的弃用提示；只屏蔽这两条
+_QUANTIZATION_DEPRECATIONS = (
+    (r"torch\.ao\.quantization is deprecated", DeprecationWarning),
+    (r"torch\.quantize_per_tensor, torch\.quantize_per_channel .* are deprecated", UserWarning),
+)
+
+
+def load_encoder_config(path="configs/model_config.yaml"):
+    """读取 encoder 配置；没有 encoder.model 时沿用旧的 rag.encoder_model"""
+    config = dict(DEFAULT_ENCODER_CONFIG)
+    if Path(path).exists():
+        with open(path, encoding="utf-8") as f:
+            raw = yaml.safe_load(f) or {}
+        config["model"] = raw.get("rag", {}).get("encoder_model", config["model"])
+        config.update(raw.get("encoder") or {})
+    if config["backend"] not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend: {config['backend']}")
+    return config
+
+
+class CPUEncoder:
+    """SentenceTransformer 的 CPU 封装：按配置选择 float32 / int8 动态量化 / ONNX 后端"""
+
+    def __init__(self, model, backend="torch", threads=None, batch_size=64, onnx_file=None):
+        self.model_name = model
+        self.backend = backend
+        self.threads = threads
+        self.batch_size = batch_size
+        started = time.perf_counter()
+        self.model = self._load(model, backend, threads, onnx_file)
+        logging.info(f"Loaded encoder {model} ({backend}, threads={threads}) "
+                     f"in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def _load(model, backend, threads, onnx_file):
+        from sentence_transformers import SentenceTransformer
+        if backend == "onnx":
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            model_kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+            if onnx_file:
+                model_kwargs["file_name"] = onnx_file
+            return SentenceTransformer(model, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+        import torch
+        encoder = SentenceTransformer(model, device="cpu").eval()
+        if backend == "int8":
+            # Linear 权重量化为 int8，激活在运行时动态量化
+            with warnings.catch_warnings():
+                for message, category in _QUANTIZATION_DEPRECATIONS:
+                    warnings.filterwarnings("ignore", message=message, category=category)
+                torch.ao.quantization.quantize_dynamic(encoder, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return encoder
+
+    @property
+    def dim(self):
+        return self.model.get_embedding_dimension()
+
+    def encode(self, texts, batch_size=None, **kwargs):
+        """返回 float32 向量数组，与 SentenceTransformer.encode 一致"""
+        kwargs.setdefault("show_progress_bar", False)
+        with self._threads():
+            embeddings = self.model.encode(list(texts), batch_size=batch_size or self.batch_size,
+                                           convert_to_numpy=True, **kwargs)
+        return np.asarray(embeddings, dtype=np.float32)
+
+    @contextmanager
+    def _threads(self):
+        """torch 线程数是进程级设置：只在编码期间切换并随后恢复，不影响 LLM 生成与 after_fork 的设置
+
+        onnx 后端的线程数在会话选项中设置，无需切换。
+        """
+        if not self.threads or self.backend == "onnx":
+            yield
+            return
+        import torch
+        with _torch_threads_lock:
+            previous = torch.get_num_threads()
+            torch.set_num_threads(self.threads)
+            try:
+                yield
+            finally:
+                torch.set_num_threads(previous)
+
+
+def get_encoder(config=None):
+    """按 (模型, 后端, 线程数, 导出文件) 共享的编码器实例，进程内只加载一次"""
+    cfg = {**DEFAULT_ENCODER_CONFIG, **(config or {})}
+    key = (cfg["model"], cfg["backend"], cfg["threads"], cfg["onnx_file"])
+    with _encoders_lock:
+        if key not in _encoders:
+            _encoders[key] = CPUEncoder(cfg["model"], cfg["backend"], cfg["threads"],
+                                        cfg["batch_size"], cfg["onnx_file"])
+        return _encoders[key]
+
+
+def encoder_id(encoder):
+    """编码器标识 "模型 (后端)"：写入商品向量索引元数据，也用作查询缓存的命名空间；替身编码器用类名"""
+    name = getattr(encoder, "model_name", type(encoder).__name__)
+    backend = getattr(encoder, "backend", None)
+    return f"{name} ({backend})" if backend else name
+
+
+def _neighbours(corpus_embeddings, query_embeddings, k):
+    from .ann_index import build_flat_index, prepare_vectors
+    index = build_flat_index(corpus_embeddings.shape[1], "ip")
+    index.add(prepare_vectors(corpus_embeddings, "ip"))
+    return index.search(prepare_vectors(query_embeddings, "ip"), k)[1]
+
+
+def _timed_encode(encoder, texts):
+    started = time.perf_counter()
+    embeddings = encoder.encode(texts)
+    return embeddings, time.perf_counter() - started
+
+
+def _query_p50_ms(encoder, queries):
+    # 逐条编码，对应 parse_query 的单查询路径
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        encoder.encode([query])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return float(np.percentile(latencies, 50))
+
+
+def parity_report(reference, candidate, corpus, queries, k=10):
+    """以 reference（通常为 float32）为基准：两个编码器各自建 FAISS 精确索引，比较查询的 k 近邻
+
+    recall@k 为 candidate 近邻落在 reference 近邻中的比例；同时给出向量余弦相似度与编码耗时。
+    """
+    k = min(k, len(corpus))
+    ref_corpus, ref_seconds = _timed_encode(reference, corpus)
+    cand_corpus, cand_seconds = _timed_encode(candidate, corpus)
+    ref_found = _neighbours(ref_corpus, reference.encode(queries), k)
+    cand_found = _neighbours(cand_corpus, candidate.encode(queries), k)
+    hits = sum(len(np.intersect1d(r, c)) for r, c in zip(ref_found, cand_found))
+
+    norms = np.linalg.norm(ref_corpus, axis=1) * np.linalg.norm(cand_corpus, axis=1)
+    cosine = np.sum(ref_corpus * cand_corpus, axis=1) / np.where(norms > 0, norms, 1)
+    return {
+        "reference": reference.backend,
+        "candidate": candidate.backend,
+        "corpus": len(corpus),
+        "queries": len(queries),
+        "k": k,
+        f"recall@{k}": hits / (len(queries) * k) if k else 1.0,
+        "top1_agreement": float(np.mean(ref_found[:, 0] == cand_found[:, 0])) if k else 1.0,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "bulk_seconds": {"reference": ref_seconds, "candidate": cand_seconds},
+        "query_p50_ms": {"reference": _query_p50_ms(reference, queries[:100]),
+                         "candidate": _query_p50_ms(candidate, queries[:100])},
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+    import pandas as pd
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Check that the configured encoder backend retrieves the same FAISS neighbours as float32")
+    parser.add_argument("--config", default="configs/model_config.yaml")
+    parser.add_argument("--knowledge", default="knowledge/structured_kb.csv")
+    parser.add_argument("--queries", type=int, default=500, help="knowledge entries used as queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", default=None, help="write the report as JSON")
+    args = parser.parse_args()
+
+    config = load_encoder_config(args.config)
+    knowledge = pd.read_csv(args.knowledge).fillna("")
+    # 与 KnowledgeBuilder._generate_embeddings 相同的文本；用户需求单独作为查询
+    corpus = (knowledge["用户需求"].astype(str) + " " + knowledge["适用场景"].astype(str)).tolist()
+    queries = knowledge["用户需求"].astype(str).sample(min(args.queries, len(knowledge)), random_state=0).tolist()
+    report = parity_report(get_encoder({**config, "backend": "torch"}), get_encoder(config), corpus, queries, args.k)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report[f"recall@{report['k']}"] < config["parity_min_recall"]:
+        logging.error(f"Encoder backend {config['backend']} is below the parity threshold "
+                      f"{config['parity_min_recall']}")
+        sys.exit(1)
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """令牌桶限流：平均每秒 rate 次调用，允许 burst 次突发"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EnrichmentJournal:
+    """追加写的结果日志（JSONL），重跑时据此跳过已完成的条目
+
+    每条记录附带提示的哈希，提示模板或对话内容变化后旧结果不再命中。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def prompt_hash(prompt):
+        return hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+
+    def load(self):
+        """返回 {(key, prompt_hash): result}"""
+        results = {}
+        if not self.path.exists():
+            return results
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 崩溃时可能留下半行，忽略即可
+                results[record["key"], record.get("prompt")] = record["result"]
+        return results
+
+    def append(self, key, prompt, result):
+        line = json.dumps({"key": key, "prompt": self.prompt_hash(prompt), "result": result}, ensure_ascii=False)
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class DeepSeekClient:
+    """DeepSeek SDK 客户端：client(prompt) -> 回复文本"""
+
+    def __init__(self, api_key, model="deepseek-chat", temperature=0.2):
+        from deepseek_api import DeepSeekAPI
+        self._api = DeepSeekAPI
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+
+    def __call__(self, prompt):
+        return self._api.chat(
+            api_key=self.api_key,
+            model=self.model,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature
+        )
+
+
+class ChatCompletionsClient:
+    """OpenAI 兼容的 /chat/completions HTTP 客户端，可指向本地桩服务"""
+
+    def __init__(self, base_url, model="deepseek-chat", api_key=None, temperature=0.2, timeout=60):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.model = model
+        self.api_key = api_key
+        self.temperature = temperature
+        self.timeout = timeout
+
+    def __call__(self, prompt):
+        body = json.dumps({
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+        }).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=body, headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.loads(response.read().decode("utf-8"))
+        return payload["choices"][0]["message"]["content"]
+
+
+def parse_json_response(response):
+    # 统一中文符号后按 JSON 解析
+    cleaned = response.replace("，", ",").replace("：", ":").strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.strip("`").removeprefix("json").strip()
+    return json.loads(cleaned)
+
+
+class EnrichmentPipeline:
+    """并发 LLM 结构化：有界并发 + 限流 + 指数退避重试 + 可续跑日志"""
+
+    def __init__(self, client, journal_path=None, max_workers=4, rate_limit=2.0,
+                 max_retries=3, backoff_base=1.0, backoff_max=30.0, parser=parse_json_response):
+        self.client = client
+        self.journal = EnrichmentJournal(journal_path) if journal_path else None
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate_limit, burst=max_workers)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.parser = parser
+
+    def run(self, prompts):
+        """prompts: {key: prompt}；返回 {key: 结构化结果}，失败或解析为空的条目为 {} 且不写入日志"""
+        done = self.journal.load() if self.journal else {}
+        results, pending = {}, {}
+        for key, prompt in prompts.items():
+            result = done.get((key, EnrichmentJournal.prompt_hash(prompt))) if done else None
+            if result:
+                results[key] = result
+            else:
+                pending[key] = prompt
+        if results:
+            logger.info(f"Resuming enrichment: {len(results)} done, {len(pending)} pending")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._call_with_retry, key, prompt): key for key, prompt in pending.items()}
+            for n, future in enumerate(as_completed(futures), 1):
+                key = futures[future]
+                result = future.result()
+                if result is None:
+                    results[key] = {}
+                    continue
+                results[key] = result
+                if self.journal:
+                    self.journal.append(key, pending[key], result)
+                if n % 50 == 0:
+                    logger.info(f"Enriched {n}/{len(pending)} messages")
+        return results
+
+    def _call_with_retry(self, key, prompt):
+        for attempt in range(self.max_retries):
+            self.limiter.acquire()
+            try:
+                result = self.parser(self.client(prompt))
+                if result:
+                    return result
+                logger.warning(f"[{key}] 解析结果为空，尝试重新生成...")
+            except json.JSONDecodeError:
+                logger.warning(f"[{key}] JSON解析失败，尝试重新生成...")
+            except Exception as e:
+                logger.warning(f"[{key}] API调用失败：{str(e)}")
+            if attempt + 1 < self.max_retries:
+                delay = min(self.backoff_max, self.backoff_base * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))  # 抖动，避免并发请求同时重试
+        logger.error(f"[{key}] giving up after {self.max_retries} attempts")
+        return None
@@ -0,0 +1,202 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+import torch
+from transformers import StoppingCriteriaList
+from .metrics import GENERATED_TOKENS, PROMPT_TOKENS, REGISTRY, span
+from .streaming import BatchStreamer, StopOnEvent
+
+BATCH_SIZE = REGISTRY.histogram(
+    "fashion_generation_batch_size", "Requests per model.generate call.", buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+class _Request:
+    __slots__ = ("prompt", "streamer", "stop", "future", "enqueued_at")
+
+    def __init__(self, prompt, streamer=None, stop=None):
+        self.prompt = prompt
+        self.streamer = streamer
+        # 流式请求与其 streamer 共用停止标志，客户端断开时 streamer.cancel() 即停止该行
+        self.stop = stop or getattr(streamer, "stop", None) or threading.Event()
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class GenerationScheduler:
+    """动态微批生成调度：请求入队，按最大批量/最长等待时间凑批，每批一次 generate"""
+
+    def __init__(self, model, tokenizer, max_batch_size=8, max_wait_ms=20,
+                 max_length=1500, generate_kwargs=None, prefix_cache=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_length = max_length
+        self.generate_kwargs = generate_kwargs or {}
+        self.prefix_cache = prefix_cache  # 共享 few-shot 前缀的 KV 缓存（可选）
+        # 分词器与单条/流式生成共用，不修改其 pad_token / padding_side，填充在 _left_pad 中完成
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._requests = 0
+        self._max_seen_batch = 0
+        self._batch_sizes = {}
+        self._wait_total = 0.0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="generation-scheduler", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._fail_pending()
+
+    def submit(self, prompt, streamer=None, stop=None):
+        """提交一条提示，返回 Future，结果为新生成的文本（不含提示）
+
+        给定 streamer（如 AsyncTokenStream）时，该行新生成的 token 在批量生成过程中逐步推送给它。
+        给定 stop（threading.Event）时，调用方 set() 后该行在下一步停止生成；future.cancel() 只能取消尚未开始的请求。
+        """
+        return self._submit(prompt, streamer, stop).future
+
+    def _submit(self, prompt, streamer=None, stop=None):
+        if self._stop.is_set():
+            raise RuntimeError("Generation scheduler is stopped")
+        request = _Request(prompt, streamer, stop)
+        self._queue.put(request)
+        return request
+
+    def generate(self, prompt, timeout=None):
+        """提交并等待结果（含排队时间）；超时抛出 TimeoutError，尚未开始的请求取消，已在生成的停止该行"""
+        request = self._submit(prompt)
+        try:
+            return request.future.result(timeout)
+        except TimeoutError:
+            request.stop.set()
+            request.future.cancel()
+            raise
+
+    def _fail_pending(self):
+        # 调度线程退出后队列中剩余的请求不会再被处理，直接以异常结束，避免调用方一直等待
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(RuntimeError("Generation scheduler stopped"))
+
+    def _loop(self):
+        try:
+            self._serve()
+        finally:
+            self._fail_pending()
+
+    def _serve(self):
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._run_batch(batch)
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+        # 调用方超时或客户端断开后已取消的请求不再生成
+        for request in batch:
+            if request.stop.is_set():
+                request.future.cancel()
+        batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            texts = self._generate_batch([r.prompt for r in batch], [r.streamer for r in batch],
+                                         [r.stop for r in batch])
+        except Exception as e:
+            logging.exception("Batched generation failed.")
+            for request in batch:
+                request.future.set_exception(e)
+        else:
+            for request, text in zip(batch, texts):
+                request.future.set_result(text)
+        self._record(batch, started)
+
+    def _generate_batch(self, prompts, streamers=None, stops=None):
+        BATCH_SIZE.observe(len(prompts))
+        with span("batch_tokenize"):
+            inputs = self.prefix_cache.prepare(prompts) if self.prefix_cache is not None else None
+            if inputs is None:
+                inputs = self._left_pad(
+                    self.tokenizer(prompts, truncation=True, max_length=self.max_length)["input_ids"])
+        kwargs = dict(self.generate_kwargs)
+        if stops is not None:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([StopOnEvent(stops)])
+        if streamers is not None and any(s is not None for s in streamers):
+            kwargs["streamer"] = BatchStreamer(streamers, self._eos_token_ids())
+        with span("batch_generate"), torch.no_grad():
+            outputs = self.model.generate(**inputs, pad_token_id=self.pad_token_id, **kwargs)
+        # 填充后所有提示长度一致（前缀缓存时填充在前缀之后），截掉提示部分只保留新生成的 token
+        new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+        for prompt_len, generated in zip(inputs["attention_mask"].sum(dim=1).tolist(),
+                                         (new_tokens != self.pad_token_id).sum(dim=1).tolist()):
+            PROMPT_TOKENS.observe(prompt_len)
+            GENERATED_TOKENS.observe(generated)
+        with span("batch_decode"):
+            return self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+
+    def _eos_token_ids(self):
+        eos = self.model.generation_config.eos_token_id
+        if eos is None:
+            eos = self.tokenizer.eos_token_id
+        return [] if eos is None else [eos] if isinstance(eos, int) else list(eos)
+
+    def _left_pad(self, sequences):
+        """解码器模型批量生成需左侧填充，保证各条提示结尾对齐"""
+        width = max(len(ids) for ids in sequences)
+        input_ids = [[self.pad_token_id] * (width - len(ids)) + ids for ids in sequences]
+        attention_mask = [[0] * (width - len(ids)) + [1] * len(ids) for ids in sequences]
+        device = self.model.device
+        return {"input_ids": torch.tensor(input_ids, dtype=torch.long, device=device),
+                "attention_mask": torch.tensor(attention_mask, dtype=torch.long, device=device)}
+
+    def _record(self, batch, started):
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._max_seen_batch = max(self._max_seen_batch, len(batch))
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._wait_total += sum(started - r.enqueued_at for r in batch)
+
+    def stats(self):
+        """队列深度与批量统计"""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": self._requests / self._batches if self._batches else 0.0,
+                "max_batch_size_seen": self._max_seen_batch,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "avg_queue_wait_ms": 1000 * self._wait_total / self._requests if self._requests else 0.0,
+            }
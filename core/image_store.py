@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".png", ".jpeg")
+
+
+class ImageResolver:
+    """图片目录只扫描一次，建立 id → 路径映射；目录 mtime 变化时重新扫描"""
+
+    def __init__(self, image_dir, extensions=IMAGE_EXTENSIONS, refresh_interval=30.0):
+        self.image_dir = str(image_dir)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.refresh_interval = refresh_interval
+        self._paths = None
+        self._dir_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        # 同一 id 有多个扩展名时按 extensions 顺序取第一个，与原先逐个探测的优先级一致
+        rank = {ext: i for i, ext in enumerate(self.extensions)}
+        paths, ranks = {}, {}
+        try:
+            with os.scandir(self.image_dir) as entries:
+                for entry in entries:
+                    stem, ext = os.path.splitext(entry.name)
+                    r = rank.get(ext.lower())
+                    if r is None or r >= ranks.get(stem, len(rank)):
+                        continue
+                    paths[stem] = entry.path
+                    ranks[stem] = r
+        except FileNotFoundError:
+            logging.warning(f"Image directory not found: {self.image_dir}")
+        return paths
+
+    def _dir_stat(self):
+        try:
+            return os.stat(self.image_dir).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refresh(self, force=False):
+        """目录有增删（mtime 变化）时重建映射；两次检查至少间隔 refresh_interval 秒"""
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._paths is not None and now - self._checked_at < self.refresh_interval:
+                return False
+            self._checked_at = now
+            mtime = self._dir_stat()
+            if not force and self._paths is not None and mtime == self._dir_mtime:
+                return False
+            self._paths = self._scan()
+            self._dir_mtime = mtime
+            logging.info(f"Indexed {len(self._paths)} images under {self.image_dir}")
+            return True
+
+    def resolve(self, item_id):
+        """id → 图片路径，不存在时返回 None"""
+        self.refresh()
+        return self._paths.get(str(item_id))
+
+    def resolve_many(self, item_ids):
+        self.refresh()
+        return [self._paths.get(str(i)) for i in item_ids]
+
+    def ids(self):
+        self.refresh()
+        return list(self._paths)
+
+    def __len__(self):
+        self.refresh()
+        return len(self._paths)
+
+
+_resolvers = {}
+_resolvers_lock = threading.Lock()
+
+
+def get_resolver(image_dir):
+    """同一目录在进程内共享一个 resolver"""
+    key = os.path.abspath(str(image_dir))
+    with _resolvers_lock:
+        if key not in _resolvers:
+            _resolvers[key] = ImageResolver(image_dir)
+        return _resolvers[key]
+
+
+class ThumbnailCache:
+    """内容寻址缩略图缓存：文件名为原图内容哈希，相同图片只生成一次，原图改动后自然失效"""
+
+    def __init__(self, resolver, cache_dir, size=(200, 200), quality=85):
+        self.resolver = resolver
+        self.cache_dir = Path(cache_dir).resolve()
+        self.size = tuple(size)
+        self.quality = quality
+        # 原图 (路径, mtime, 大小) → 内容哈希，避免每次请求都读原图
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def _digest(self, source):
+        stat = os.stat(source)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        cached = self._digests.get(source)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                digest.update(block)
+        value = digest.hexdigest()
+        with self._lock:
+            self._digests[source] = (signature, value)
+        return value
+
+    def _thumbnail_path(self, digest):
+        name = f"{digest}-{self.size[0]}x{self.size[1]}.jpg"
+        return self.cache_dir / digest[:2] / name
+
+    def get(self, item_id):
+        """返回 (缩略图路径, 内容哈希)；商品没有图片时返回 (None, None)"""
+        source = self.resolver.resolve(item_id)
+        if source is None:
+            return None, None
+        try:
+            digest = self._digest(source)
+        except FileNotFoundError:
+            # 映射尚未感知到删除，强制刷新后重试一次
+            self.resolver.refresh(force=True)
+            source = self.resolver.resolve(item_id)
+            if source is None:
+                return None, None
+            digest = self._digest(source)
+        path = self._thumbnail_path(digest)
+        if not path.exists():
+            self._render(source, path)
+        return path, digest
+
+    def _render(self, source, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with Image.open(source) as img:
+            img.thumbnail(self.size)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            # 先写临时文件再原子替换，并发请求不会读到半个文件
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            img.save(tmp, format="JPEG", quality=self.quality)
+        os.replace(tmp, path)
+
+    def precompute(self, item_ids=None, max_workers=4):
+        """批量预生成缩略图，返回成功数量"""
+        item_ids = self.resolver.ids() if item_ids is None else list(item_ids)
+
+        def build(item_id):
+            try:
+                return self.get(item_id)[0] is not None
+            except Exception as e:
+                logging.warning(f"Thumbnail for {item_id} failed: {e}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            done = sum(pool.map(build, item_ids))
+        logging.info(f"Precomputed {done}/{len(item_ids)} thumbnails into {self.cache_dir}")
+        return done
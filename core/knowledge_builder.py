@@ -1,42 +1,179 @@
 import pandas as pd
 import json
+import hashlib
+import logging
+import os
+import re
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from deepseek_api import DeepSeekAPI
+import yaml
 from pathlib import Path
+from .ann_index import DEFAULT_INDEX_CONFIG, add_vectors, build_index, evaluate_index, remove_ids
+from .encoder import get_encoder, load_encoder_config
+from .enrichment import ChatCompletionsClient, DeepSeekClient, EnrichmentPipeline
+
+STRUCTURE_PROMPT = """请将以下英文服装咨询对话转换为结构化中文数据：
+
+原始对话：
+{text}
+
+要求：
+1. 所有内容必须使用中文
+2. 提取字段包括：
+   - 用户需求（1-2句概括）
+   - 推荐款式（列表）
+   - 面料建议（列表）
+   - 关键特征（字典：长度/领口/袖长）
+   - 相关产品（列表：名称+关键属性）
+   - 场景标签（至少3个分类标签）
+
+输出格式（严格JSON格式，不要注释）：
+{{
+    "用户需求": "",
+    "推荐款式": [],
+    "面料建议": [],
+    "关键特征": {{"长度":"", "领口":"", "袖长":""}},
+    "相关产品": [{{"名称":"", "颜色":"", "材质":""}}],
+    "场景标签": []
+}}"""
+
+DEFAULT_ENRICHMENT_CONFIG = {
+    "model": "deepseek-chat",
+    "api_key_env": "DEEPSEEK_API_KEY",
+    "base_url": None,          # 设为 OpenAI 兼容地址（如本地桩服务）时改用 HTTP 客户端
+    "max_workers": 4,
+    "rate_limit_per_sec": 2.0,
+    "max_retries": 3,          # API调用失败重试次数
+    "backoff_base": 1.0,
+    "backoff_max": 30.0,
+    "journal_file": "enrichment_journal.jsonl",  # 位于 output_dir 下；None 关闭续跑日志
+}
 
 class KnowledgeBuilder:
-    def __init__(self, config_path="configs/model_config.yaml"):
+    def __init__(self, config_path="configs/model_config.yaml", llm_client=None, encoder=None):
         self.config = self._load_config(config_path)
-        self.encoder = SentenceTransformer(self.config["encoder_model"])
+        # 进程内共享的 CPU 编码器（core.encoder），与 EnhancedFashionRAG 共用同一实例
+        self.encoder = encoder if encoder is not None else get_encoder(self.config["encoder"])
+        self.llm_client = llm_client  # 可替换的 LLM 客户端：client(prompt) -> str
         
     def _load_config(self, path):
         # 加载配置逻辑
-        return {
+        config = {
             "encoder_model": "paraphrase-multilingual-MiniLM-L12-v2",
-            "index_dim": 384
+            "index_dim": 384,
+            "index": dict(DEFAULT_INDEX_CONFIG),
+            "enrichment": dict(DEFAULT_ENRICHMENT_CONFIG),
+            "encoder": load_encoder_config(path),
         }
+        if Path(path).exists():
+            with open(path, encoding="utf-8") as f:
+                raw = yaml.safe_load(f) or {}
+            config["encoder_model"] = config["encoder"]["model"]
+            config["index"].update(raw.get("index") or {})
+            config["enrichment"].update(raw.get("enrichment") or {})
+        return config
 
-    def build_from_csv(self, input_path, output_dir="knowledge"):
-        """从原始对话构建知识库"""
+    def build_from_csv(self, input_path, output_dir="knowledge", incremental=False):
+        """从原始对话构建知识库；incremental=True 时只处理新增或变更的对话"""
         # 数据清洗与转换
         df = pd.read_csv(input_path)
-        structured_data = self._process_with_llm(df)
+        df["content_hash"] = self._content_hashes(df)
+        df = df.drop_duplicates("content_hash").reset_index(drop=True)
+        if incremental and Path(f"{output_dir}/manifest.json").exists():
+            return self._update_knowledge(df, output_dir)
+
+        structured_data = self._process_with_llm(df, output_dir)
+        if structured_data.empty:
+            raise ValueError("No dialogs were enriched; nothing to build")
+        structured_data.insert(0, "kb_id", np.arange(len(structured_data), dtype="int64"))
         
         # 向量索引构建
         embeddings = self._generate_embeddings(structured_data)
-        index = self._build_faiss_index(embeddings)
+        index = self._build_faiss_index(embeddings, ids=structured_data["kb_id"].values)
         
         # 保存结果
-        self._save_knowledge(structured_data, index, output_dir)
+        self._save_knowledge(structured_data, index, output_dir, embeddings)
         return structured_data
 
+    @staticmethod
+    def _content_hashes(df):
+        # 以原始对话各列内容计算哈希，用于识别新增/变更行
+        columns = [c for c in df.columns if c != "content_hash"]
+        return [
+            hashlib.sha1(json.dumps([str(v) for v in row], ensure_ascii=False).encode("utf-8")).hexdigest()
+            for row in df[columns].itertuples(index=False)
+        ]
+
+    def _update_knowledge(self, df, output_dir):
+        """增量更新：只对新增行做结构化与编码，并从索引中移除已失效的 id"""
+        with open(f"{output_dir}/manifest.json", encoding="utf-8") as f:
+            manifest = json.load(f)
+        knowledge = pd.read_csv(f"{output_dir}/structured_kb.csv")
+        embeddings = np.load(f"{output_dir}/kb_embeddings.npy")
+        index = faiss.read_index(f"{output_dir}/kb_index.index")
+
+        known = manifest["hashes"]
+        current = set(df["content_hash"])
+        new_rows = df[~df["content_hash"].isin(list(known))]
+        stale_ids = [kb_id for h, kb_id in known.items() if h not in current]
+        if new_rows.empty and not stale_ids:
+            return knowledge
+
+        keep = ~knowledge["kb_id"].isin(stale_ids).values
+        knowledge, embeddings = knowledge[keep], embeddings[keep]
+        added = self._process_with_llm(new_rows, output_dir) if not new_rows.empty else pd.DataFrame()
+        if not added.empty:
+            new_ids = np.arange(manifest["next_id"], manifest["next_id"] + len(added), dtype="int64")
+            added.insert(0, "kb_id", new_ids)
+            new_embeddings = np.asarray(self._generate_embeddings(added), dtype="float32")
+            add_vectors(index, new_embeddings, new_ids, self.config["index"]["metric"])
+            knowledge = pd.concat([knowledge, added], ignore_index=True)
+            embeddings = np.concatenate([embeddings, new_embeddings])
+
+        if not remove_ids(index, stale_ids):
+            # 底层索引不支持删除时，用已保存的向量重建，无需重新编码
+            index, _ = build_index(embeddings, self.config["index"], ids=knowledge["kb_id"].values)
+        self.index_report = None
+        self._save_knowledge(knowledge.reset_index(drop=True), index, output_dir, embeddings)
+        return knowledge
 
-    DEEPSEEK_API_KEY = "your_api_key_here"
-    MAX_RETRIES = 3  # API调用失败重试次数
-    
+    def _process_with_llm(self, df, output_dir):
+        """并发调用 LLM 将对话结构化，结果按输入行顺序返回（含 content_hash 列）
 
+        结构化失败的对话不返回，也就不会写入 manifest，下次构建时重试。
+        """
+        column = "message" if "message" in df.columns else "messages"
+        cleaned = df[column].astype(str).apply(self.clean_message)
+        keys = df["content_hash"] if "content_hash" in df.columns else self._content_hashes(df)
+        prompts = {key: STRUCTURE_PROMPT.format(text=text) for key, text in zip(keys, cleaned)}
+
+        results = self._enrichment_pipeline(output_dir).run(prompts)
+        enriched = [key for key in keys if results.get(key)]
+        if len(enriched) < len(keys):
+            logging.warning(f"{len(keys) - len(enriched)} dialogs failed enrichment; they will be retried next build")
+        rows = [{**self._flatten_result(results[key]), "content_hash": key} for key in enriched]
+        return pd.DataFrame(rows)
+
+    def _enrichment_pipeline(self, output_dir):
+        cfg = self.config["enrichment"]
+        client = self.llm_client
+        if client is None:
+            api_key = os.environ.get(cfg["api_key_env"], "")
+            if cfg.get("base_url"):
+                client = ChatCompletionsClient(cfg["base_url"], cfg["model"], api_key)
+            else:
+                client = DeepSeekClient(api_key, cfg["model"])
+        return EnrichmentPipeline(
+            client,
+            journal_path=Path(output_dir) / cfg["journal_file"] if cfg.get("journal_file") else None,
+            max_workers=cfg["max_workers"],
+            rate_limit=cfg["rate_limit_per_sec"],
+            max_retries=cfg["max_retries"],
+            backoff_base=cfg["backoff_base"],
+            backoff_max=cfg["backoff_max"],
+        )
+
+    @staticmethod
     def clean_message(text):
         # 修复常见拼写错误
         corrections = {
@@ -51,76 +188,15 @@ class KnowledgeBuilder:
         # 统一格式符号
         text = re.sub(r":--(.*?)--:", r"【\1】", text)  # 中文标点标准化
         return text
-    
-
-    def process_with_deepseek(text):
-        prompt = f"""请将以下英文服装咨询对话转换为结构化中文数据：
-    
-                      原始对话：
-                      {text}
-                      
-                      要求：
-                      1. 所有内容必须使用中文
-                      2. 提取字段包括：
-                         - 用户需求（1-2句概括）
-                         - 推荐款式（列表）
-                         - 面料建议（列表）
-                         - 关键特征（字典：长度/领口/袖长）
-                         - 相关产品（列表：名称+关键属性）
-                         - 场景标签（至少3个分类标签）
-                      
-                      输出格式（严格JSON格式，不要注释）：
-                      {{
-                          "用户需求": "",
-                          "推荐款式": [],
-                          "面料建议": [],
-                          "关键特征": {{"长度":"", "领口":"", "袖长":""}},
-                          "相关产品": [{{"名称":"", "颜色":"", "材质":""}}],
-                          "场景标签": []
-                      }}"""
-    
-        for _ in range(MAX_RETRIES):
-            try:
-                response = DeepSeekAPI.chat(
-                    api_key=DEEPSEEK_API_KEY,
-                    model="deepseek-chat",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.2
-                )
-                cleaned_response = response.replace("，", ",").replace("：", ":")  # 统一符号
-                return json.loads(cleaned_response)
-            except json.JSONDecodeError:
-                print("JSON解析失败，尝试重新生成...")
-                continue
-            except Exception as e:
-                print(f"API调用失败：{str(e)}")
-                continue
-        return {}
-    
-
-    # 读取原始数据
-    df = pd.read_csv("input.csv")  # 列名应为message
-    
-    # 清洗数据
-    df["cleaned_message"] = df["message"].apply(clean_message)
-    
-    # 处理前3条示例（实际使用时移除.head(3)）
-    results = []
-    for idx, msg in df["cleaned_message"].head(3).items():
-        print(f"Processing message {idx+1}...")
-        result = process_with_deepseek(msg)
-        results.append(result)
-        print(f"Result: {json.dumps(result, ensure_ascii=False)}")
-    
-
-    structured_data = []
-    for item in results:
+
+    @staticmethod
+    def _flatten_result(item):
         # 处理嵌套结构
         products = []
         for p in item.get("相关产品", []):
             products.append(f"{p.get('名称','')}（颜色：{p.get('颜色','')}，材质：{p.get('材质','')}）")
         
-        structured_data.append({
+        return {
             "用户需求": item.get("用户需求", ""),
             "推荐款式": "；".join(item.get("推荐款式", [])),
             "适用面料": "；".join(item.get("面料建议", [])),
@@ -129,22 +205,47 @@ class KnowledgeBuilder:
             "袖长类型": item.get("关键特征", {}).get("袖长", ""),
             "推荐产品": "；".join(products),
             "适用场景": "；".join(item.get("场景标签", []))
-        })
-    
+        }
 
-    final_df = pd.DataFrame(structured_data)
-    final_df.to_csv("中文知识库.csv", index=False, encoding='utf_8_sig')  # 保证中文编码
-  
     def _generate_embeddings(self, data):
-        texts = data.apply(lambda x: f"{x['用户需求']} {x['场景标签']}", axis=1)
+        # 与结构化后的列名一致（见 _flatten_result）：用户需求 + 适用场景
+        texts = data["用户需求"].astype(str) + " " + data["适用场景"].astype(str)
         return self.encoder.encode(texts.tolist())
 
-    def _build_faiss_index(self, embeddings):
-        index = faiss.IndexFlatL2(self.config["index_dim"])
-        index.add(np.array(embeddings).astype("float32"))
+    def _build_faiss_index(self, embeddings, ids=None):
+        """按配置构建索引（flat / ivf_flat / hnsw / ivf_pq），并对比精确检索生成评估报告"""
+        index, index_type = build_index(embeddings, self.config["index"], ids=ids)
+        self.index_report = evaluate_index(index, embeddings, self.config["index"], index_type, ids=ids)
         return index
 
-    def _save_knowledge(self, data, index, output_dir):
+    def _save_knowledge(self, data, index, output_dir, embeddings=None):
         Path(output_dir).mkdir(exist_ok=True)
         data.to_csv(f"{output_dir}/structured_kb.csv", index=False)
         faiss.write_index(index, f"{output_dir}/kb_index.index")
+        if embeddings is not None:
+            # 向量与 structured_kb.csv 行对齐保存，增量更新时无需重新编码
+            np.save(f"{output_dir}/kb_embeddings.npy", np.asarray(embeddings, dtype="float32"))
+        if "content_hash" in data.columns:
+            manifest = {
+                "hashes": dict(zip(data["content_hash"], data["kb_id"].astype(int))),
+                "next_id": int(data["kb_id"].max()) + 1 if len(data) else 0,
+            }
+            with open(f"{output_dir}/manifest.json", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, ensure_ascii=False)
+        if getattr(self, "index_report", None):
+            with open(f"{output_dir}/index_report.json", "w", encoding="utf-8") as f:
+                json.dump(self.index_report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the fashion knowledge base from raw dialogs")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", default="knowledge")
+    parser.add_argument("--config", default="configs/model_config.yaml")
+    parser.add_argument("--incremental", action="store_true", help="only process new or changed dialogs")
+    args = parser.parse_args()
+
+    KnowledgeBuilder(args.config).build_from_csv(args.input, args.output, incremental=args.incremental)
@@ -0,0 +1,108 @@
+import copy
+import logging
+import threading
+import time
+import torch
+from .metrics import CACHE_REQUESTS, REGISTRY
+
+PREFIX_TOKENS = REGISTRY.gauge(
+    "fashion_prefix_cache_tokens", "Tokens in the cached few-shot prompt prefix.")
+PREFIX_PREFILL_SECONDS = REGISTRY.gauge(
+    "fashion_prefix_cache_prefill_seconds", "Prefill time of the cached prefix, skipped on every hit.")
+
+
+class _Entry:
+    __slots__ = ("text", "input_ids", "past_key_values", "prefill_seconds")
+
+    def __init__(self, text, input_ids, past_key_values, prefill_seconds):
+        self.text = text
+        self.input_ids = input_ids
+        self.past_key_values = past_key_values
+        self.prefill_seconds = prefill_seconds
+
+
+class PrefixCache:
+    """共享提示前缀（few-shot 示例）的 KV 缓存：前缀只 prefill 一次，请求只对自己的后缀做 prefill
+
+    前缀与后缀分别分词后拼接；前缀以换行结尾，与整体分词的结果一致。
+    """
+
+    def __init__(self, model, tokenizer, max_length=1500):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self._entry = None
+        self._lock = threading.Lock()
+
+    @property
+    def prefix(self):
+        entry = self._entry
+        return entry.text if entry is not None else None
+
+    def stats(self):
+        entry = self._entry
+        if entry is None:
+            return {"prefix_tokens": 0, "prefill_ms": 0.0}
+        return {"prefix_tokens": entry.input_ids.shape[1], "prefill_ms": entry.prefill_seconds * 1000}
+
+    def build(self, text):
+        """计算 text 的 KV 缓存；text 未变化时直接返回，为空或超过 max_length 时清空缓存"""
+        with self._lock:
+            current = self._entry
+            if current is not None and current.text == text:
+                return current
+            entry = None
+            if text:
+                input_ids = self.tokenizer(text, return_tensors="pt")["input_ids"].to(self.model.device)
+                if input_ids.shape[1] < self.max_length:
+                    started = time.perf_counter()
+                    with torch.no_grad():
+                        outputs = self.model(input_ids=input_ids, use_cache=True)
+                    entry = _Entry(text, input_ids, outputs.past_key_values, time.perf_counter() - started)
+                    logging.info(f"Prefix KV cache built: {input_ids.shape[1]} tokens "
+                                 f"in {entry.prefill_seconds * 1000:.1f}ms")
+                else:
+                    logging.warning(f"Prompt prefix ({input_ids.shape[1]} tokens) does not fit max_length "
+                                    f"{self.max_length}; prefix KV cache disabled.")
+            self._entry = entry
+            PREFIX_TOKENS.set(entry.input_ids.shape[1] if entry is not None else 0)
+            PREFIX_PREFILL_SECONDS.set(entry.prefill_seconds if entry is not None else 0.0)
+            return entry
+
+    def prepare(self, prompts):
+        """为一批提示构造 generate 输入；有提示不以缓存前缀开头时返回 None，由调用方走普通分词
+
+        返回的 input_ids 为 [前缀][填充][后缀]：前缀在所有行位置一致，填充位于前缀之后，
+        由 attention_mask 屏蔽；past_key_values 是按批大小复制出的副本，generate 可以就地修改。
+        """
+        entry = self._entry
+        if entry is None or not all(p.startswith(entry.text) for p in prompts):
+            CACHE_REQUESTS.inc(len(prompts), cache="prefix_kv", result="miss")
+            return None
+        prefix_len = entry.input_ids.shape[1]
+        suffixes = self.tokenizer(
+            [p[len(entry.text):] for p in prompts], add_special_tokens=False,
+            truncation=True, max_length=self.max_length - prefix_len,
+        )["input_ids"]
+        width = max(1, max(len(s) for s in suffixes))
+        pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else 0
+        rows, masks = [], []
+        for suffix in suffixes:
+            if not suffix:
+                # 后缀为空时补一个 token：generate 至少要对一个未缓存的位置做前向
+                suffix = [pad_id]
+            padding = width - len(suffix)
+            rows.append([pad_id] * padding + suffix)
+            masks.append([0] * padding + [1] * len(suffix))
+        device = entry.input_ids.device
+        suffix_ids = torch.tensor(rows, dtype=entry.input_ids.dtype, device=device)
+        input_ids = torch.cat([entry.input_ids.expand(len(prompts), -1), suffix_ids], dim=1)
+        attention_mask = torch.cat([
+            torch.ones((len(prompts), prefix_len), dtype=torch.long, device=device),
+            torch.tensor(masks, dtype=torch.long, device=device),
+        ], dim=1)
+        past_key_values = copy.deepcopy(entry.past_key_values)
+        if len(prompts) > 1:
+            past_key_values.batch_repeat_interleave(len(prompts))
+        CACHE_REQUESTS.inc(len(prompts), cache="prefix_kv", result="hit")
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "past_key_values": past_key_values}
@@ -0,0 +1,209 @@
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+import numpy as np
+from .encoder import encoder_id
+
+INDEX_VERSION = 1  # 商品文本格式或量化方式变化时递增
+DTYPES = ("int8", "float16")
+VECTORS_FILE = "vectors.npy"
+SCALES_FILE = "scales.npy"
+META_FILE = "product_index_meta.json"
+SEARCH_CHUNK_ROWS = 4096  # 检索时每次转换为 float32 的行数：限制临时内存，且块留在 CPU 缓存内
+
+
+def product_texts(catalog, rows):
+    """商品名 + 属性拼成编码文本，如 "Puma Men Black Tshirts | men tshirts | black | summer casual" """
+    df = catalog.to_dataframe(rows)
+    names = df["productDisplayName"] if "productDisplayName" in df else [""] * len(df)
+    texts = []
+    for name, record in zip(names, df.to_dict("records")):
+        kind = " ".join(str(record.get(col) or "") for col in ("gender", "articleType")).strip()
+        when = " ".join(str(record.get(col) or "") for col in ("season", "usage")).strip()
+        parts = [str(name or ""), kind.lower(), ", ".join(record["baseColour"]), when.lower()]
+        texts.append(" | ".join(p for p in parts if p))
+    return texts
+
+
+def quantize(embeddings, dtype="int8"):
+    """L2 归一化后量化，返回 (编码, 每行缩放系数)；float16 没有缩放系数"""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported product index dtype: {dtype}")
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms > 0, norms, 1)
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    # 对称逐行量化：每行最大绝对值映射到 127
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class ProductEmbeddingIndex:
+    """商品向量索引：int8（逐行缩放）或 float16 存为 .npy，以 mmap 只读加载
+
+    行号与 CompactCatalog 行号一致，可直接与属性过滤得到的行号组合；
+    检索分块转换为 float32 计算余弦相似度，内存中不会出现完整的 float32 副本。
+    """
+
+    def __init__(self, vectors, scales=None, meta=None):
+        self.vectors = vectors
+        self.scales = scales
+        self.meta = meta or {}
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1]
+
+    @classmethod
+    def build(cls, catalog, encoder, directory, dtype="int8", batch_size=1024, encoder_model=None):
+        """逐批编码并写入预分配的 .npy 映射文件，峰值内存与批大小相当而与目录行数无关
+
+        encoder_model 默认为 encoder_id(encoder)，加载时据此检查查询编码器是否一致。
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported product index dtype: {dtype}")
+        if len(catalog) == 0:
+            raise ValueError("Cannot build a product index for an empty catalog")
+        directory = Path(directory)
+        tmp = directory.with_name(f"{directory.name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        vectors = scales = None
+        for start in range(0, len(catalog), batch_size):
+            stop = min(start + batch_size, len(catalog))
+            embeddings = encoder.encode(product_texts(catalog, np.arange(start, stop)))
+            codes, row_scales = quantize(embeddings, dtype)
+            if vectors is None:
+                vectors = np.lib.format.open_memmap(tmp / VECTORS_FILE, mode="w+", dtype=codes.dtype,
+                                                    shape=(len(catalog), codes.shape[1]))
+                if row_scales is not None:
+                    scales = np.lib.format.open_memmap(tmp / SCALES_FILE, mode="w+", dtype=np.float32,
+                                                       shape=(len(catalog),))
+            vectors[start:stop] = codes
+            if scales is not None:
+                scales[start:stop] = row_scales
+            if start // batch_size % 100 == 0:
+                logging.info(f"Encoded {stop}/{len(catalog)} products")
+        vectors.flush()
+        if scales is not None:
+            scales.flush()
+        meta = {
+            "version": INDEX_VERSION,
+            "dtype": dtype,
+            "dim": int(vectors.shape[1]),
+            "rows": len(catalog),
+            "encoder_model": encoder_model or encoder_id(encoder),
+            "catalog_fingerprint": catalog.fingerprint(),
+        }
+        with open(tmp / META_FILE, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        del vectors, scales
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp, directory)
+        logging.info(f"Product index written to {directory}: {meta['rows']} x {meta['dim']} {dtype}")
+        return cls.load(directory)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """mmap=True 时向量只读映射，多个 worker 共享页缓存"""
+        directory = Path(directory)
+        with open(directory / META_FILE, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Product index version {meta.get('version')} is not supported; rebuild it")
+        mode = "r" if mmap else None
+        vectors = np.load(directory / VECTORS_FILE, mmap_mode=mode, allow_pickle=False)
+        scales_path = directory / SCALES_FILE
+        scales = np.load(scales_path, mmap_mode=mode, allow_pickle=False) if scales_path.exists() else None
+        return cls(vectors, scales, meta)
+
+    def matches(self, catalog):
+        """索引是否为该目录构建（行号对齐）"""
+        return self.meta.get("catalog_fingerprint") == catalog.fingerprint()
+
+    def check_compatible(self, catalog, encoder):
+        """目录、向量维度与编码器（模型 + 后端）都须与构建时一致，否则抛出 ValueError"""
+        if not self.matches(catalog):
+            raise ValueError("Product index was built for a different catalog; rebuild it")
+        if encoder is None:
+            raise ValueError("Searching the product index needs the query encoder it was built with")
+        dim = getattr(encoder, "dim", None)
+        if dim is not None and dim != self.dim:
+            raise ValueError(f"Product index has {self.dim}-d vectors but the query encoder outputs {dim}-d")
+        built_with = self.meta.get("encoder_model")
+        if built_with != encoder_id(encoder):
+            raise ValueError(f"Product index was built with encoder {built_with!r}, "
+                             f"but queries use {encoder_id(encoder)!r}; rebuild it")
+
+    def similarity(self, query, rows=None, chunk_rows=SEARCH_CHUNK_ROWS):
+        """查询向量与指定行（默认全部）的余弦相似度，按 rows 顺序返回 float32 数组"""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        n = len(self) if rows is None else len(rows)
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, chunk_rows):
+            block = slice(start, min(start + chunk_rows, n))
+            selected = block if rows is None else rows[block]
+            scores = self.vectors[selected].astype(np.float32) @ query
+            if self.scales is not None:
+                scores *= self.scales[selected]
+            out[block] = scores
+        return out
+
+    def search(self, query, k=10, rows=None):
+        """返回 (行号, 相似度)，按相似度降序；给定 rows 时只在这些行（如属性过滤结果）中检索"""
+        candidates = np.arange(len(self)) if rows is None else np.asarray(rows)
+        scores = self.similarity(query, None if rows is None else candidates)
+        if k < len(candidates):
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        order = top[np.lexsort((candidates[top], -scores[top]))]
+        return candidates[order], scores[order]
+
+    def stats(self):
+        nbytes = self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+        return {
+            "rows": len(self),
+            "dim": self.dim,
+            "dtype": self.meta.get("dtype", str(self.vectors.dtype)),
+            "bytes": int(nbytes),
+            "float32_bytes": int(len(self) * self.dim * 4),
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import yaml
+    from .catalog import CompactCatalog
+    from .encoder import get_encoder, load_encoder_config
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Embed every catalog item into a memory-mapped product index")
+    parser.add_argument("--snapshot-dir", default=os.path.join("data", "snapshot"),
+                        help="catalog snapshot written by rag_pipeline.py")
+    parser.add_argument("--output", default=None, help="index directory (default <snapshot-dir>/product_index)")
+    parser.add_argument("--config", default="configs/model_config.yaml")
+    args = parser.parse_args()
+
+    config = {"dtype": "int8", "batch_size": 1024}
+    if os.path.exists(args.config):
+        with open(args.config, encoding="utf-8") as f:
+            config.update((yaml.safe_load(f) or {}).get("product_index") or {})
+    ProductEmbeddingIndex.build(
+        CompactCatalog.load(args.snapshot_dir, mmap=True),
+        get_encoder(load_encoder_config(args.config)),
+        args.output or os.path.join(args.snapshot_dir, "product_index"),
+        dtype=config["dtype"],
+        batch_size=config["batch_size"],
+    )
@@ -1,11 +1,22 @@
 # rag_pipeline.py
 import pandas as pd
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
-from datasets import load_dataset
 import os
 import re
+import gc
+import json
+import functools
+import threading
+import time
+import weakref
 import logging # Use logging instead of print for server apps
+import yaml
+from core.catalog import CompactCatalog
+from core.attribute_index import AttributeIndex
+from core.image_store import get_resolver
+from core.context_builder import ContextBuilder, estimate_tokens
+from core.response_cache import normalize_request
+from core.metrics import GENERATED_TOKENS, PROMPT_TOKENS, REGISTRY, RETRIEVED_CANDIDATES, span
+# torch / transformers / datasets are imported lazily by the loaders below
 
 logging.basicConfig(level=logging.INFO)
 
@@ -17,83 +28,521 @@ KAGGLE_CSV_PATH = os.path.join('data', 'styles.csv') # If you include CSV in rep
 KAGGLE_IMAGES_DIR = 'fashion-product-images-small/images' # Relative path example
 # OR KAGGLE_IMAGES_DIR = '/path/on/server/to/fashion-product-images-small/images'
 
+# 离线快照：预处理后的目录 + 倒排索引 + 格式化好的 few-shot 文本
+SNAPSHOT_DIR = os.path.join('data', 'snapshot')
+FEW_SHOT_FILE = 'few_shot.txt'
+
+MODEL_CONFIG_PATH = os.path.join('configs', 'model_config.yaml')
+
+def _load_generation_config(path=MODEL_CONFIG_PATH):
+    """读取生成与微批调度配置"""
+    config = {
+        "max_length": 1500,
+        "stream_max_concurrency": 4,
+        "prefix_cache": True,
+        "context": {"max_items": 10, "max_tokens": 400},
+        "scheduler": {"enabled": True, "max_batch_size": 8, "max_wait_ms": 20, "timeout_s": 120},
+        "generate_kwargs": {"max_new_tokens": 400},
+    }
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            raw = (yaml.safe_load(f) or {}).get('generation') or {}
+        config["max_length"] = raw.get("max_length", config["max_length"])
+        config["stream_max_concurrency"] = raw.get("stream_max_concurrency", config["stream_max_concurrency"])
+        config["prefix_cache"] = raw.get("prefix_cache", config["prefix_cache"])
+        config["scheduler"].update(raw.get("scheduler") or {})
+        config["context"].update(raw.get("context") or {})
+        config["generate_kwargs"].update(raw.get("generate_kwargs") or {})
+    return config
+
+GENERATION_CONFIG = _load_generation_config()
+
+def _load_serving_config(path=MODEL_CONFIG_PATH):
+    """读取多 worker 部署配置"""
+    config = {"workers": 2, "mmap": True, "preload_llm": "auto", "torch_threads": None}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            config.update((yaml.safe_load(f) or {}).get('serving') or {})
+    return config
+
+SERVING_CONFIG = _load_serving_config()
+
 # --- Mapping Rules (Keep these) ---
 SKIN_TONE_COLOR_MAP = { ... }
 # ... other helper functions ...
 
 # --- Load Data and Models (Load ONCE at startup) ---
-try:
-    logging.info("Loading Kaggle product data...")
-    product_df = pd.read_csv(KAGGLE_CSV_PATH, on_bad_lines='skip')
-    product_df['image_path'] = product_df['id'].apply(lambda x: os.path.join(KAGGLE_IMAGES_DIR, str(x) + '.jpg'))
-    product_df = product_df.dropna(subset=['gender', 'baseColour', 'season', 'articleType', 'productDisplayName'])
-    logging.info(f"Loaded Kaggle product data: {product_df.shape[0]} rows")
-except FileNotFoundError:
-    logging.error(f"FATAL ERROR: Kaggle CSV not found at {KAGGLE_CSV_PATH}. Exiting.")
-    product_df = None # Or raise SystemExit
-except Exception as e:
-    logging.error(f"An error occurred loading Kaggle data: {e}")
-    product_df = None # Or raise SystemExit
-
-try:
-    logging.info("Loading Hugging Face dataset for few-shot examples...")
-    hf_dataset = load_dataset("dvilasuero/clothes-assistant")
-    few_shot_prompt_examples = format_hf_examples_for_prompt(hf_dataset, num_examples=2) # Call your formatting function
-    logging.info("Few-shot examples prepared.")
-except Exception as e:
-    logging.warning(f"Could not load or process HF dataset: {e}")
-    hf_dataset = None
-    few_shot_prompt_examples = "" # Ensure it's an empty string if failed
-
-try:
-    logging.info("Loading LLM model and tokenizer...")
-    model_id = "google/gemma-2b-it" # Or your chosen model
-    # Optional quantization config
-    # bnb_config = BitsAndBytesConfig(...)
-
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model = AutoModelForCausalLM.from_pretrained(
-        model_id,
-        device_map="auto",
-        torch_dtype=torch.bfloat16,
-        # quantization_config=bnb_config # Uncomment if needed
-    )
-    logging.info(f"LLM ({model_id}) loaded successfully.")
-except Exception as e:
-    logging.error(f"FATAL ERROR: Could not load LLM model/tokenizer: {e}. Exiting.")
-    model = None
-    tokenizer = None
-    # raise SystemExit # Stop the app if model can't load
+# 倒排索引保存在 CSV 旁边，指纹不一致时重建
+ATTRIBUTE_INDEX_PATH = os.path.splitext(KAGGLE_CSV_PATH)[0] + '.attr_index.npz'
+MODEL_ID = "google/gemma-2b-it" # Or your chosen model
+
+product_df = None       # 只在从 CSV 加载时保留；快照启动不再构建 DataFrame
+product_catalog = None
+attribute_index = None
+product_fingerprint = None
+hf_dataset = None
+few_shot_prompt_examples = ""
+model_id = MODEL_ID
+model = None
+tokenizer = None
+generation_scheduler = None
+prefix_cache = None
+_prefix_lock = threading.Lock()
+image_resolver = get_resolver(KAGGLE_IMAGES_DIR)  # 首次查询时扫描图片目录
+
+# 组件状态：pending → loading → ready / failed；/ready 直接读取
+_status = {"catalog": "pending", "few_shot": "pending", "llm": "pending"}
+_status_lock = threading.Lock()
+_ready_event = threading.Event()
+
+def _set_status(component, status):
+    with _status_lock:
+        _status[component] = status
+        if _status["catalog"] == "ready" and _status["llm"] == "ready":
+            _ready_event.set()
+        else:
+            _ready_event.clear()
+
+def readiness():
+    """各组件加载状态；catalog 与 llm 就绪即可服务，few_shot 失败时降级为空示例"""
+    with _status_lock:
+        return dict(_status)
+
+def is_ready():
+    return _ready_event.is_set()
+
+def wait_until_ready(timeout=None):
+    return _ready_event.wait(timeout)
+
+def load_catalog(csv_path=KAGGLE_CSV_PATH, index_path=ATTRIBUTE_INDEX_PATH, snapshot_dir=None, mmap=False):
+    """(重新)加载商品目录，并保证属性倒排索引与之同步；给定快照目录时直接加载快照
+
+    mmap=True 时快照数组只读映射，多个 worker 共享页缓存。
+    """
+    global product_df, product_catalog, attribute_index, product_fingerprint
+    _set_status("catalog", "loading")
+    df = None
+    try:
+        if snapshot_dir and os.path.exists(os.path.join(snapshot_dir, 'catalog_meta.json')):
+            logging.info(f"Loading catalog snapshot from {snapshot_dir}...")
+            catalog = CompactCatalog.load(snapshot_dir, mmap=mmap)
+            index = _load_or_build_index(catalog, os.path.join(snapshot_dir, 'attr_index.npz'))
+        else:
+            logging.info("Loading Kaggle product data...")
+            df = pd.read_csv(csv_path, on_bad_lines='skip')
+            df = df.dropna(subset=['gender', 'baseColour', 'season', 'articleType', 'productDisplayName'])
+            # 图片路径不再按行拼接，检索结果出来后再查 image_resolver
+            catalog = CompactCatalog.from_dataframe(df, keep_columns=['productDisplayName'])
+            index = _load_or_build_index(catalog, index_path)
+        logging.info(f"Loaded Kaggle product data: {len(catalog)} rows")
+    except FileNotFoundError:
+        logging.error(f"FATAL ERROR: Kaggle CSV not found at {csv_path}. Exiting.")
+        df = catalog = index = None # Or raise SystemExit
+    except Exception as e:
+        logging.error(f"An error occurred loading Kaggle data: {e}")
+        df = catalog = index = None # Or raise SystemExit
+    product_df, product_catalog, attribute_index = df, catalog, index
+    product_fingerprint = index.fingerprint if index is not None else None
+    _set_status("catalog", "ready" if catalog is not None else "failed")
+    return product_catalog
+
+def _load_or_build_index(catalog, index_path):
+    if os.path.exists(index_path):
+        index = AttributeIndex.load(index_path)
+        if index.fingerprint == catalog.fingerprint():
+            for skin_tone, colours in SKIN_TONE_COLOR_MAP.items():
+                index.add_colour_group(skin_tone, colours)
+            logging.info(f"Loaded attribute index from {index_path}")
+            return index
+        logging.info("Attribute index is stale, rebuilding...")
+    # 肤色 → 颜色并集在构建时展开一次
+    index = AttributeIndex.build(catalog, colour_groups=SKIN_TONE_COLOR_MAP)
+    try:
+        index.save(index_path)
+        logging.info(f"Saved attribute index to {index_path}")
+    except OSError as e:
+        logging.warning(f"Could not save attribute index: {e}")
+    return index
+
+def load_few_shot(snapshot_dir=None):
+    """优先读取快照中的 few-shot 文本，缺失时才联网下载 HF 数据集"""
+    global hf_dataset, few_shot_prompt_examples
+    _set_status("few_shot", "loading")
+    few_shot_path = os.path.join(snapshot_dir, FEW_SHOT_FILE) if snapshot_dir else None
+    if few_shot_path and os.path.exists(few_shot_path):
+        with open(few_shot_path, encoding='utf-8') as f:
+            few_shot_prompt_examples = f.read()
+        _set_status("few_shot", "ready")
+        refresh_prefix_cache()
+        return few_shot_prompt_examples
+    try:
+        from datasets import load_dataset
+        logging.info("Loading Hugging Face dataset for few-shot examples...")
+        hf_dataset = load_dataset("dvilasuero/clothes-assistant")
+        few_shot_prompt_examples = format_hf_examples_for_prompt(hf_dataset, num_examples=2) # Call your formatting function
+        logging.info("Few-shot examples prepared.")
+        _set_status("few_shot", "ready")
+    except Exception as e:
+        logging.warning(f"Could not load or process HF dataset, prompts will have no few-shot examples: {e}")
+        hf_dataset = None
+        few_shot_prompt_examples = "" # Ensure it's an empty string if failed
+        _set_status("few_shot", "failed")
+    refresh_prefix_cache()
+    return few_shot_prompt_examples
+
+def load_llm(start_scheduler=True):
+    """加载 LLM；预加载（fork 之前）时不启动调度线程，由各 worker 在 after_fork 中启动"""
+    global model, tokenizer, generation_scheduler, prefix_cache
+    _set_status("llm", "loading")
+    try:
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
+        logging.info("Loading LLM model and tokenizer...")
+        # Optional quantization config
+        # bnb_config = BitsAndBytesConfig(...)
+
+        loaded_tokenizer = AutoTokenizer.from_pretrained(model_id)
+        loaded_model = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            device_map="auto",
+            torch_dtype=torch.bfloat16,
+            # quantization_config=bnb_config # Uncomment if needed
+        )
+        logging.info(f"LLM ({model_id}) loaded successfully.")
+    except Exception as e:
+        logging.error(f"FATAL ERROR: Could not load LLM model/tokenizer: {e}. Exiting.")
+        _set_status("llm", "failed")
+        return None
+        # raise SystemExit # Stop the app if model can't load
+
+    # few-shot 前缀的 KV 缓存，调度器与单条/流式生成共用
+    cache = None
+    if GENERATION_CONFIG.get("prefix_cache", True):
+        from core.prefix_cache import PrefixCache
+        cache = PrefixCache(loaded_model, loaded_tokenizer, max_length=GENERATION_CONFIG["max_length"])
+
+    # 并发请求在此排队，按批调用一次 model.generate
+    scheduler = None
+    if GENERATION_CONFIG["scheduler"].get("enabled", True):
+        from core.generation_scheduler import GenerationScheduler
+        scheduler = GenerationScheduler(
+            loaded_model,
+            loaded_tokenizer,
+            max_batch_size=GENERATION_CONFIG["scheduler"]["max_batch_size"],
+            max_wait_ms=GENERATION_CONFIG["scheduler"]["max_wait_ms"],
+            max_length=GENERATION_CONFIG["max_length"],
+            generate_kwargs=GENERATION_CONFIG["generate_kwargs"],
+            prefix_cache=cache,
+        )
+        if start_scheduler:
+            scheduler.start()
+    model, tokenizer, generation_scheduler, prefix_cache = loaded_model, loaded_tokenizer, scheduler, cache
+    refresh_prefix_cache()
+    if scheduler is not None:
+        REGISTRY.gauge(
+            "fashion_generation_queue_depth", "Prompts waiting for the generation scheduler."
+        ).set_function(lambda: scheduler.stats()["queue_depth"])
+    _set_status("llm", "ready")
+    return model
+
+def prompt_prefix():
+    """所有提示共享的静态前缀：few-shot 示例 + 任务标题"""
+    return f"{few_shot_prompt_examples}\n--- Current Task ---\n"
+
+def refresh_prefix_cache():
+    """few-shot 示例或模型变化后重算前缀 KV 缓存；前缀未变时不重复计算"""
+    cache = prefix_cache
+    if cache is None:
+        return None
+    try:
+        # 读取前缀与构建放在同一把锁内，并发的 few-shot / LLM 加载不会留下过期的前缀
+        with _prefix_lock:
+            return cache.build(prompt_prefix())
+    except Exception as e:
+        logging.warning(f"Could not build prefix KV cache, prompts will be prefilled in full: {e}")
+        return None
+
+def _model_inputs(prompt):
+    """单条提示的 generate 输入：命中前缀缓存时只需 prefill 后缀"""
+    inputs = prefix_cache.prepare([prompt]) if prefix_cache is not None else None
+    if inputs is None:
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=GENERATION_CONFIG["max_length"]).to(model.device)
+    return inputs
+
+def start(snapshot_dir=SNAPSHOT_DIR, background=True, preload=False):
+    """启动：目录与 few-shot 从快照同步加载（很快），LLM 在后台线程加载
+
+    preload=True 用于多 worker 部署（gunicorn --preload）：在 fork 之前同步加载全部只读组件，
+    不启动任何线程，由 prepare_fork / after_fork 完成其余步骤。
+    """
+    if preload:
+        return _preload(snapshot_dir)
+    load_catalog(snapshot_dir=snapshot_dir, mmap=SERVING_CONFIG["mmap"])
+    if snapshot_dir and os.path.exists(os.path.join(snapshot_dir, FEW_SHOT_FILE)):
+        load_few_shot(snapshot_dir)
+    else:
+        # 没有快照时下载可能很慢，放到后台
+        threading.Thread(target=load_few_shot, name="few-shot-loader", daemon=True).start()
+    if not background:
+        load_llm()
+        return None
+    loader = threading.Thread(target=load_llm, name="llm-loader", daemon=True)
+    loader.start()
+    return loader
+
+def _preload_llm():
+    # CUDA 上下文不能跨 fork 使用；有 GPU 时每个 worker 各自加载模型
+    setting = SERVING_CONFIG["preload_llm"]
+    if setting != "auto":
+        return bool(setting)
+    try:
+        import torch
+        return not torch.cuda.is_available()
+    except ImportError:
+        return False
+
+def _preload(snapshot_dir):
+    load_catalog(snapshot_dir=snapshot_dir, mmap=SERVING_CONFIG["mmap"])
+    load_few_shot(snapshot_dir)
+    image_resolver.refresh()
+    if _preload_llm():
+        load_llm(start_scheduler=False)
+    prepare_fork()
+    return None
+
+def prepare_fork():
+    """fork 之前调用：回收垃圾并冻结现存对象，子进程的 GC 不再遍历（写入）这些对象所在的页面"""
+    gc.collect()
+    gc.freeze()
+
+def after_fork(workers=1):
+    """每个 worker fork 之后调用：按 worker 数划分 torch 线程，启动调度线程，必要时加载 LLM"""
+    threads = SERVING_CONFIG["torch_threads"] or max(1, (os.cpu_count() or 1) // max(1, workers))
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    if model is None:
+        threading.Thread(target=load_llm, name="llm-loader", daemon=True).start()
+    elif generation_scheduler is not None:
+        generation_scheduler.start()
+
+def build_snapshot(snapshot_dir=SNAPSHOT_DIR, csv_path=KAGGLE_CSV_PATH):
+    """离线步骤：解析 styles.csv、构建倒排索引、下载并格式化 few-shot，写入快照目录"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    catalog = load_catalog(csv_path, index_path=os.path.join(snapshot_dir, 'attr_index.npz'))
+    if catalog is None:
+        raise RuntimeError(f"Could not load catalog from {csv_path}")
+    catalog.save(snapshot_dir)
+    load_few_shot()
+    if readiness()["few_shot"] == "ready":
+        with open(os.path.join(snapshot_dir, FEW_SHOT_FILE), 'w', encoding='utf-8') as f:
+            f.write(few_shot_prompt_examples)
+    else:
+        logging.warning("Snapshot written without few-shot examples.")
+    with open(os.path.join(snapshot_dir, 'snapshot_meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({"source_csv": csv_path, "rows": len(catalog), "fingerprint": catalog.fingerprint()}, f)
+    logging.info(f"Snapshot written to {snapshot_dir}")
+
+def pipeline_version():
+    """目录指纹 + 模型标识；任一变化时下游缓存应失效"""
+    return f"{product_fingerprint}:{model_id if model is not None else None}"
+
+# 调用方传入的其他目录（未同时传入索引时）各自的属性索引，随目录对象释放
+_catalog_indexes = weakref.WeakKeyDictionary()
+
+def _attribute_index_for(catalog):
+    """每个目录对象只构建一次属性索引"""
+    index = _catalog_indexes.get(catalog)
+    if index is None:
+        index = _catalog_indexes[catalog] = AttributeIndex.build(catalog, colour_groups=SKIN_TONE_COLOR_MAP)
+    return index
 
 # --- Core Functions (Keep these as they are, using global vars now) ---
-def retrieve_clothes(gender, skin_tone, season_input, max_results=10):
-    # Uses the global product_df
-    if product_df is None:
+def retrieve_clothes(gender, skin_tone, season_input, max_results=10, catalog=None, index=None):
+    # Uses the global product_catalog/attribute_index (or ones passed in directly)
+    catalog = catalog if catalog is not None else product_catalog
+    if catalog is None:
          logging.error("Product data not loaded, cannot retrieve.")
          return pd.DataFrame()
+    if index is None:
+        index = attribute_index if catalog is product_catalog else _attribute_index_for(catalog)
     logging.info(f"Retrieving for: Gender={gender}, Skin={skin_tone}, Season={season_input}")
-    # ... (rest of the retrieve_clothes function) ...
-    # Ensure it returns the dataframe
+    season = 'Fall' if season_input.lower() == 'autumn' else season_input
+    with span("retrieve"):
+        # posting list 求交，凑够 max_results 即停止
+        rows = index.query(
+            max_results,
+            gender=[gender, 'Unisex'],
+            season=season,
+            colour_group=skin_tone,
+        )
+        results = catalog.to_dataframe(rows)
+        # 只为返回的少量商品解析图片路径；没有图片的商品为 None
+        results['image_path'] = image_resolver.resolve_many(results['id'])
+    RETRIEVED_CANDIDATES.observe(len(results), source="retrieve_clothes")
+    return results
+
+# 提示字段与响应缓存键（normalize_request）一致，身高体重只通过尺码建议进入提示
+PROMPT_TEMPLATE = """User: {gender}, skin tone {skin_tone}, season {season}. Suggested size: {size_suggestion}.
+Available items (cite as "Image: <id>.jpg"):
+{context}Recommend an outfit from these items, explain why the colours suit the skin tone, and mention the size.
+"""
+
+def _count_tokens(text, special_tokens=False):
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer(text, add_special_tokens=special_tokens)["input_ids"])
+
+@functools.lru_cache(maxsize=4)
+def _prefix_tokens(prefix, tokenizer_name):
+    # 前缀只在 few-shot 变化时改变，按 (文本, 分词器名称/路径) 缓存其 token 数（含 BOS）
+    return _count_tokens(prefix, special_tokens=True)
+
+def format_retrieved_context(retrieved_df, budget_tokens=None):
+    """检索结果 → 紧凑上下文：共享属性分组、去重、在 token 预算内按排序截断"""
+    builder = ContextBuilder(tokenizer, max_items=GENERATION_CONFIG["context"]["max_items"])
+    context, kept = builder.build(retrieved_df, budget_tokens)
+    RETRIEVED_CANDIDATES.observe(kept, source="prompt_context")
+    return context
+
+def build_prompt(user_input, retrieved_df):
+    # Uses the global few_shot_prompt_examples
+    # 提示只由归一化后的请求决定：缓存键相同的请求（如 Autumn/fall）得到相同的提示
+    gender, skin_tone, season, size_suggestion = normalize_request(user_input, get_size_suggestion)
+    fields = {"gender": gender.title(), "skin_tone": skin_tone.title(), "season": season.title()}
+    prefix = prompt_prefix()
+    # 上下文预算 = max_length - 前缀 - 模板其余部分，提示永远不会被分词器截断
+    fixed = _prefix_tokens(prefix, getattr(tokenizer, "name_or_path", None)) + _count_tokens(
+        PROMPT_TEMPLATE.format(context="", size_suggestion=size_suggestion, **fields))
+    budget = min(GENERATION_CONFIG["context"]["max_tokens"], GENERATION_CONFIG["max_length"] - fixed)
+    if budget <= 0:
+        logging.warning(f"Prompt without context already uses {fixed} of {GENERATION_CONFIG['max_length']} tokens.")
+    context = format_retrieved_context(retrieved_df, max(0, budget))
+    return prefix + PROMPT_TEMPLATE.format(context=context, size_suggestion=size_suggestion, **fields)
 
 def generate_recommendation(user_input, retrieved_df): # Removed LLM/tokenizer/few_shot args
     # Uses the global model, tokenizer, few_shot_prompt_examples
-    if model is None or tokenizer is None or product_df is None:
+    if model is None or tokenizer is None or product_catalog is None:
         logging.error("Model, tokenizer, or product data not loaded. Cannot generate.")
         return "Sorry, the recommendation service is currently unavailable."
 
-    context = format_retrieved_context(retrieved_df)
-    size_suggestion = get_size_suggestion(user_input['height_cm'], user_input['weight_kg'])
-    prompt = f"""{few_shot_prompt_examples}
---- Current Task ---
-# ... (rest of the prompt construction) ...
-"""
-    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=1500).to(model.device)
-    # ... (model.generate call) ...
-    generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    # ... (extract recommendation_text) ...
-    return recommendation_text
+    with span("prompt_build"):
+        prompt = build_prompt(user_input, retrieved_df)
+    if generation_scheduler is not None:
+        # 与其他并发请求合批生成，只返回新生成的部分（含排队时间；批内各步骤见 batch_* 阶段）
+        with span("generate"):
+            return generation_scheduler.generate(prompt, timeout=GENERATION_CONFIG["scheduler"]["timeout_s"]).strip()
+
+    import torch
+    with span("tokenize"):
+        inputs = _model_inputs(prompt)
+    with span("model_generate"), torch.no_grad():
+        outputs = model.generate(**inputs, **GENERATION_CONFIG["generate_kwargs"])
+    new_tokens = outputs[0][inputs["input_ids"].shape[1]:]
+    PROMPT_TOKENS.observe(int(inputs["attention_mask"].sum()))
+    GENERATED_TOKENS.observe(len(new_tokens))
+    with span("decode"):
+        recommendation_text = tokenizer.decode(new_tokens, skip_special_tokens=True)
+    return recommendation_text.strip()
+
+def generate_recommendations(user_inputs, retrieved_dfs):
+    """批量生成：全部提示一次性提交给调度器合批；返回与输入对齐的列表，失败项为异常对象"""
+    if model is None or tokenizer is None or product_catalog is None:
+        raise RuntimeError("Model, tokenizer, or product data not loaded. Cannot generate.")
+    if generation_scheduler is None:
+        results = []
+        for user_input, retrieved_df in zip(user_inputs, retrieved_dfs):
+            try:
+                results.append(generate_recommendation(user_input, retrieved_df))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    submitted = []
+    for user_input, retrieved_df in zip(user_inputs, retrieved_dfs):
+        try:
+            with span("prompt_build"):
+                prompt = build_prompt(user_input, retrieved_df)
+            stop = threading.Event()
+            submitted.append((generation_scheduler.submit(prompt, stop=stop), stop))
+        except Exception as e:
+            submitted.append(e)
+    # 所有提示同时提交，超时按整批计算而不是每条各等一次
+    timeout = GENERATION_CONFIG["scheduler"]["timeout_s"]
+    deadline = None if timeout is None else time.monotonic() + timeout
+    results = []
+    for item in submitted:
+        if isinstance(item, Exception):
+            results.append(item)
+            continue
+        future, stop = item
+        try:
+            results.append(future.result(None if deadline is None else max(0.0, deadline - time.monotonic())).strip())
+        except Exception as e:
+            # 尚未开始生成的请求直接取消；已在批中生成的行由停止标志在下一步结束，不再占用批位
+            stop.set()
+            future.cancel()
+            results.append(e)
+    return results
+
+# 调度器关闭时同时进行的流式生成数上限；超出的流在生成线程中排队，不占用请求线程
+_stream_slots = threading.BoundedSemaphore(GENERATION_CONFIG.get("stream_max_concurrency", 4))
+
+def stream_recommendation(user_input, retrieved_df, loop):
+    """流式生成，返回可 async for 读取文本片段的 AsyncTokenStream
+
+    启用调度器时与其他请求（流式或非流式）合批生成；调用 stream.cancel() 可提前停止该流的生成。
+    """
+    from core.streaming import AsyncTokenStream, StopOnEvent
+    if model is None or tokenizer is None or product_catalog is None:
+        raise RuntimeError("Model, tokenizer, or product data not loaded. Cannot generate.")
+
+    with span("prompt_build"):
+        prompt = build_prompt(user_input, retrieved_df)
+    streamer = AsyncTokenStream(tokenizer, loop, skip_special_tokens=True)
+
+    if generation_scheduler is not None:
+        def finished(future):
+            # 正常结束时 streamer 已收到 end；取消或失败时把异常交给消费端
+            if future.cancelled():
+                streamer.fail(RuntimeError("Streaming generation was cancelled"))
+            elif future.exception() is not None:
+                streamer.fail(future.exception())
+        generation_scheduler.submit(prompt, streamer=streamer).add_done_callback(finished)
+        return streamer
+
+    def run():
+        import torch
+        from transformers import StoppingCriteriaList
+        try:
+            with _stream_slots, span("stream_generate"):
+                inputs = _model_inputs(prompt)
+                PROMPT_TOKENS.observe(int(inputs["attention_mask"].sum()))
+                with torch.no_grad():
+                    model.generate(**inputs, streamer=streamer,
+                                   stopping_criteria=StoppingCriteriaList([StopOnEvent([streamer.stop])]),
+                                   **GENERATION_CONFIG["generate_kwargs"])
+        except Exception as e:
+            logging.exception("Streaming generation failed.")
+            streamer.fail(e)
+
+    threading.Thread(target=run, name="stream-generation", daemon=True).start()
+    return streamer
 
 def extract_image_references(recommendation_text):
     """Extracts image filenames referenced in the recommendation text."""
-    image_filenames = re.findall(r'[Ii]mage\s*[:\-]?\s*(\d+\.jpg)', recommendation_text)
+    with span("extract_images"):
+        image_filenames = re.findall(r'[Ii]mage\s*[:\-]?\s*(\d+\.jpg)', recommendation_text)
     return image_filenames
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the offline startup snapshot for the RAG pipeline")
+    parser.add_argument('--snapshot-dir', default=SNAPSHOT_DIR)
+    parser.add_argument('--csv', default=KAGGLE_CSV_PATH)
+    args = parser.parse_args()
+    build_snapshot(args.snapshot_dir, args.csv)
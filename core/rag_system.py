@@ -1,33 +1,112 @@
+import faiss
+import numpy as np
 import pandas as pd
-from .knowledge_builder import KnowledgeBuilder
+from .ann_index import read_index
+from .encoder import encoder_id, get_encoder, load_encoder_config
+from .embedding_cache import QueryEmbeddingCache, normalize_query
+from .catalog import _normalize_colours
+from .metrics import CACHE_REQUESTS, span
+
+# 知识库命中阈值按索引度量区分：faiss 的 l2 返回平方距离（越小越相似），ip 为余弦相似度（越大越相似）
+# 单位向量上平方距离 = 2 - 2·余弦，两个默认值等价
+DEFAULT_THRESHOLDS = {"l2": 0.6, "ip": 0.7}
 
 class EnhancedFashionRAG:
-    def __init__(self, config):
+    def __init__(self, config, encoder=None):
         self.knowledge = pd.read_csv(config["knowledge_path"])
-        self.index = faiss.read_index(config["index_path"])
-        self.encoder = KnowledgeBuilder().encoder
-        self.threshold = 0.6  # 相似度阈值
+        # 索引返回稳定 kb_id（增量构建）；旧版知识库按行号对齐
+        if "kb_id" in self.knowledge.columns:
+            self.knowledge = self.knowledge.set_index("kb_id", drop=False)
+        # 只读检索，默认以 mmap 打开，多 worker 共享同一份索引页面
+        self.index = read_index(config["index_path"], mmap=config.get("mmap_index", True))
+        # encoder 只需提供 encode(texts) -> 向量数组，基准测试可传入轻量替身
+        self.encoder = encoder if encoder is not None else get_encoder(load_encoder_config())
+        # 内积索引（归一化向量）得分越大越相似，L2 索引距离越小越相似
+        self.inner_product = self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+        self.threshold = self._threshold(config, "ip" if self.inner_product else "l2")
+        self.query_cache = QueryEmbeddingCache(
+            max_size=config.get("query_cache_size", 1024),
+            disk_path=config.get("query_cache_dir"),
+            namespace=encoder_id(self.encoder),  # 磁盘缓存按编码器区分
+        )
+
+    @staticmethod
+    def _threshold(config, metric):
+        # 旧配置的单一 threshold 仍按当前索引度量解释
+        if "threshold" in config and metric not in (config.get("thresholds") or {}):
+            return config["threshold"]
+        return {**DEFAULT_THRESHOLDS, **(config.get("thresholds") or {})}[metric]
 
     def parse_query(self, query):
         # 增强版参数解析
-        query_embed = self.encoder.encode([query])
-        distances, indices = self.index.search(query_embed, 3)
-        
+        return self.parse_queries([query])[0]
+
+    def parse_queries(self, queries, k=3):
+        """批量解析：缓存未命中的查询一次性编码，FAISS 一次性检索"""
+        if not queries:
+            return []
+        query_embeds = self.encode_queries(queries)
+        with span("faiss_search"):
+            distances, indices = self.index.search(query_embeds, k)
+        return [
+            self._params_from_hits(row_indices, row_distances)
+            for row_indices, row_distances in zip(indices, distances)
+        ]
+
+    def encode_queries(self, queries):
+        """按归一化文本查缓存，未命中的去重后批量编码；编码的是原始文本，归一化只用于缓存键"""
+        if not queries:
+            return np.empty((0, self.index.d), dtype="float32")
+        keys = [normalize_query(q) for q in queries]
+        originals = {}
+        for key, query in zip(keys, queries):
+            originals.setdefault(key, query)
+        embeds = {}
+        for key in originals:
+            cached = self.query_cache.get(key)
+            if cached is not None:
+                embeds[key] = cached
+        misses = [key for key in originals if key not in embeds]
+        CACHE_REQUESTS.inc(len(embeds), cache="query", result="hit")
+        CACHE_REQUESTS.inc(len(misses), cache="query", result="miss")
+        if misses:
+            with span("query_encode"):
+                encoded = self.encoder.encode([originals[key] for key in misses])
+            for key, embed in zip(misses, encoded):
+                self.query_cache.put(key, embed)
+                embeds[key] = np.asarray(embed, dtype=np.float32)
+        query_embeds = np.stack([embeds[key] for key in keys]).astype("float32")
+        if self.inner_product:
+            faiss.normalize_L2(query_embeds)
+        return query_embeds
+
+    @property
+    def cache_stats(self):
+        return self.query_cache.stats()
+
+    def _params_from_hits(self, indices, distances):
         params = {
             "colors": [],
             "styles": [],
             "materials": []
         }
-        
-        for idx, score in zip(indices[0], distances[0]):
-            if score < self.threshold:
-                item = self.knowledge.iloc[idx]
-                params["colors"].extend(item["baseColour"])
+
+        for idx, score in zip(indices, distances):
+            matched = score > self.threshold if self.inner_product else score < self.threshold
+            if idx >= 0 and matched:
+                item = self._knowledge_row(idx)
+                # 从 CSV 读回时 baseColour 为逗号字符串，直接 extend 会拆成单个字符
+                params["colors"].extend(_normalize_colours(item["baseColour"]))
                 params["styles"].append(item["推荐款式"])
-                params["materials"].append(item["面料建议"])
-        
+                params["materials"].append(item["适用面料"])
+
         return self._deduplicate_params(params)
 
+    def _knowledge_row(self, idx):
+        if "kb_id" in self.knowledge.columns:
+            return self.knowledge.loc[idx]
+        return self.knowledge.iloc[idx]
+
     def _deduplicate_params(self, params):
         # 去重逻辑
         return {
@@ -35,3 +114,7 @@ class EnhancedFashionRAG:
             "styles": list(set(params["styles"])),
             "materials": list(set(params["materials"]))
         }
+
+
+# 旧名称，core/__init__ 与 recommender 仍按此导入
+FashionRAG = EnhancedFashionRAG
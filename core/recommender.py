@@ -1,57 +1,133 @@
+import os
+import yaml
 import pandas as pd
-from fuzzywuzzy import fuzz
 from .rag_system import FashionRAG
+from .catalog import CompactCatalog
+from .embedding_cache import normalize_query
+from .scoring import ScoringEngine
+from .image_store import get_resolver
+from .metrics import RETRIEVED_CANDIDATES, span
 
 class EnhancedRecommender:
-    def __init__(self, df, rag=None, image_base_path=None):
+    def __init__(self, df, rag=None, image_base_path=None, product_index=None):
+        # df 可以是清洗后的 DataFrame，也可以直接传入 CompactCatalog
         self.df = df
         self.rag = rag or EnhancedFashionRAG(config)
         self.image_base_path = image_base_path
+        self.image_resolver = get_resolver(image_base_path) if image_base_path else None
         self.feature_weights = self._load_feature_weights()
+        self.scorer = ScoringEngine(df, self.feature_weights)
+        # 可选的商品向量索引（core.product_index）：属性得分之外再加查询与商品的语义相似度
+        # 查询向量来自 RAG 的编码器，须与建索引时的编码器（模型、后端、维度）一致
+        if product_index is not None:
+            product_index.check_compatible(self.scorer.catalog, getattr(self.rag, "encoder", None))
+        self.product_index = product_index
+        self._precompute_styles()
+
+    def _load_feature_weights(self, config_path="configs/model_config.yaml"):
+        """读取特征权重配置"""
+        weights = {"color": 0.4, "style": 0.3, "material": 0.3, "semantic": 0.3}
+        if os.path.exists(config_path):
+            with open(config_path, encoding="utf-8") as f:
+                config = yaml.safe_load(f) or {}
+            weights.update(config.get("recommender", {}).get("feature_weights", {}))
+        return weights
+
+    def _precompute_styles(self):
+        """按知识库中的款式预建 articleType 相似度表"""
+        knowledge = getattr(self.rag, "knowledge", None)
+        if knowledge is not None and "推荐款式" in knowledge.columns:
+            self.scorer.precompute_styles(knowledge["推荐款式"].dropna().unique())
         
     def _get_image_path(self, item_id):
         """动态获取图片路径"""
-        for ext in ['.jpg', '.png']:
-            path = f"{self.image_base_path}/{item_id}{ext}"
-            if os.path.exists(path):
-                return path
-        return None
+        if self.image_resolver is None:
+            return None
+        return self.image_resolver.resolve(item_id)
     
     def recommend(self, query, top_k=5):
         """整合RAG的推荐入口"""
         # RAG参数解析
-        rag_params = self.rag.parse_query(query) if self.rag else {}
-        
-        # 动态过滤
-        candidates = self.df.copy()
-        if rag_params.get("colors"):
-            candidates = candidates[candidates["baseColour"].apply(
-                lambda x: len(set(x) & set(rag_params["colors"])) > 0
-            )]
-        
-        # 相似度计算
-        candidates["score"] = candidates.apply(
-            lambda row: self._calculate_score(row, rag_params), axis=1
+        with span("rag_parse"):
+            rag_params = self.rag.parse_query(query) if self.rag else {}
+        return self._rank(rag_params, top_k, self._query_embeddings([query])[0])
+
+    def _query_embeddings(self, queries):
+        # 查询向量在 parse_query 中已编码并缓存，这里直接命中查询缓存
+        if self.product_index is None or not self.rag:
+            return [None] * len(queries)
+        return self.rag.encode_queries(queries)
+
+    def recommend_many(self, queries, top_k=5, chunk_size=1024):
+        """批量推荐：按块一次性编码与 FAISS 检索，解析出相同参数的查询共用一次评分。
+        按输入顺序返回 [{"query", "results", "error"}]，单条失败不影响其他条目"""
+        outputs = [{"query": q, "results": None, "error": None} for q in queries]
+        valid = []
+        for i, query in enumerate(queries):
+            if isinstance(query, str) and query.strip():
+                valid.append(i)
+            else:
+                outputs[i]["error"] = "Query must be a non-empty string"
+
+        # 相同过滤参数的查询归为一组
+        groups = {}
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            try:
+                with span("rag_parse"):
+                    params_list = (self.rag.parse_queries([queries[i] for i in chunk])
+                                   if self.rag else [{}] * len(chunk))
+                    embeddings = self._query_embeddings([queries[i] for i in chunk])
+            except Exception as e:
+                for i in chunk:
+                    outputs[i]["error"] = f"Query parsing failed: {e}"
+                continue
+            for i, params, embedding in zip(chunk, params_list, embeddings):
+                key = self._params_key(params)
+                if embedding is not None:
+                    # 语义得分取决于查询本身，只有归一化后相同的查询才能共用
+                    key = (key, normalize_query(queries[i]))
+                groups.setdefault(key, (params, embedding, []))[2].append(i)
+
+        for params, embedding, members in groups.values():
+            try:
+                results = self._rank(params, top_k, embedding)
+            except Exception as e:
+                for i in members:
+                    outputs[i]["error"] = f"Scoring failed: {e}"
+                continue
+            for n, i in enumerate(members):
+                outputs[i]["results"] = results if n == 0 else results.copy()
+        return outputs
+
+    @staticmethod
+    def _params_key(params):
+        # 参数列表来自 set 去重，顺序不固定，排序后作为分组键
+        return tuple(
+            tuple(sorted(map(str, params.get(field) or [])))
+            for field in ("colors", "styles", "materials")
         )
-        
-        # 生成结果
-        return candidates.sort_values("score", ascending=False).head(top_k)
-    
-    def _calculate_score(self, row, params):
-            # 增强评分逻辑
-            score = 0
-            
-            # 颜色匹配
-            color_match = len(set(row["baseColour"]) & set(params["colors"]))
-            score += self.feature_weights["color"] * (color_match / len(params["colors"])) if params["colors"] else 0
-            
-            # 风格匹配
-            style_sim = max([fuzz.ratio(style, row["articleType"]) for style in params["styles"]])/100
-            score += self.feature_weights["style"] * style_sim
-            
-            # 材质匹配
-            material_match = any(material in row["material"] for material in params["materials"])
-            score += self.feature_weights["material"] * material_match
-            
-            return score
 
+    def _rank(self, rag_params, top_k, query_embedding=None):
+        # 整列评分 + 颜色掩码过滤
+        with span("score"):
+            scores, candidates = self.scorer.score(rag_params)
+        RETRIEVED_CANDIDATES.observe(len(candidates), source="recommender")
+
+        # 混合检索：只对属性过滤后的候选计算向量相似度
+        if query_embedding is not None:
+            with span("product_vector_search"):
+                # 没有颜色过滤时候选为全部行，按切片顺序读取映射文件
+                rows = None if len(candidates) == self.scorer.size else candidates
+                similarity = self.product_index.similarity(query_embedding, rows)
+            scores[candidates] += self.feature_weights["semantic"] * similarity
+
+        # 局部排序取 top_k，只复制结果行
+        with span("top_k"):
+            rows = self.scorer.top_k(scores, candidates, top_k)
+        if isinstance(self.df, CompactCatalog):
+            results = self.df.to_dataframe(rows)
+        else:
+            results = self.df.iloc[rows].copy()
+        results["score"] = scores[rows]
+        return results
@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from .attribute_index import AttributeIndex
+from .metrics import CACHE_REQUESTS
+
+SEASON_ALIASES = {"autumn": "fall"}
+
+
+def normalize_request(user_input, size_fn):
+    """请求归一化为缓存键：身高体重只通过尺码建议影响结果
+
+    肤色按检索时的颜色组名规范化（AttributeIndex.group_key），只有检索结果相同的请求才共用缓存。
+    """
+    season = str(user_input["season"]).strip().lower()
+    return (
+        str(user_input["gender"]).strip().lower(),
+        AttributeIndex.group_key(user_input["skin_tone"]),
+        SEASON_ALIASES.get(season, season),
+        size_fn(user_input["height_cm"], user_input["weight_kg"]),
+    )
+
+
+class ResponseCache:
+    """LRU + TTL 响应缓存；版本号（目录指纹/模型）变化时整体失效"""
+
+    def __init__(self, max_size=512, ttl_seconds=3600, log_every=100):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.log_every = log_every
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._version is not None:
+                logging.info("Response cache invalidated: catalog or model changed.")
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[1]
+                CACHE_REQUESTS.inc(cache="response", result="hit")
+            else:
+                if entry is not None:
+                    del self._entries[key]  # 已过期
+                self.misses += 1
+                value = None
+                CACHE_REQUESTS.inc(cache="response", result="miss")
+            self._maybe_log()
+            return value
+
+    def put(self, key, value, version):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypasses += 1
+        CACHE_REQUESTS.inc(cache="response", result="bypass")
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def warm_up(self, profiles, key_fn, compute_fn, version_fn):
+        """按常见用户画像预先计算并写入缓存"""
+        for profile in profiles:
+            key = key_fn(profile)
+            if self.get(key, version_fn()) is not None:
+                continue
+            try:
+                self.put(key, compute_fn(profile), version_fn())
+            except Exception as e:
+                logging.warning(f"Response cache warm-up failed for {profile}: {e}")
+        logging.info(f"Response cache warm-up finished: {len(self._entries)} entries.")
+
+    def _maybe_log(self):
+        lookups = self.hits + self.misses
+        if self.log_every and lookups % self.log_every == 0:
+            logging.info(
+                f"Response cache: hits={self.hits}, misses={self.misses}, "
+                f"bypasses={self.bypasses}, hit_rate={self.hits / lookups:.2%}"
+            )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+from .catalog import CompactCatalog
+
+
+class ScoringEngine:
+    """批量评分引擎：以整列数组运算计算颜色/风格/材质加权得分"""
+
+    def __init__(self, catalog, feature_weights):
+        if not isinstance(catalog, CompactCatalog):
+            catalog = CompactCatalog.from_dataframe(catalog)
+        self.catalog = catalog
+        self.feature_weights = feature_weights
+        self.size = len(catalog)
+
+        # articleType 编码：风格相似度按 (款式 × 类型) 表查询，不再逐行 fuzz
+        self.article_codes = catalog.codes["articleType"]
+        self.article_types = catalog.categories["articleType"] + [""]  # 编码 -1 指向空串
+        self._style_table = {}
+
+        # 材质按唯一值编码，子串匹配只在唯一值上做一次
+        if "material" in catalog.extra:
+            codes, materials = pd.factorize(pd.Series(catalog.extra["material"]).fillna("").astype(str))
+            self.material_codes = codes.astype(np.int32)
+            self.material_values = list(materials)
+        else:
+            self.material_codes = None
+            self.material_values = []
+
+    def precompute_styles(self, styles):
+        """预先计算一批款式对全部 articleType 的相似度"""
+        for style in styles:
+            self._style_row(style)
+
+    def _style_row(self, style):
+        row = self._style_table.get(style)
+        if row is None:
+            row = np.array(
+                [fuzz.ratio(style, t) for t in self.article_types], dtype=np.float32
+            ) / 100
+            self._style_table[style] = row
+        return row
+
+    def colour_matches(self, colors):
+        """每个商品命中的查询颜色数（颜色掩码按位统计）"""
+        return self.catalog.colour_hits(colors)
+
+    def style_similarity(self, styles):
+        if not styles:
+            return np.zeros(self.size, dtype=np.float32)
+        table = np.max([self._style_row(s) for s in styles], axis=0)
+        return table[self.article_codes]
+
+    def material_matches(self, materials):
+        if not materials or self.material_codes is None:
+            return np.zeros(self.size, dtype=bool)
+        hit = np.array(
+            [any(m in value for m in materials) for value in self.material_values],
+            dtype=bool,
+        )
+        return hit[self.material_codes]
+
+    def score(self, params):
+        """返回 (得分数组, 候选行号)；指定颜色时只保留至少命中一种颜色的商品"""
+        colors = list(dict.fromkeys(params.get("colors") or []))
+        scores = np.zeros(self.size, dtype=np.float32)
+
+        # 颜色匹配
+        if colors:
+            color_match = self.colour_matches(colors)
+            scores += self.feature_weights["color"] * (color_match / len(colors))
+            candidates = np.flatnonzero(color_match > 0)
+        else:
+            candidates = np.arange(self.size)
+
+        # 风格匹配
+        scores += self.feature_weights["style"] * self.style_similarity(params.get("styles"))
+
+        # 材质匹配
+        scores += self.feature_weights["material"] * self.material_matches(params.get("materials"))
+        return scores, candidates
+
+    @staticmethod
+    def top_k(scores, candidates, k):
+        """局部排序取前 k 个行号，得分相同按原始顺序"""
+        if k <= 0 or len(candidates) == 0:
+            return candidates[:0]
+        cand_scores = scores[candidates]
+        if k < len(candidates):
+            # 第 k 大的得分作为门槛；门槛上的并列项取原始顺序靠前者
+            kth = cand_scores[np.argpartition(-cand_scores, k - 1)[k - 1]]
+            above = np.flatnonzero(cand_scores > kth)
+            ties = np.flatnonzero(cand_scores == kth)[:k - len(above)]
+            part = np.concatenate([above, ties])
+            candidates, cand_scores = candidates[part], cand_scores[part]
+        order = np.lexsort((candidates, -cand_scores))
+        return candidates[order]
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import re
+import threading
+import torch
+from transformers import StoppingCriteria, TextStreamer
+from transformers.generation.streamers import BaseStreamer
+
+IMAGE_REF_PATTERN = re.compile(r'[Ii]mage\s*[:\-]?\s*(\d+\.jpg)')
+# 尚未写完的引用，如 "Image: 12.j"；只有它需要留到下一个片段再扫描
+_PENDING_REF = re.compile(r'[Ii]mage\s*[:\-]?\s*(\d+\.?(j|jp)?)?')
+
+
+class AsyncTokenStream(TextStreamer):
+    """generate 线程中解码出的文本片段推入 asyncio 队列，请求协程 async for 读取"""
+
+    _END = object()
+
+    def __init__(self, tokenizer, loop, **decode_kwargs):
+        super().__init__(tokenizer, skip_prompt=True, **decode_kwargs)
+        self.loop = loop
+        self.queue = asyncio.Queue()
+        self.stop = threading.Event()  # 置位后生成在下一步停止（见 StopOnEvent）
+
+    def on_finalized_text(self, text, stream_end=False):
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+        if stream_end:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, self._END)
+
+    def fail(self, exc):
+        """生成线程异常时调用，异常在消费端重新抛出"""
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, exc)
+
+    def cancel(self):
+        """客户端断开时调用，停止为该流继续生成；生成结束后调用无影响"""
+        self.stop.set()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is self._END:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+
+class StopOnEvent(StoppingCriteria):
+    """每行对应一个 threading.Event：已置位的行停止生成，批内其他行继续"""
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.tensor([event.is_set() for event in self.events], dtype=torch.bool, device=input_ids.device)
+
+
+class BatchStreamer(BaseStreamer):
+    """批量 generate 的 streamer：按行把 token 转发给各请求的 streamer（不流式的行为 None）
+
+    某行生成 eos 后立即结束该行的流，不必等整批生成完。
+    """
+
+    def __init__(self, streamers, eos_token_ids=()):
+        self.streamers = list(streamers)
+        self.eos_token_ids = set(eos_token_ids)
+        self._open = [streamer is not None for streamer in self.streamers]
+
+    def put(self, value):
+        # 第一次为 (批大小, 提示长度) 的提示 token，由各 streamer 按 skip_prompt 跳过；之后每步为 (批大小,)
+        prompt = value.dim() > 1
+        for row, streamer in enumerate(self.streamers):
+            if not self._open[row]:
+                continue
+            if not prompt and int(value[row]) in self.eos_token_ids:
+                self._open[row] = False
+                streamer.end()
+            else:
+                streamer.put(value[row:row + 1])
+
+    def end(self):
+        for row, streamer in enumerate(self.streamers):
+            if self._open[row]:
+                self._open[row] = False
+                streamer.end()
+
+
+class ImageReferenceExtractor:
+    """增量提取 "Image: N.jpg"：每个引用在文本中完整出现时立即返回一次
+
+    每次只扫描新片段与上次留下的未完成引用，不重扫已处理的文本。
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.references = []
+        self._pos = 0  # 此前的文本已扫描完毕
+
+    def feed(self, chunk):
+        self.text += chunk
+        new = []
+        for match in IMAGE_REF_PATTERN.finditer(self.text, self._pos):
+            new.append(match.group(1))
+            self._pos = match.end()
+        # 剩余部分没有完整引用；引用中不含字母，能补全的只可能是最后一个 "image" 开头的片段
+        start = max(self.text.rfind("Image", self._pos), self.text.rfind("image", self._pos))
+        if start >= 0 and _PENDING_REF.fullmatch(self.text, start):
+            self._pos = start
+        else:
+            self._pos = max(self._pos, len(self.text) - len("Imag"))
+        self.references.extend(new)
+        return new
+
+
+def sse_event(event, data):
+    """格式化一条 server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -1,16 +1,12 @@
-import os
 from PIL import Image
 from IPython.display import display
+from .image_store import get_resolver
 
 class ImageUtils:
     @staticmethod
     def validate_image_path(base_path, item_id):
-        """验证图片路径是否存在"""
-        for ext in ['.jpg', '.png', '.jpeg']:
-            path = os.path.join(base_path, f"{item_id}{ext}")
-            if os.path.exists(path):
-                return path
-        return None
+        """验证图片路径是否存在（查目录索引，不逐个扩展名 stat）"""
+        return get_resolver(base_path).resolve(item_id)
 
     @staticmethod
     def display_image(image_path, resize=(200,200)):
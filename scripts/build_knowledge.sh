@@ -6,5 +6,10 @@ python -m core.knowledge_builder \
     --output knowledge/ \
     --config configs/model_config.yaml
 
+echo "Checking encoder backend against float32..."
+python -m core.encoder \
+    --knowledge knowledge/structured_kb.csv \
+    --output knowledge/encoder_parity.json
+
 echo "Validating knowledge base..."
 pytest tests/test_rag.py
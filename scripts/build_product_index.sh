@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# 离线为快照中的每件商品编码，写入 int8/float16 向量映射文件（需先运行 build_snapshot.sh）
+echo "Building product embedding index..."
+python -m core.product_index \
+    --snapshot-dir data/snapshot \
+    --config configs/model_config.yaml
@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# 离线生成启动快照（目录数组 + 倒排索引 + few-shot 文本），服务启动时直接加载
+echo "Building startup snapshot..."
+PYTHONPATH=core:. python core/rag_pipeline.py \
+    --csv data/styles.csv \
+    --snapshot-dir data/snapshot
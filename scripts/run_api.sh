@@ -1,2 +1,2 @@
 #!/bin/bash
-uvicorn api.app:app --host $(jq -r .api.host configs/paths.yaml) --port $(jq -r .api.port configs/paths.yaml)
+PYTHONPATH=core:. uvicorn api.app:asgi_app --host $(jq -r .api.host configs/paths.yaml) --port $(jq -r .api.port configs/paths.yaml)
@@ -0,0 +1,5 @@
+#!/bin/bash
+
+# 多 worker 部署：主进程预加载快照（mmap）与模型后 fork，worker 以写时复制共享只读内存
+# worker 数取 configs/model_config.yaml 中 serving.workers，可用 WEB_CONCURRENCY 覆盖
+PYTHONPATH=core:. gunicorn -c api/gunicorn_conf.py api.app:asgi_app
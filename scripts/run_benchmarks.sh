@@ -0,0 +1,7 @@
+#!/bin/bash
+
+# 合成数据基准：44k / 500k / 5M 行目录 + 合成知识库 + 替身 LLM，结果写入 benchmarks/results/
+# 快速运行：bash scripts/run_benchmarks.sh --scales 44k --iterations-scale 0.2
+# 对比上一次：bash scripts/run_benchmarks.sh --compare benchmarks/results/<上次>.json
+echo "Running benchmarks..."
+python -m benchmarks.run_benchmarks "$@"
@@ -0,0 +1,119 @@
+import string
+import zlib
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+# 测试与基准共用的离线替身（编码器、小型 LLM、肤色分组、小型商品表），不依赖网络或正式模型
+
+# 四季色彩理论的合成分组，代替 rag_pipeline 中尚未填写的 SKIN_TONE_COLOR_MAP
+SKIN_TONE_GROUPS = {
+    "Spring": ["green", "yellow", "peach", "orange", "beige", "cream", "gold"],
+    "Summer": ["blue", "navy blue", "grey", "pink", "lavender", "white", "silver"],
+    "Autumn": ["brown", "olive", "rust", "mustard", "khaki", "maroon", "beige"],
+    "Winter": ["black", "white", "navy blue", "red", "purple", "magenta", "charcoal"],
+}
+
+
+def size_suggestion(height_cm, weight_kg):
+    """按 BMI 粗分尺码，代替 rag_pipeline 中尚未实现的 get_size_suggestion"""
+    bmi = float(weight_kg) / (float(height_cm) / 100) ** 2
+    return "S" if bmi < 18.5 else "M" if bmi < 24 else "L" if bmi < 28 else "XL"
+
+
+def make_styles(rows, seed=0):
+    """与 styles.csv 同列的小型商品表；约 1% 的行缺少 baseColour，加载时会被丢弃"""
+    rng = np.random.default_rng(seed)
+    colours = sorted({c.title() for group in SKIN_TONE_GROUPS.values() for c in group})
+    gender = rng.choice(["Men", "Women"], rows)
+    article = rng.choice(["Shirts", "Jeans", "Dresses", "Tshirts"], rows)
+    colour = rng.choice(colours, rows).astype(object)
+    df = pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "gender": gender,
+        "articleType": article,
+        "baseColour": colour,
+        "season": rng.choice(["Summer", "Fall", "Winter", "Spring"], rows),
+        "usage": rng.choice(["Casual", "Formal"], rows),
+        "productDisplayName": [f"Brand {g} {c} {a}" for g, c, a in zip(gender, colour, article)],
+    })
+    df.loc[rng.random(rows) < 0.01, "baseColour"] = np.nan
+    return df
+
+
+class HashingEncoder:
+    """字符 trigram 哈希编码器：离线、确定性，代替 SentenceTransformer 做检索路径计时"""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _encode_one(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        text = f"  {text.lower()} "
+        for i in range(len(text) - 2):
+            h = zlib.crc32(text[i:i + 3].encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, **kwargs):
+        return np.stack([self._encode_one(t) for t in texts]).astype(np.float32)
+
+
+class RandomEncoder:
+    """不看文本内容的随机向量编码器：大规模目录下只测建索引的存储路径（文本拼接、量化、写映射文件）"""
+
+    def __init__(self, dim=384, seed=0):
+        self.dim = dim
+        self.rng = np.random.default_rng(seed)
+
+    def encode(self, texts, **kwargs):
+        return self.rng.standard_normal((len(texts), self.dim), dtype=np.float32)
+
+
+def make_tiny_llm(seed=0, n_layer=2, n_embd=64):
+    """随机初始化的小型 GPT-2 + 字符级分词器，离线可用，代替正式 LLM 做端到端计时"""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    vocab = {c: i for i, c in enumerate(["<pad>", "<eos>", "<unk>"] + list(string.printable))}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+    backend.decoder = decoders.Fuse()
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=backend, eos_token="<eos>", pad_token="<pad>", unk_token="<unk>"
+    )
+    config = GPT2Config(vocab_size=len(vocab), n_positions=4096, n_embd=n_embd, n_layer=n_layer,
+                        n_head=2, eos_token_id=1, bos_token_id=1, pad_token_id=0)
+    torch.manual_seed(seed)
+    return GPT2LMHeadModel(config).eval(), tokenizer
+
+
+def make_encoder_model(directory, seed=0, n_layer=12, hidden=384):
+    """随机初始化、与 paraphrase-multilingual-MiniLM-L12-v2 同结构（12 层 384 维 BERT + 均值池化）的
+    SentenceTransformer，保存到 directory；字符级分词器覆盖 ASCII 与常用汉字。离线代替正式编码器做后端计时"""
+    directory = Path(directory)
+    if (directory / "modules.json").exists():
+        return str(directory)
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from tokenizers import Tokenizer, models as tokenizer_models, pre_tokenizers
+    from transformers import BertConfig, BertModel, PreTrainedTokenizerFast
+
+    chars = list(string.printable) + [chr(c) for c in range(0x4E00, 0x9FA6)]
+    vocab = {c: i for i, c in enumerate(["[PAD]", "[UNK]", "[CLS]", "[SEP]"] + chars)}
+    backend = Tokenizer(tokenizer_models.WordLevel(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.Split("", "isolated")
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, pad_token="[PAD]", unk_token="[UNK]",
+                                        cls_token="[CLS]", sep_token="[SEP]", model_max_length=128)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=hidden, num_hidden_layers=n_layer,
+                        num_attention_heads=hidden // 32, intermediate_size=4 * hidden, max_position_embeddings=512)
+    torch.manual_seed(seed)
+    transformer_dir = directory / "transformer"
+    BertModel(config).save_pretrained(transformer_dir)
+    tokenizer.save_pretrained(transformer_dir)
+    transformer = models.Transformer(str(transformer_dir), max_seq_length=128)
+    pooling = models.Pooling(hidden, pooling_mode="mean")
+    SentenceTransformer(modules=[transformer, pooling], device="cpu").save(str(directory))
+    return str(directory)
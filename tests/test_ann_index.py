@@ -0,0 +1,61 @@
+import unittest
+import faiss
+import numpy as np
+from core.ann_index import build_index, choose_index_type, create_index, evaluate_index, remove_ids
+
+TYPES = {"flat": (faiss.IndexFlat, 0.99), "hnsw": (faiss.IndexHNSWFlat, 0.95),
+         "ivf_flat": (faiss.IndexIVFFlat, 0.99), "ivf_pq": (faiss.IndexIVFPQ, 0.6)}
+
+class TestANNIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # 聚类分布的向量，接近真实语料的结构
+        rng = np.random.default_rng(0)
+        centres = rng.standard_normal((20, 32)).astype(np.float32)
+        cls.vectors = (centres[rng.integers(20, size=3000)] + 0.3 * rng.standard_normal((3000, 32))).astype(np.float32)
+        cls.ids = np.arange(len(cls.vectors), dtype="int64") + 1000
+
+    def test_create_index_types(self):
+        self.assertEqual([choose_index_type(n) for n in (5_000, 50_000, 500_000, 5_000_000)],
+                         ["flat", "hnsw", "ivf_flat", "ivf_pq"])
+        index, index_type = create_index(32, 3000, {"type": "ivf_flat", "metric": "ip", "nlist": 1000})
+        self.assertEqual(index_type, "ivf_flat")
+        self.assertEqual(index.nlist, 3000 // 39)  # 聚类数受训练样本数限制
+        self.assertEqual(index.metric_type, faiss.METRIC_INNER_PRODUCT)
+        with self.assertRaises(ValueError):
+            create_index(30, 3000, {"type": "ivf_pq", "pq_m": 16})
+        with self.assertRaises(ValueError):
+            create_index(32, 3000, {"type": "annoy"})
+
+    def test_build_and_evaluate_each_type(self):
+        for metric in ("l2", "ip"):
+            for index_type, (cls, min_recall) in TYPES.items():
+                with self.subTest(metric=metric, index_type=index_type):
+                    config = {"type": index_type, "metric": metric, "nlist": 16, "nprobe": 16, "eval_queries": 200}
+                    index, built = build_index(self.vectors, config, ids=self.ids)
+                    self.assertEqual(built, index_type)
+                    self.assertIsInstance(faiss.downcast_index(index.index), cls)
+                    self.assertEqual(index.ntotal, len(self.vectors))
+                    report = evaluate_index(index, self.vectors, config, built, ids=self.ids)
+                    self.assertEqual((report["k"], report["n_queries"], report["metric"]), (10, 200, metric))
+                    self.assertGreaterEqual(report["recall@10"], min_recall)
+                    # 返回稳定 id 而不是行号
+                    query = self.vectors[:1] / np.linalg.norm(self.vectors[:1]) if metric == "ip" else self.vectors[:1]
+                    self.assertIn(self.ids[0], index.search(query, 5)[1][0])
+
+    def test_ivf_pq_small_corpus_falls_back(self):
+        # 少于 2^pq_bits 个向量时 PQ 无法训练，改用 ivf_flat 而不是在 train 时报错
+        with self.assertLogs(level="WARNING"):
+            index, built = build_index(self.vectors[:100], {"type": "ivf_pq", "pq_bits": 8}, ids=self.ids[:100])
+        self.assertEqual(built, "ivf_flat")
+        self.assertIsInstance(faiss.downcast_index(index.index), faiss.IndexIVFFlat)
+        self.assertEqual(index.ntotal, 100)
+
+    def test_remove_ids(self):
+        index, _ = build_index(self.vectors[:100], {"type": "flat"}, ids=self.ids[:100])
+        self.assertTrue(remove_ids(index, self.ids[:10]))
+        self.assertEqual(index.ntotal, 90)
+        self.assertNotIn(self.ids[0], index.search(self.vectors[:1], 5)[1][0])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import tempfile
+from unittest import mock
+import numpy as np
+import pandas as pd
+from core.attribute_index import AttributeIndex
+from core.catalog import CompactCatalog
+
+class TestAttributeIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            "id": [10, 11, 12, 13, 14, 15],
+            "gender": ["Men", "Women", "Men", "Unisex", "Women", "Men"],
+            "season": ["Summer", "Summer", "Winter", "Summer", "Fall", "Summer"],
+            "articleType": ["Shirts", "Dresses", "Jackets", "Caps", "Dresses", "Shirts"],
+            "usage": ["Casual", "Party", "Casual", "Sports", None, "Formal"],
+            "baseColour": ["Red", "Blue", "Navy Blue,White", "red", "Green", "White"],
+        })
+        self.catalog = CompactCatalog.from_dataframe(self.df)
+        self.index = AttributeIndex.build(self.catalog, colour_groups={"Spring": ["red", "green"]})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_posting_lists(self):
+        self.assertEqual(self.index.postings["gender"]["men"].tolist(), [0, 2, 5])
+        self.assertEqual(self.index.postings["usage"]["casual"].tolist(), [0, 2])
+        self.assertNotIn(None, self.index.postings["usage"])  # 缺失值不进入 posting list
+        self.assertEqual(self.index.postings["baseColour"]["white"].tolist(), [2, 5])
+        self.assertEqual(self.index.lookup("gender", ["Men", "UNISEX"]).tolist(), [0, 2, 3, 5])
+        self.assertEqual(self.index.lookup("season", ["Spring"]).tolist(), [])
+
+    def test_query_matches_catalog_filter(self):
+        rows = self.index.query(gender=["men", "unisex"], season="summer", colour_group="spring")
+        self.assertEqual(rows.tolist(), [0, 3])
+        expected = self.catalog.filter(colours=["red", "green"], gender=["Men", "Unisex"], season="Summer")
+        self.assertEqual(rows.tolist(), expected.tolist())
+        self.assertEqual(self.index.query(colours="white", articleType="Shirts").tolist(), [5])
+        self.assertEqual(self.index.query(colour_group="unknown", gender="men").tolist(), [])
+        with self.assertRaises(KeyError):
+            self.index.query(brand="puma")
+
+    def test_intersection_stops_early(self):
+        lists = [np.arange(0, 1000, 2, dtype=np.int32), np.arange(0, 1000, 3, dtype=np.int32)]
+        full = AttributeIndex._intersect(lists, None)
+        self.assertEqual(full.tolist(), list(range(0, 1000, 6)))
+        with mock.patch("core.attribute_index.np.searchsorted", wraps=np.searchsorted) as searchsorted:
+            first = AttributeIndex._intersect(lists, 8, chunk=16)
+        self.assertEqual(first.tolist(), full[:8].tolist())
+        self.assertEqual(searchsorted.call_count, 2)  # 第一个列表共 500 行，只扫描了前两块
+
+    def test_save_load_keeps_fingerprint_and_groups(self):
+        path = f"{self.tmp.name}/attr_index.npz"
+        self.index.save(path)
+        loaded = AttributeIndex.load(path)
+        self.assertEqual(loaded.fingerprint, self.catalog.fingerprint())
+        self.assertEqual(loaded.colour_groups.keys(), self.index.colour_groups.keys())
+        self.assertEqual(loaded.query(colour_group="Spring").tolist(), [0, 3, 4])
+        for field, table in self.index.postings.items():
+            for value, rows in table.items():
+                self.assertEqual(loaded.postings[field][value].tolist(), rows.tolist())
+
+        changed = CompactCatalog.from_dataframe(self.df.iloc[:5])
+        self.assertNotEqual(loaded.fingerprint, changed.fingerprint())  # 目录变化后需重建
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from core.catalog import CompactCatalog, StringColumn
+
+class TestCatalogSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            "id": [11, 12, 13],
+            "gender": ["Men", "Women", "Men"],
+            "season": ["Summer", "Winter", "Fall"],
+            "articleType": ["Shirts", "Dresses", "Jeans"],
+            "usage": ["Casual", "Formal", "Casual"],
+            "baseColour": ["Blue", "Navy Blue,White", None],
+            "productDisplayName": ["Puma Men Blue Shirt", "Catwalk Women Navy Dress", np.nan],
+        })
+        self.catalog = CompactCatalog.from_dataframe(self.df, keep_columns=["productDisplayName"])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_mmap_load_matches_in_memory_catalog(self):
+        self.catalog.save(self.tmp.name)
+        loaded = CompactCatalog.load(self.tmp.name, mmap=True)
+        self.assertEqual(loaded.fingerprint(), self.catalog.fingerprint())
+        self.assertIsInstance(loaded.extra["productDisplayName"], StringColumn)
+        self.assertFalse(loaded.ids.flags.writeable)  # 只读映射，worker 之间共享
+        frame = loaded.to_dataframe([1, 2])
+        self.assertEqual(frame["productDisplayName"].tolist(), ["Catwalk Women Navy Dress", ""])
+        self.assertEqual(frame["baseColour"].tolist()[0], ["navy blue", "white"])
+
+    def test_snapshot_round_trip(self):
+        self.catalog.save(self.tmp.name)
+        for mmap in (False, True):
+            loaded = CompactCatalog.load(self.tmp.name, mmap=mmap)
+            self.assertEqual(loaded.fingerprint(), self.catalog.fingerprint())
+            self.assertEqual(loaded.colours, ["blue", "navy blue", "white"])
+            pd.testing.assert_frame_equal(
+                loaded.to_dataframe(), self.catalog.to_dataframe().fillna({"productDisplayName": ""}))
+            self.assertEqual(loaded.filter(colours=["white"], gender="women").tolist(), [1])
+
+    def test_colour_vocabulary_comes_from_data(self):
+        # 超过 64 种颜色，且不在 styles.csv 词表中，也都能保存、过滤和评分
+        colours = [f"shade {i}" for i in range(70)]
+        df = pd.DataFrame({"id": range(70), "baseColour": colours})
+        df.loc[69, "baseColour"] = "shade 69, Blue"
+        catalog = CompactCatalog.from_dataframe(df)
+        self.assertEqual(catalog.colours, colours + ["blue"])
+        self.assertEqual(catalog.colour_bits.shape, (70, 2))
+        self.assertEqual(catalog.filter(colours=["Shade 3", "blue"]).tolist(), [3, 69])
+        self.assertEqual(catalog.colour_hits(["shade 69", "blue", "unknown"])[69], 2)
+        self.assertEqual(catalog.to_dataframe([69])["baseColour"][0], ["shade 69", "blue"])
+
+        catalog.save(self.tmp.name)
+        loaded = CompactCatalog.load(self.tmp.name, mmap=True)
+        self.assertEqual(loaded.colours, catalog.colours)
+        self.assertEqual(loaded.fingerprint(), catalog.fingerprint())
+        self.assertEqual(loaded.filter(colours=["shade 66"]).tolist(), [66])
+
+    def test_string_column_indexing(self):
+        column = StringColumn.from_values(["a", "ünï", None])
+        self.assertEqual(len(column), 3)
+        self.assertEqual(column[1], "ünï")
+        self.assertEqual(column[[2, 0]].tolist(), ["", "a"])
+        self.assertEqual(pd.Series(column).tolist(), ["a", "ünï", ""])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import pandas as pd
+from core.context_builder import ContextBuilder
+
+class TestContextBuilder(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "id": [1, 2, 3, 4, 5],
+            "gender": ["men"] * 5,
+            "season": ["winter"] * 4 + ["fall"],
+            "usage": ["casual"] * 5,
+            "articleType": ["jeans", "jeans", "jeans", "shirts", "shirts"],
+            "baseColour": [["navy blue"], ["navy blue"], ["black"], ["white"], ["grey"]],
+            "productDisplayName": ["Levis Men Navy Blue Jeans", "Levis Men Navy Blue Jeans",
+                                   "Wrangler Men Black Jeans", "Puma Men White Shirts", "Arrow Men Grey Shirts"],
+            "image_path": ["a", "b", "c", "d", None],
+        })
+
+    def test_dedupes_groups_and_compacts_names(self):
+        text, kept = ContextBuilder().build(self.df)
+        self.assertEqual(kept, 4)
+        self.assertNotIn("Image: 2.jpg", text)  # 与 1 重复
+        self.assertEqual(text.count("men, winter, casual:\n"), 1)
+        self.assertIn("- Image: 1.jpg | jeans | navy blue | Levis\n", text)
+        # 款式轮转：第二条是 shirts；无图片的排在最后
+        lines = [line for line in text.splitlines() if line.startswith("- ")]
+        self.assertTrue(lines[1].startswith("- Image: 4.jpg"))
+        self.assertTrue(text.endswith("- Image: 5.jpg | shirts | grey | Arrow\n"))
+
+    def test_respects_token_budget(self):
+        # 按字符计数的分词器：token 数即字符数
+        char_tokenizer = lambda texts, add_special_tokens: {"input_ids": [list(t) for t in texts]}
+        builder = ContextBuilder(tokenizer=char_tokenizer)
+        full, _ = builder.build(self.df)
+        for budget in (30, 60, 100, len(full) - 1):
+            text, kept = builder.build(self.df, budget_tokens=budget)
+            self.assertLessEqual(len(text), budget)
+            self.assertEqual(text.count("- Image:"), kept)
+        self.assertEqual(builder.build(self.df, budget_tokens=len(full)), (full, 4))
+        self.assertEqual(builder.build(self.df, budget_tokens=0), ("", 0))
+
+if __name__ == '__main__':
+    unittest.main()
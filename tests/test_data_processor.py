@@ -0,0 +1,41 @@
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+import pandas as pd
+from core.data_processor import DataProcessor
+
+class TestDataProcessor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        pd.DataFrame({
+            "id": [1, 2, 3, 4],
+            "gender": ["Men", "Women", "Men", None],
+            "masterCategory": ["Apparel"] * 4,
+            "articleType": ["Shirts", "Dresses", "Jeans", "Shirts"],
+            "baseColour": ["Navy Blue", "Red, White", "Blue", "Black"],
+            "season": ["Summer", "Winter", "Fall", "Summer"],
+            "usage": ["Casual", "Party", "Casual", "Casual"],
+        }).to_csv(Path(self.tmp.name) / "styles.csv", index=False)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunked_cleaning(self):
+        df = DataProcessor(self.tmp.name, chunk_size=2).load_and_clean()
+        self.assertEqual(df["id"].tolist(), [1, 2, 3])
+        self.assertNotIn("masterCategory", df.columns)
+        self.assertEqual(df["baseColour"].tolist(), [["navy blue"], ["red", "white"], ["blue"]])
+        self.assertEqual(df["gender"].tolist(), ["men", "women", "men"])
+
+    def test_repeat_load_reads_cache(self):
+        processor = DataProcessor(self.tmp.name, chunk_size=2)
+        first = processor.load_and_clean()
+        # 命中缓存时既不解析 CSV 也不检查下载
+        with mock.patch.object(DataProcessor, "_clean_chunks", side_effect=AssertionError), \
+                mock.patch.object(DataProcessor, "_source_path", side_effect=AssertionError):
+            second = DataProcessor(self.tmp.name).load_and_clean()
+        pd.testing.assert_frame_equal(first, second)
+
+if __name__ == '__main__':
+    unittest.main()
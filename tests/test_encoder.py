@@ -0,0 +1,40 @@
+import itertools
+import unittest
+import tempfile
+from core.encoder import CPUEncoder, get_encoder, parity_report
+from tests.fakes import make_encoder_model
+
+NEEDS = ["面试穿搭", "夏季通勤", "小个子显高", "约会", "海边度假", "冬季保暖", "职场正装", "周末休闲"]
+STYLES = ["A字连衣裙", "直筒西裤", "阔腿裤", "衬衫裙", "针织开衫", "风衣", "Shirts", "Jeans"]
+SCENES = ["通勤；休闲", "正式；派对", "度假；运动"]
+
+class TestEncoderBackends(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.model = make_encoder_model(cls.tmp.name, n_layer=2, hidden=64)
+        # 与知识库相同的文本形式：用户需求 + 适用场景，用户需求单独作为查询
+        needs = [f"{need} {style}" for need, style in itertools.product(NEEDS, STYLES)]
+        cls.corpus = [f"{need} {scenes}" for need, scenes in itertools.product(needs, SCENES)]
+        cls.queries = needs
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_int8_retrieves_same_neighbours(self):
+        report = parity_report(CPUEncoder(self.model, "torch"), CPUEncoder(self.model, "int8"),
+                               self.corpus, self.queries, k=5)
+        self.assertGreaterEqual(report["top1_agreement"], 0.9)
+        self.assertGreaterEqual(report["recall@5"], 0.9)
+        self.assertGreater(report["cosine_min"], 0.99)
+
+    def test_encoder_is_shared(self):
+        config = {"model": self.model, "backend": "int8"}
+        encoder = get_encoder(config)
+        self.assertIs(get_encoder(dict(config)), encoder)
+        self.assertIsNot(get_encoder({**config, "backend": "torch"}), encoder)
+        self.assertEqual(encoder.encode(["红色连衣裙", "navy chinos"]).shape, (2, 64))
+
+if __name__ == '__main__':
+    unittest.main()
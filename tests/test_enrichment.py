@@ -0,0 +1,61 @@
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from core.enrichment import EnrichmentPipeline
+
+class StubClient:
+    """本地桩客户端：前 fail_times 次调用抛错"""
+    def __init__(self, fail_times=0):
+        self.calls = 0
+        self.fail_times = fail_times
+
+    def __call__(self, prompt):
+        self.calls += 1
+        if self.calls <= self.fail_times:
+            raise ConnectionError("stub failure")
+        return json.dumps({"用户需求": prompt}, ensure_ascii=False)
+
+class TestEnrichmentPipeline(unittest.TestCase):
+    def test_retries_then_succeeds(self):
+        client = StubClient(fail_times=2)
+        pipeline = EnrichmentPipeline(client, max_workers=1, rate_limit=0, backoff_base=0)
+        results = pipeline.run({"a": "连衣裙"})
+        self.assertEqual(results["a"], {"用户需求": "连衣裙"})
+        self.assertEqual(client.calls, 3)
+
+    def test_resumes_from_journal(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Path(tmp) / "journal.jsonl"
+            EnrichmentPipeline(StubClient(), journal, rate_limit=0).run({"a": "x", "b": "y"})
+
+            client = StubClient()
+            results = EnrichmentPipeline(client, journal, rate_limit=0).run({"a": "x", "b": "y", "c": "z"})
+            self.assertEqual(client.calls, 1)  # 只处理新增的 c
+            self.assertEqual(set(results), {"a", "b", "c"})
+
+    def test_changed_prompt_is_not_reused(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Path(tmp) / "journal.jsonl"
+            EnrichmentPipeline(StubClient(), journal, rate_limit=0).run({"a": "x", "b": "y"})
+
+            client = StubClient()
+            results = EnrichmentPipeline(client, journal, rate_limit=0).run({"a": "x2", "b": "y"})
+            self.assertEqual(client.calls, 1)  # 提示变化（模板或对话）的 a 重新生成
+            self.assertEqual(results["a"], {"用户需求": "x2"})
+
+    def test_empty_parse_is_retried_and_not_journaled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            journal = Path(tmp) / "journal.jsonl"
+            client = lambda prompt: "{}"
+            results = EnrichmentPipeline(client, journal, rate_limit=0, max_retries=2, backoff_base=0).run({"a": "x"})
+            self.assertEqual(results, {"a": {}})
+            self.assertFalse(journal.exists())
+
+            client = StubClient()
+            results = EnrichmentPipeline(client, journal, rate_limit=0).run({"a": "x"})
+            self.assertEqual(client.calls, 1)
+            self.assertEqual(results["a"], {"用户需求": "x"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+from concurrent.futures import TimeoutError
+from tests.fakes import make_tiny_llm
+from core.generation_scheduler import GenerationScheduler
+
+PROMPTS = ["User: Men, Winter\n", "User: Women, Summer, Spring skin tone, size M\n", "Hi\n"]
+
+
+class TestGenerationScheduler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model, cls.tokenizer = make_tiny_llm()
+        cls.generate_kwargs = {"max_new_tokens": 12, "do_sample": False}
+
+    def _scheduler(self, **kwargs):
+        return GenerationScheduler(self.model, self.tokenizer, max_length=512,
+                                   generate_kwargs=self.generate_kwargs, **kwargs)
+
+    def test_batched_output_matches_unbatched(self):
+        padding_side = self.tokenizer.padding_side
+        expected = [self._scheduler()._generate_batch([p])[0] for p in PROMPTS]
+        # 等待窗口足够长，三条并发请求合为一批（长度不同，左侧填充）
+        scheduler = self._scheduler(max_batch_size=len(PROMPTS), max_wait_ms=2000).start()
+        try:
+            futures = [scheduler.submit(p) for p in PROMPTS]
+            self.assertEqual([f.result(30) for f in futures], expected)
+            self.assertEqual(scheduler.stats()["batch_size_histogram"], {len(PROMPTS): 1})
+        finally:
+            scheduler.stop()
+        self.assertEqual(self.tokenizer.padding_side, padding_side)  # 共享分词器未被修改
+
+    def test_timeout_cancels_and_stop_fails_pending(self):
+        scheduler = self._scheduler(max_batch_size=1)
+        release = threading.Event()
+        original = scheduler._generate_batch
+        scheduler._generate_batch = lambda prompts, *args: release.wait(10) and original(prompts, *args)
+        scheduler.start()
+        running = scheduler.submit(PROMPTS[0])
+        time.sleep(0.2)  # 第一条已进入生成，阻塞调度线程
+        with self.assertRaises(TimeoutError):
+            scheduler.generate(PROMPTS[1], timeout=0.05)
+        pending = scheduler.submit(PROMPTS[2])
+        scheduler._stop.set()
+        release.set()
+        self.assertTrue(running.result(10))
+        scheduler.stop(10)
+        with self.assertRaisesRegex(RuntimeError, "stopped"):
+            pending.result(1)
+        with self.assertRaises(RuntimeError):
+            scheduler.submit(PROMPTS[0])
+        self.assertEqual(scheduler.stats()["requests"], 1)  # 超时取消的请求没有生成
+
+    def test_caller_stop_event_skips_request(self):
+        scheduler = self._scheduler(max_batch_size=1)
+        release = threading.Event()
+        original = scheduler._generate_batch
+        scheduler._generate_batch = lambda prompts, *args: release.wait(10) and original(prompts, *args)
+        scheduler.start()
+        try:
+            running = scheduler.submit(PROMPTS[0])
+            time.sleep(0.2)
+            stop = threading.Event()
+            queued = scheduler.submit(PROMPTS[1], stop=stop)
+            stop.set()  # 调用方放弃：轮到该请求时不再生成
+            release.set()
+            self.assertTrue(running.result(10))
+            for _ in range(100):
+                if queued.done():
+                    break
+                time.sleep(0.05)
+            self.assertTrue(queued.cancelled())
+        finally:
+            scheduler.stop(10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import unittest
+import tempfile
+from pathlib import Path
+from PIL import Image
+from core.image_store import ImageResolver, ThumbnailCache
+
+class TestImageResolver(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        for name in ["1.jpg", "2.png", "2.jpg"]:
+            Image.new("RGB", (400, 300), "red").save(self.dir / name)
+        (self.dir / "notes.txt").write_text("x")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_scan_prefers_extension_order(self):
+        resolver = ImageResolver(self.dir)
+        self.assertEqual(resolver.resolve(1), str(self.dir / "1.jpg"))
+        self.assertEqual(resolver.resolve("2"), str(self.dir / "2.jpg"))
+        self.assertIsNone(resolver.resolve("notes"))
+        self.assertIsNone(resolver.resolve(3))
+
+    def test_refresh_picks_up_new_files(self):
+        resolver = ImageResolver(self.dir, refresh_interval=0)
+        self.assertIsNone(resolver.resolve(3))
+        Image.new("RGB", (10, 10)).save(self.dir / "3.jpg")
+        os.utime(self.dir, ns=(0, os.stat(self.dir).st_mtime_ns + 10**9))
+        self.assertEqual(resolver.resolve(3), str(self.dir / "3.jpg"))
+
+    def test_thumbnails_are_content_addressed(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            thumbnails = ThumbnailCache(ImageResolver(self.dir), cache_dir)
+            path, digest = thumbnails.get(1)
+            self.assertEqual(thumbnails.get(2)[1], digest)  # 相同内容共享同一缩略图
+            with Image.open(path) as img:
+                self.assertLessEqual(max(img.size), 200)
+            self.assertEqual(thumbnails.get(99), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
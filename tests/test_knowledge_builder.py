@@ -0,0 +1,102 @@
+import json
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+import faiss
+import numpy as np
+import pandas as pd
+from tests.fakes import HashingEncoder
+from core.knowledge_builder import KnowledgeBuilder
+
+class StubLLM:
+    """本地桩 LLM：按对话内容返回结构化 JSON；对话包含 "fail" 时抛错"""
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        text = prompt.split("原始对话：")[1].split("要求：")[0].strip()
+        if "fail" in text:
+            raise ConnectionError("stub failure")
+        return json.dumps({
+            "用户需求": text,
+            "推荐款式": ["A字裙"],
+            "面料建议": ["棉"],
+            "关键特征": {"长度": "及膝", "领口": "圆领", "袖长": "短袖"},
+            "相关产品": [{"名称": "连衣裙", "颜色": "蓝色", "材质": "棉"}],
+            "场景标签": ["通勤", "休闲", "约会"],
+        }, ensure_ascii=False)
+
+class TestKnowledgeBuilder(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        config = {
+            "index": {"type": "flat"},
+            "enrichment": {"journal_file": None, "rate_limit_per_sec": 0, "max_retries": 1},
+        }
+        (self.dir / "config.yaml").write_text(json.dumps(config), encoding="utf-8")
+        self.llm = StubLLM()
+        self.builder = KnowledgeBuilder(self.dir / "config.yaml", llm_client=self.llm, encoder=HashingEncoder(dim=32))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _build(self, messages, incremental=False):
+        pd.DataFrame({"message": messages}).to_csv(self.dir / "dialogs.csv", index=False)
+        return self.builder.build_from_csv(self.dir / "dialogs.csv", self.dir / "kb", incremental=incremental)
+
+    def _saved(self):
+        kb = pd.read_csv(self.dir / "kb" / "structured_kb.csv")
+        manifest = json.loads((self.dir / "kb" / "manifest.json").read_text(encoding="utf-8"))
+        index = faiss.read_index(str(self.dir / "kb" / "kb_index.index"))
+        return kb, manifest, index
+
+    def test_full_then_incremental_build(self):
+        self._build(["summer dress", "office shirt", "winter coat"])
+        kb, manifest, index = self._saved()
+        self.assertEqual(kb["用户需求"].tolist(), ["summer dress", "office shirt", "winter coat"])
+        self.assertEqual(kb["适用场景"].iloc[0], "通勤；休闲；约会")
+        self.assertEqual(index.ntotal, 3)
+        self.assertEqual(manifest["next_id"], 3)
+
+        # 删除 office shirt，新增 linen trousers：只结构化新增的一条
+        self.llm.prompts.clear()
+        self._build(["summer dress", "winter coat", "linen trousers"], incremental=True)
+        kb, manifest, index = self._saved()
+        self.assertEqual(len(self.llm.prompts), 1)
+        self.assertEqual(kb["用户需求"].tolist(), ["summer dress", "winter coat", "linen trousers"])
+        self.assertEqual(kb["kb_id"].tolist(), [0, 2, 3])
+        self.assertEqual(sorted(manifest["hashes"].values()), [0, 2, 3])
+        self.assertEqual(index.ntotal, 3)
+        # 索引返回稳定 kb_id，且与保存的向量一致
+        embeddings = np.load(self.dir / "kb" / "kb_embeddings.npy")
+        self.assertEqual(index.search(embeddings[2:3], 1)[1][0][0], 3)
+
+    def test_failed_enrichment_is_retried(self):
+        self._build(["summer dress", "fail once"])
+        kb, manifest, index = self._saved()
+        self.assertEqual(kb["用户需求"].tolist(), ["summer dress"])
+        self.assertEqual(len(manifest["hashes"]), 1)
+        self.assertEqual(index.ntotal, 1)
+
+        self.llm.prompts.clear()
+        self._build(["summer dress", "fail once"], incremental=True)
+        self.assertEqual(len(self.llm.prompts), 1)  # 失败的对话未记入 manifest，会被重试
+
+    def test_journal_follows_output_dir_and_prompt(self):
+        self.builder.config["enrichment"]["journal_file"] = "enrichment_journal.jsonl"
+        self._build(["summer dress"])
+        self.assertTrue((self.dir / "kb" / "enrichment_journal.jsonl").exists())
+
+        self.llm.prompts.clear()
+        self._build(["summer dress"])
+        self.assertEqual(self.llm.prompts, [])  # 同一输出目录、同一提示：直接复用日志
+
+        with mock.patch("core.knowledge_builder.STRUCTURE_PROMPT", "新模板\n原始对话：{text}\n要求：JSON"):
+            self._build(["summer dress"])
+        self.assertEqual(len(self.llm.prompts), 1)  # 提示模板变化后重新结构化
+
+if __name__ == "__main__":
+    unittest.main()
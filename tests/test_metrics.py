@@ -0,0 +1,30 @@
+import unittest
+from core.metrics import MetricsRegistry, RequestTrace, end_trace, span, start_trace
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_renders_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("demo_seconds", "Demo.", labels=("stage",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, stage="retrieve")
+        text = registry.render()
+        self.assertIn('demo_seconds_bucket{stage="retrieve",le="0.1"} 1', text)
+        self.assertIn('demo_seconds_bucket{stage="retrieve",le="1.0"} 2', text)
+        self.assertIn('demo_seconds_bucket{stage="retrieve",le="+Inf"} 3', text)
+        self.assertIn('demo_seconds_count{stage="retrieve"} 3', text)
+
+    def test_span_accumulates_into_request_trace(self):
+        trace, token = start_trace()
+        try:
+            with span("retrieve"):
+                pass
+            with span("retrieve"):
+                pass
+        finally:
+            end_trace(token)
+        self.assertEqual(list(trace.spans), ["retrieve"])
+        self.assertTrue(trace.server_timing().startswith("retrieve;dur="))
+        self.assertIsInstance(trace, RequestTrace)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from tests.fakes import make_tiny_llm
+from core.generation_scheduler import GenerationScheduler
+from core.prefix_cache import PrefixCache
+
+PREFIX = "Example: navy chinos, white oxford shirt, brown loafers.\n" * 8 + "\n--- Current Task ---\n"
+SUFFIXES = ["User: Men, Winter, Autumn skin tone\n", "User: Women, Summer, Spring skin tone, 160cm 50kg\n"]
+
+
+class TestPrefixCache(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model, cls.tokenizer = make_tiny_llm()
+        cls.generate_kwargs = {"max_new_tokens": 12, "do_sample": False}
+
+    def _scheduler(self, prefix_cache=None):
+        return GenerationScheduler(self.model, self.tokenizer, max_length=1024,
+                                   generate_kwargs=self.generate_kwargs, prefix_cache=prefix_cache)
+
+    def test_cached_prefix_matches_full_prefill(self):
+        cache = PrefixCache(self.model, self.tokenizer, max_length=1024)
+        cache.build(PREFIX)
+        prompts = [PREFIX + s for s in SUFFIXES]
+        expected = self._scheduler()._generate_batch(prompts)
+        # 批量（前缀后填充）与单条两种形态都应与完整 prefill 的贪心结果一致
+        self.assertEqual(self._scheduler(cache)._generate_batch(prompts), expected)
+        self.assertEqual([self._scheduler(cache)._generate_batch([p])[0] for p in prompts], expected)
+
+    def test_rebuild_and_fallback(self):
+        cache = PrefixCache(self.model, self.tokenizer, max_length=1024)
+        entry = cache.build(PREFIX)
+        self.assertIs(cache.build(PREFIX), entry)
+        self.assertIsNone(cache.prepare(["unrelated prompt"]))
+        cache.build("Other examples\n")
+        self.assertIsNone(cache.prepare([PREFIX + SUFFIXES[0]]))
+        self.assertIsNotNone(cache.prepare(["Other examples\n" + SUFFIXES[0]]))
+
+
+if __name__ == '__main__':
+    unittest.main()
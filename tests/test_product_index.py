@@ -0,0 +1,75 @@
+import unittest
+import tempfile
+import numpy as np
+import pandas as pd
+from tests.fakes import HashingEncoder
+from core.catalog import CompactCatalog
+from core.product_index import ProductEmbeddingIndex, product_texts
+from core.recommender import EnhancedRecommender
+
+class StubRAG:
+    """颜色参数固定为 red / blue，查询向量用哈希编码器生成"""
+    def __init__(self, encoder):
+        self.encoder = encoder
+
+    def parse_query(self, query):
+        return {"colors": ["red", "blue"], "styles": [], "materials": []}
+
+    def encode_queries(self, queries):
+        return self.encoder.encode(queries)
+
+class TestProductIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.df = pd.DataFrame({
+            "id": [1, 2, 3, 4],
+            "gender": ["Women", "Men", "Men", "Women"],
+            "articleType": ["Dresses", "Jeans", "Shirts", "Dresses"],
+            "season": ["Summer", "Winter", "Summer", "Fall"],
+            "baseColour": [["red"], ["blue"], ["white"], ["blue"]],
+            "productDisplayName": ["Catwalk Women Red Dress", "Levis Men Blue Jeans",
+                                   "Arrow Men White Shirt", "Vero Moda Women Blue Dress"],
+        })
+        self.catalog = CompactCatalog.from_dataframe(self.df)
+        self.encoder = HashingEncoder(dim=64)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_quantized_search_matches_float32(self):
+        exact = self.encoder.encode(product_texts(self.catalog, np.arange(4)))
+        for dtype in ("int8", "float16"):
+            ProductEmbeddingIndex.build(self.catalog, self.encoder, f"{self.tmp.name}/{dtype}",
+                                        dtype=dtype, batch_size=3)
+            index = ProductEmbeddingIndex.load(f"{self.tmp.name}/{dtype}")
+            self.assertIsInstance(index.vectors, np.memmap)
+            self.assertEqual(index.vectors.dtype, np.dtype(dtype))
+            self.assertTrue(index.matches(self.catalog))
+            for query in ("blue jeans for men", "red summer dress", "white shirt"):
+                q = self.encoder.encode([query])[0]
+                np.testing.assert_allclose(index.similarity(q), exact @ q, atol=0.02)
+                self.assertEqual(index.search(q, k=2)[0].tolist(), np.argsort(-(exact @ q))[:2].tolist())
+                # 属性过滤：只在给定行中检索
+                self.assertTrue(set(index.search(q, k=2, rows=[1, 2])[0].tolist()) <= {1, 2})
+
+    def test_hybrid_recommendation_reranks_filtered_candidates(self):
+        index = ProductEmbeddingIndex.build(self.catalog, self.encoder, f"{self.tmp.name}/int8")
+        recommender = EnhancedRecommender(self.catalog, rag=StubRAG(self.encoder), product_index=index)
+        results = recommender.recommend("Levis Men Blue Jeans", top_k=3)
+        # 白色衬衫不满足颜色过滤；同为蓝色时按语义相似度排序
+        self.assertNotIn(3, results["id"].tolist())
+        self.assertEqual(results.iloc[0]["id"], 2)
+
+        other = CompactCatalog.from_dataframe(self.df.iloc[:3])
+        with self.assertRaises(ValueError):
+            EnhancedRecommender(other, rag=StubRAG(self.encoder), product_index=index)
+        # 查询编码器的维度或模型与建索引时不同
+        with self.assertRaisesRegex(ValueError, "64-d"):
+            EnhancedRecommender(self.catalog, rag=StubRAG(HashingEncoder(dim=32)), product_index=index)
+        renamed = HashingEncoder(dim=64)
+        renamed.model_name, renamed.backend = "other-model", "int8"
+        with self.assertRaisesRegex(ValueError, "other-model"):
+            EnhancedRecommender(self.catalog, rag=StubRAG(renamed), product_index=index)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,9 @@
 import pytest
+import faiss
+import numpy as np
+import pandas as pd
 from core.rag_system import EnhancedFashionRAG
+from core.embedding_cache import QueryEmbeddingCache, normalize_query
 
 class TestRAGSystem:
     @pytest.fixture
@@ -17,3 +21,87 @@ class TestRAGSystem:
         for query, expected in test_cases:
             params = rag_system.parse_query(query)
             assert all(k in params for k in expected.keys())
+
+
+class TestQueryEmbeddingCache:
+    def test_lru_eviction_and_stats(self):
+        cache = QueryEmbeddingCache(max_size=2)
+        cache.put(normalize_query("Job  Interview Dress "), [1.0, 0.0])
+        cache.put("a", [0.0, 1.0])
+        cache.put("b", [1.0, 1.0])
+
+        assert cache.get("job interview dress") is None  # 最早写入的已被淘汰
+        assert cache.get("b") is not None
+        stats = cache.stats()
+        assert stats["hits"] == 1 and stats["misses"] == 1
+        assert stats["size"] == 2
+
+
+class RecordingEncoder:
+    """记录被编码的原始文本"""
+    model_name = "recording"
+    backend = "torch"
+
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.seen = []
+
+    def encode(self, texts, **kwargs):
+        self.seen.extend(texts)
+        return np.ones((len(texts), self.dim), dtype=np.float32)
+
+
+class TestEncodeQueries:
+    @pytest.fixture
+    def rag(self, tmp_path):
+        pd.DataFrame({"kb_id": [0], "推荐款式": ["A字裙"], "适用面料": ["棉"], "baseColour": ["red"]}).to_csv(
+            tmp_path / "kb.csv", index=False)
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(8))
+        index.add_with_ids(np.ones((1, 8), dtype=np.float32), np.array([0], dtype="int64"))
+        faiss.write_index(index, str(tmp_path / "kb.index"))
+        config = {"knowledge_path": tmp_path / "kb.csv", "index_path": str(tmp_path / "kb.index"),
+                  "mmap_index": False, "query_cache_dir": str(tmp_path / "cache")}
+        return lambda encoder: EnhancedFashionRAG(config, encoder=encoder)
+
+    def test_encodes_original_text_once_per_key(self, rag):
+        encoder = RecordingEncoder()
+        embeds = rag(encoder).encode_queries(["Ｊｏｂ  Interview", "job interview", "Beach"])
+        assert embeds.shape == (3, 8)
+        assert encoder.seen == ["Ｊｏｂ  Interview", "Beach"]
+
+    def test_empty_batch(self, rag):
+        assert rag(RecordingEncoder()).parse_queries([]) == []
+
+    def test_disk_cache_is_per_encoder(self, rag):
+        rag(RecordingEncoder()).encode_queries(["beach"])
+        same = RecordingEncoder()
+        rag(same).encode_queries(["beach"])
+        assert same.seen == []  # 同一编码器：磁盘命中
+
+        other = RecordingEncoder()
+        other.backend = "int8"
+        rag(other).encode_queries(["beach"])
+        assert other.seen == ["beach"]
+
+
+class TestThresholds:
+    @pytest.mark.parametrize("metric", ["l2", "ip"])
+    def test_per_metric_threshold(self, tmp_path, metric):
+        from tests.fakes import HashingEncoder
+        from core.ann_index import build_index
+        encoder = HashingEncoder(dim=64)
+        kb = pd.DataFrame({"kb_id": [0, 1], "推荐款式": ["A字裙", "西装"], "适用面料": ["棉", "羊毛"],
+                           "baseColour": ["red", "navy blue"]})
+        kb.to_csv(tmp_path / "kb.csv", index=False)
+        index, _ = build_index(encoder.encode(["summer beach dress", "formal office suit"]),
+                               {"type": "flat", "metric": metric}, ids=kb["kb_id"].to_numpy())
+        faiss.write_index(index, str(tmp_path / "kb.index"))
+        config = {"knowledge_path": tmp_path / "kb.csv", "index_path": str(tmp_path / "kb.index"), "mmap_index": False}
+
+        rag = EnhancedFashionRAG(config, encoder=encoder)
+        assert rag.threshold == {"l2": 0.6, "ip": 0.7}[metric]
+        assert rag.parse_query("summer beach dress")["styles"] == ["A字裙"]
+        assert rag.parse_query("zzz qqq") == {"colors": [], "styles": [], "materials": []}
+        # 只覆盖另一种度量的阈值不影响当前索引
+        other = "ip" if metric == "l2" else "l2"
+        assert EnhancedFashionRAG({**config, "thresholds": {other: 0.0}}, encoder=encoder).threshold == rag.threshold
@@ -1,7 +1,10 @@
 import unittest
 import pandas as pd
+from fuzzywuzzy import fuzz
 from core import DataProcessor, EnhancedRecommender
 from core.rag_system import FashionRAG
+from core.catalog import CompactCatalog
+from core.scoring import ScoringEngine
 
 class TestRecommender(unittest.TestCase):
     @classmethod
@@ -26,5 +29,76 @@ class TestRecommender(unittest.TestCase):
         path = ImageUtils.validate_image_path("/mock/path", 1)
         self.assertIsNone(path)  # 假设路径不存在
 
+class TestScoringEngine(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "id": [1, 2, 3, 4],
+            "articleType": ["dress", "jeans", "shirt", "dress"],
+            "baseColour": [["red"], ["blue"], ["white", "red"], []],
+            "material": ["cotton", "denim", "linen blend", "silk"]
+        })
+        self.engine = ScoringEngine(self.df, {"color": 0.4, "style": 0.3, "material": 0.3})
+
+    def test_colour_mask_filters_candidates(self):
+        # 指定颜色时只保留命中颜色的商品
+        _, candidates = self.engine.score({"colors": ["red"], "styles": [], "materials": []})
+        self.assertEqual(candidates.tolist(), [0, 2])
+
+    def test_scores_match_weighted_formula(self):
+        # 批量得分与逐行加权公式一致
+        params = {"colors": ["red", "white"], "styles": ["dress"], "materials": ["linen"]}
+        scores, _ = self.engine.score(params)
+        self.assertAlmostEqual(scores[0], 0.4 * 0.5 + 0.3 * 1.0)
+        self.assertAlmostEqual(scores[2], 0.4 * 1.0 + 0.3 * fuzz.ratio("dress", "shirt") / 100 + 0.3)
+
+    def test_top_k_orders_by_score(self):
+        scores, candidates = self.engine.score({"colors": [], "styles": ["dress"], "materials": []})
+        rows = self.engine.top_k(scores, candidates, 2)
+        self.assertEqual(rows.tolist(), [0, 3])
+
+class StubRAG:
+    """按查询文本返回固定参数，记录批量调用次数"""
+    def __init__(self):
+        self.calls = 0
+
+    def parse_queries(self, queries):
+        self.calls += 1
+        return [{"colors": ["red"] if "红" in q else ["blue"], "styles": [], "materials": []} for q in queries]
+
+class TestRecommendMany(unittest.TestCase):
+    def test_groups_queries_and_keeps_input_order(self):
+        df = pd.DataFrame({
+            "id": [1, 2, 3],
+            "articleType": ["dress", "jeans", "shirt"],
+            "baseColour": [["red"], ["blue"], ["white"]]
+        })
+        rag = StubRAG()
+        recommender = EnhancedRecommender(df, rag=rag)
+        outputs = recommender.recommend_many(["红色连衣裙", "", "蓝色牛仔裤", "红色裙子"], top_k=1)
+        self.assertEqual(rag.calls, 1)
+        self.assertEqual([o["results"]["id"].tolist() if o["error"] is None else None for o in outputs],
+                         [[1], None, [2], [1]])
+
+class TestCompactCatalog(unittest.TestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({
+            "id": [10, 11, 12],
+            "gender": ["Women", "Men", "Unisex"],
+            "articleType": ["Dress", "Shirts", "Tshirts"],
+            "season": ["Summer", "Fall", "Summer"],
+            "baseColour": [["navy blue"], "Black", ["white", "mystery"]]
+        })
+        self.catalog = CompactCatalog.from_dataframe(self.df)
+
+    def test_filter_by_codes_and_colour_bits(self):
+        rows = self.catalog.filter(gender=["women", "unisex"], season="summer", colours=["white", "navy blue"])
+        self.assertEqual(rows.tolist(), [0, 2])
+        self.assertEqual(self.catalog.filter(colours=["black"]).tolist(), [1])
+
+    def test_round_trip_to_dataframe(self):
+        df = self.catalog.to_dataframe([2])
+        self.assertEqual(df.iloc[0]["id"], 12)
+        self.assertEqual(df.iloc[0]["baseColour"], ["white", "mystery"])  # 词表来自数据，颜色不丢失
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+import pandas as pd
+from core.attribute_index import AttributeIndex
+from core.catalog import CompactCatalog
+from core.response_cache import ResponseCache, normalize_request
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT / "core") not in sys.path:
+    sys.path.insert(0, str(ROOT / "core"))
+import rag_pipeline  # noqa: E402
+
+def size_bucket(height_cm, weight_kg):
+    return "M" if height_cm < 180 else "L"
+
+class TestNormalizeRequest(unittest.TestCase):
+    def test_equivalent_requests_share_a_key(self):
+        a = {"gender": "Women", "skin_tone": " Warm ", "season": "Autumn", "height_cm": 165, "weight_kg": 55}
+        b = {"gender": "women", "skin_tone": "warm", "season": "fall", "height_cm": 170, "weight_kg": 60}
+        self.assertEqual(normalize_request(a, size_bucket), normalize_request(b, size_bucket))
+        self.assertNotEqual(normalize_request(a, size_bucket),
+                            normalize_request({**a, "height_cm": 185}, size_bucket))
+
+    def test_skin_tone_key_matches_retrieval(self):
+        # 缓存键合并的肤色写法，检索时必须命中同一颜色组
+        catalog = CompactCatalog.from_dataframe(pd.DataFrame({
+            "id": [1, 2], "gender": ["Women", "Women"], "season": ["Fall", "Fall"],
+            "articleType": ["Tops", "Tops"], "baseColour": ["Red", "Blue"],
+        }))
+        index = AttributeIndex.build(catalog, colour_groups={"Warm": ["red"]})
+        for skin_tone in ("Warm", "warm", " WARM "):
+            self.assertEqual(index.query(colour_group=skin_tone).tolist(), [0])
+
+    def test_equivalent_requests_share_a_prompt(self):
+        # 缓存命中时返回的是另一条等价请求生成的结果，两者的提示必须相同
+        a = {"gender": "Women", "skin_tone": " Warm ", "season": "Autumn", "height_cm": 165, "weight_kg": 55}
+        b = {"gender": "women", "skin_tone": "warm", "season": "fall", "height_cm": 170, "weight_kg": 60}
+        retrieved = pd.DataFrame({"id": [1], "productDisplayName": ["Red Top"], "articleType": ["Tops"],
+                                  "baseColour": ["Red"], "image_path": [None]})
+        with mock.patch.object(rag_pipeline, "get_size_suggestion", size_bucket, create=True), \
+                mock.patch.object(rag_pipeline, "tokenizer", None):
+            prompt = rag_pipeline.build_prompt(a, retrieved)
+            self.assertEqual(prompt, rag_pipeline.build_prompt(b, retrieved))
+        self.assertIn("season Fall", prompt)
+
+class TestResponseCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = ResponseCache(max_size=2, ttl_seconds=None)
+        cache.put("a", 1, "v1")
+        cache.put("b", 2, "v1")
+        self.assertEqual(cache.get("a", "v1"), 1)  # a 变为最近使用
+        cache.put("c", 3, "v1")
+        self.assertIsNone(cache.get("b", "v1"))
+        self.assertEqual(cache.get("a", "v1"), 1)
+        self.assertEqual(cache.get("c", "v1"), 3)
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"]), (2, 3, 1))
+
+    def test_ttl_expiry(self):
+        cache = ResponseCache(ttl_seconds=10)
+        with mock.patch("core.response_cache.time.monotonic", return_value=100.0):
+            cache.put("a", 1, "v1")
+        with mock.patch("core.response_cache.time.monotonic", return_value=109.0):
+            self.assertEqual(cache.get("a", "v1"), 1)
+        with mock.patch("core.response_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("a", "v1"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_version_change_invalidates(self):
+        cache = ResponseCache()
+        cache.put("a", 1, "catalog1:model")
+        self.assertEqual(cache.get("a", "catalog1:model"), 1)
+        self.assertIsNone(cache.get("a", "catalog2:model"))
+        cache.put("b", 2, "catalog2:model")
+        self.assertIsNone(cache.get("b", "catalog2:other-model"))
+
+if __name__ == "__main__":
+    unittest.main()
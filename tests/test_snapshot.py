@@ -0,0 +1,118 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from pathlib import Path
+from unittest import mock
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+for path in (ROOT / "api", ROOT / "core"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+import rag_pipeline  # noqa: E402
+from core.catalog import CompactCatalog  # noqa: E402
+from tests.fakes import SKIN_TONE_GROUPS, make_styles  # noqa: E402
+
+FEW_SHOT = "User: Men, Winter\nAssistant: - Image: 1.jpg\n"
+
+
+def _fake_datasets(fail=False):
+    def load_dataset(name):
+        if fail:
+            raise ConnectionError("offline")
+        return {"train": []}
+    return types.SimpleNamespace(load_dataset=load_dataset)
+
+
+class TestSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.csv = Path(cls.tmp.name) / "styles.csv"
+        make_styles(300).to_csv(cls.csv, index=False)
+        # 导入 app 时不加载任何组件、不启动预热线程，状态由各测试驱动
+        with mock.patch.object(rag_pipeline, "start"), mock.patch.dict(os.environ, {"FASHION_API_PRELOAD": "1"}):
+            import app
+        cls.client = app.app.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        for component in rag_pipeline.readiness():
+            rag_pipeline._set_status(component, "pending")
+        patcher = mock.patch.object(rag_pipeline, "SKIN_TONE_COLOR_MAP", SKIN_TONE_GROUPS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.snapshot_dir = Path(self.tmp.name) / f"snapshot-{self.id().rsplit('.', 1)[-1]}"
+
+    def _build(self, fail_few_shot=False):
+        with mock.patch.dict(sys.modules, {"datasets": _fake_datasets(fail_few_shot)}), \
+                mock.patch.object(rag_pipeline, "format_hf_examples_for_prompt",
+                                  lambda dataset, num_examples: FEW_SHOT, create=True):
+            rag_pipeline.build_snapshot(str(self.snapshot_dir), csv_path=str(self.csv))
+
+    def _ready(self):
+        response = self.client.get("/ready")
+        return response.status_code, response.get_json()
+
+    def test_build_snapshot_writes_catalog_index_and_few_shot(self):
+        self._build()
+        catalog = CompactCatalog.load(self.snapshot_dir)
+        self.assertEqual(catalog.fingerprint(), rag_pipeline.product_catalog.fingerprint())
+        expected = pd.read_csv(self.csv).dropna(
+            subset=["gender", "baseColour", "season", "articleType", "productDisplayName"])
+        self.assertEqual(catalog.ids.tolist(), expected["id"].tolist())
+        self.assertTrue((self.snapshot_dir / "attr_index.npz").exists())
+        self.assertEqual((self.snapshot_dir / rag_pipeline.FEW_SHOT_FILE).read_text(encoding="utf-8"), FEW_SHOT)
+        meta = json.loads((self.snapshot_dir / "snapshot_meta.json").read_text(encoding="utf-8"))
+        self.assertEqual(meta, {"source_csv": str(self.csv), "rows": len(catalog), "fingerprint": catalog.fingerprint()})
+
+    def test_snapshot_without_few_shot(self):
+        with self.assertLogs(level="WARNING") as logs:
+            self._build(fail_few_shot=True)
+        self.assertTrue(any("without few-shot" in line for line in logs.output))
+        self.assertFalse((self.snapshot_dir / rag_pipeline.FEW_SHOT_FILE).exists())
+        self.assertEqual(rag_pipeline.readiness()["few_shot"], "failed")
+
+    def test_ready_follows_component_status(self):
+        self._build()
+        for component in rag_pipeline.readiness():
+            rag_pipeline._set_status(component, "pending")
+        self.assertEqual(self._ready()[0], 503)
+
+        # 目录与 few-shot 从快照同步加载，LLM 在后台线程加载
+        llm_loading, release = threading.Event(), threading.Event()
+
+        def load_llm():
+            rag_pipeline._set_status("llm", "loading")
+            llm_loading.set()
+            release.wait(10)
+            rag_pipeline._set_status("llm", "ready")
+        with mock.patch.object(rag_pipeline, "load_llm", load_llm):
+            loader = rag_pipeline.start(snapshot_dir=str(self.snapshot_dir))
+            self.assertTrue(llm_loading.wait(10))
+            status, body = self._ready()
+            self.assertEqual(status, 503)
+            self.assertEqual(body, {"ready": False,
+                                    "components": {"catalog": "ready", "few_shot": "ready", "llm": "loading"}})
+            self.assertEqual(rag_pipeline.few_shot_prompt_examples, FEW_SHOT)
+            release.set()
+            loader.join(10)
+        self.assertEqual(self._ready(), (200, {"ready": True, "components": {
+            "catalog": "ready", "few_shot": "ready", "llm": "ready"}}))
+
+        # 目录加载失败后重新变为未就绪
+        rag_pipeline.load_catalog(csv_path=str(Path(self.tmp.name) / "missing.csv"))
+        status, body = self._ready()
+        self.assertEqual(status, 503)
+        self.assertEqual(body["components"]["catalog"], "failed")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+import unittest
+import torch
+from transformers import StoppingCriteriaList
+from tests.fakes import make_tiny_llm
+from core.generation_scheduler import GenerationScheduler
+from core.streaming import (IMAGE_REF_PATTERN, AsyncTokenStream, ImageReferenceExtractor, StopOnEvent,
+                            sse_event)
+
+PROMPTS = ["User: Men, Winter\n", "User: Women, Summer, Spring skin tone\n", "Hi\n"]
+TEXT = ("Try the navy jeans (Image: 12.jpg) with a white shirt, image-7.jpg.\n"
+        "Not a reference: Image 3.png or images. Also Image:  450.jpg and Image: 12.jpg again.")
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+class TestSSEAndExtractor(unittest.TestCase):
+    def test_sse_event(self):
+        self.assertEqual(sse_event("token", {"text": "蓝色 jeans"}),
+                         'event: token\ndata: {"text": "蓝色 jeans"}\n\n')
+
+    def test_extractor_emits_each_reference_once_across_chunks(self):
+        expected = IMAGE_REF_PATTERN.findall(TEXT)
+        for size in (1, 2, 5, 13, len(TEXT)):
+            extractor = ImageReferenceExtractor()
+            found = []
+            for start in range(0, len(TEXT), size):
+                found += extractor.feed(TEXT[start:start + size])
+            self.assertEqual(found, expected)
+            self.assertEqual(extractor.references, expected)
+            self.assertEqual(extractor.text, TEXT)
+
+    def test_extractor_only_rescans_pending_reference(self):
+        extractor = ImageReferenceExtractor()
+        extractor.feed("Image: 1.jpg " + "plain text " * 50)
+        self.assertGreaterEqual(extractor._pos, len(extractor.text) - len("Imag"))
+        # 未写完的引用保留到下一个片段；已不可能补全的 "Image 3.png" 不再重扫
+        extractor.feed("then Image: 2")
+        self.assertEqual(extractor.text[extractor._pos:], "Image: 2")
+        self.assertEqual(extractor.feed(".jpg"), ["2.jpg"])
+        extractor.feed(" and Image 3.png, ok")
+        self.assertGreaterEqual(extractor._pos, len(extractor.text) - len("Imag"))
+
+
+class TestTokenStreams(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.model, cls.tokenizer = make_tiny_llm()
+        cls.generate_kwargs = {"max_new_tokens": 12, "do_sample": False}
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def _generate(self, prompt, **kwargs):
+        inputs = self.tokenizer(prompt, return_tensors="pt")
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, pad_token_id=self.tokenizer.pad_token_id,
+                                          **self.generate_kwargs, **kwargs)
+        return outputs[0][inputs["input_ids"].shape[1]:]
+
+    def _stream(self, prompt, stream):
+        def run():
+            try:
+                self._generate(prompt, streamer=stream,
+                               stopping_criteria=StoppingCriteriaList([StopOnEvent([stream.stop])]))
+            except Exception as e:
+                stream.fail(e)
+        thread = threading.Thread(target=run)
+        thread.start()
+        chunks = self.loop.run_until_complete(_collect(stream))
+        thread.join()
+        return chunks
+
+    def test_async_stream_matches_generate(self):
+        expected = self.tokenizer.decode(self._generate(PROMPTS[0]), skip_special_tokens=True)
+        stream = AsyncTokenStream(self.tokenizer, self.loop, skip_special_tokens=True)
+        self.assertEqual("".join(self._stream(PROMPTS[0], stream)), expected)
+
+    def test_cancel_stops_generation(self):
+        stream = AsyncTokenStream(self.tokenizer, self.loop, skip_special_tokens=True)
+        stream.cancel()
+        self.assertLessEqual(len("".join(self._stream(PROMPTS[0], stream))), 1)
+
+    def test_fail_is_raised_to_consumer(self):
+        stream = AsyncTokenStream(self.tokenizer, self.loop)
+        stream.on_finalized_text("partial")
+        stream.fail(ValueError("boom"))
+        with self.assertRaisesRegex(ValueError, "boom"):
+            self.loop.run_until_complete(_collect(stream))
+
+    def test_streams_share_a_batch_with_plain_requests(self):
+        expected = [self.tokenizer.decode(self._generate(p), skip_special_tokens=True) for p in PROMPTS]
+        scheduler = GenerationScheduler(self.model, self.tokenizer, max_batch_size=len(PROMPTS), max_wait_ms=2000,
+                                        max_length=512, generate_kwargs=self.generate_kwargs).start()
+        try:
+            streams = [AsyncTokenStream(self.tokenizer, self.loop, skip_special_tokens=True) for _ in PROMPTS[:2]]
+            futures = [scheduler.submit(p, streamer=s) for p, s in zip(PROMPTS, streams)]
+            futures.append(scheduler.submit(PROMPTS[2]))
+            streamed = [self.loop.run_until_complete(_collect(s)) for s in streams]
+            self.assertEqual([f.result(30) for f in futures], expected)
+            self.assertEqual(["".join(chunks) for chunks in streamed], expected[:2])
+            self.assertEqual(scheduler.stats()["batch_size_histogram"], {len(PROMPTS): 1})
+        finally:
+            scheduler.stop()
+
+    def test_cancelled_stream_is_not_generated(self):
+        scheduler = GenerationScheduler(self.model, self.tokenizer, max_batch_size=2, max_wait_ms=500,
+                                        max_length=512, generate_kwargs=self.generate_kwargs)
+        stream = AsyncTokenStream(self.tokenizer, self.loop, skip_special_tokens=True)
+        cancelled = scheduler.submit(PROMPTS[0], streamer=stream)
+        stream.cancel()  # 排队期间客户端断开
+        plain = scheduler.submit(PROMPTS[1])
+        scheduler.start()
+        try:
+            self.assertTrue(plain.result(30))
+            self.assertTrue(cancelled.cancelled())
+            self.assertEqual(scheduler.stats()["requests"], 1)
+        finally:
+            scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()